@@ -0,0 +1,151 @@
+"""
+Compare parsing BLS API responses one series at a time (how
+``BLSData.get`` used to do it) against the vectorized
+`qeds.data.bls.core._parse_response`, and building the wide DataFrame
+of ``BLSData.get(..., wide=True)`` by pivoting the long one against
+`qeds.data.bls.core._parse_wide`.
+
+The input is the JSON response to a query for 50 series over 20 years,
+the most one request can return. Pass ``--record responses.json`` once
+(with a BLS API key configured) to save real responses for the
+unemployment rate and labor force of 25 states; later runs can replay them
+with ``--responses responses.json``. Without either option a response of
+the same shape is generated.
+
+Usage::
+
+    python benchmarks/bench_bls_parse.py --responses responses.json \
+        --repeat 20
+"""
+import argparse
+import json
+import time
+
+import numpy as np
+import pandas as pd
+
+from qeds.data.bls import core
+
+STARTYEAR, ENDYEAR = 1998, 2017
+
+
+def _series_ids():
+    return [
+        "LASST{:02d}000000000000{}".format(fips, measure)
+        for fips in range(1, 26) for measure in [3, 6]
+    ]
+
+
+def _record(fn):
+    # always with the catalog, even for series with a saved title
+    chunks = core._grid(_series_ids(), STARTYEAR, ENDYEAR)
+    grid = [(chunk, start, end, True) for (chunk, start, end) in chunks]
+    payloads = core.BLSData()._get_grid(grid)
+    with open(fn, "w") as f:
+        json.dump(payloads, f)
+    return payloads
+
+
+def _generate():
+    series = []
+    for sid in _series_ids():
+        data = [
+            dict(year=str(year), period="M{:02d}".format(month),
+                 periodName="", value="{}.{}".format(month, year % 10),
+                 footnotes=[{}])
+            for year in range(ENDYEAR, STARTYEAR - 1, -1)
+            for month in range(12, 0, -1)
+        ]
+        catalog = dict(series_title="Series {}".format(sid))
+        series.append(dict(seriesID=sid, catalog=catalog, data=data))
+    return [dict(status="REQUEST_SUCCEEDED", Results=dict(series=series))]
+
+
+def per_series(payloads, nice_names):
+    dfs = []
+    for data in payloads:
+        for series in data["Results"]["series"]:
+            df = pd.DataFrame(
+                series["data"], columns=["value", "year", "period"]
+            )
+            if df.shape[0] == 0:
+                continue
+            df["Date"] = pd.to_datetime(
+                df["year"] + df["period"], format="%YM%m"
+            )
+            df.drop(["year", "period"], axis=1, inplace=True)
+            if nice_names:
+                df["variable"] = series["catalog"]["series_title"]
+            else:
+                df["variable"] = series["seriesID"]
+            try:
+                df["value"] = df["value"].astype(float)
+            except ValueError:
+                pass
+            dfs.append(df)
+
+    return pd.concat(dfs, ignore_index=True)
+
+
+def pivot(payloads, nice_names):
+    df = core._parse_response(payloads, nice_names)
+    return df.set_index(["Date", "variable"]).unstack()["value"]
+
+
+def _best(func, payloads, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(payloads, True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--responses", help="replay responses saved here")
+    parser.add_argument("--record", help="save real responses here")
+    parser.add_argument("--repeat", type=int, default=20)
+    args = parser.parse_args()
+
+    if args.record:
+        payloads = _record(args.record)
+    elif args.responses:
+        with open(args.responses) as f:
+            payloads = json.load(f)
+    else:
+        payloads = _generate()
+
+    # monthly series only, which both parsers read the same way
+    pd.testing.assert_frame_equal(
+        per_series(payloads, True), core._parse_response(payloads, True)
+    )
+
+    t_series = _best(per_series, payloads, args.repeat)
+    t_vector = _best(core._parse_response, payloads, args.repeat)
+    nrows = core._parse_response(payloads, True).shape[0]
+    print("{} rows".format(nrows))
+    print("{:>10} {:>10}".format("method", "seconds"))
+    print("{:>10} {:>10.4f}".format("per series", t_series))
+    print("{:>10} {:>10.4f}".format("vectorized", t_vector))
+    print("speedup  {:.1f}x".format(t_series / t_vector))
+
+    pd.testing.assert_frame_equal(
+        pivot(payloads, True), core._parse_wide(payloads, True)
+    )
+    t_pivot = _best(pivot, payloads, args.repeat)
+    t_wide = _best(core._parse_wide, payloads, args.repeat)
+    print()
+    print("{:>10} {:>10}".format("wide", "seconds"))
+    print("{:>10} {:>10.4f}".format("pivot", t_pivot))
+    print("{:>10} {:>10.4f}".format("direct", t_wide))
+    print("speedup  {:.1f}x".format(t_pivot / t_wide))
+    wide = core._parse_wide(payloads, True)
+    small = core._parse_wide(payloads, True, np.float32)
+    print("float32 uses {} of {} bytes".format(
+        small.memory_usage().sum(), wide.memory_usage().sum()
+    ))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Report the size of the saved file and the read throughput of every
+combination of file format and ``options.compression`` codec.
+
+Each dataset is loaded as usual (downloading it if it isn't saved yet),
+copied into a temporary data directory under every format and codec, and
+loaded back ``--repeat`` times. Throughput is the in-memory size of the
+DataFrame divided by the best load time. Files are read from the
+operating system's page cache after the first load, so run this on the
+shared data directory's file system (``--dir``) to see the effect of
+smaller files on I/O-bound reads.
+
+Usage::
+
+    python benchmarks/bench_compression.py goodreads_ratings \
+        airline_performance_dec16 --repeat 3
+"""
+import argparse
+import time
+
+import qeds
+from common import (
+    file_bytes, register, temporary_data_dir, temporary_options
+)
+
+MB = 1024 ** 2
+
+FORMATS = ["csv", "pkl", "feather", "parquet"]
+CODECS = ["none", "gzip", "lz4", "zstd"]
+
+
+def _best_load_time(name, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        qeds.data.load(name)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "datasets", nargs="*",
+        default=["goodreads_ratings", "airline_performance_dec16"]
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--dir", default=None,
+        help="parent of the temporary data directory"
+    )
+    args = parser.parse_args()
+
+    header = "{:>28} {:>8} {:>6} {:>10} {:>7} {:>9} {:>9}"
+    row = "{:>28} {:>8} {:>6} {:>10.1f} {:>7.2f} {:>9.3f} {:>9.1f}"
+    print(header.format(
+        "dataset", "format", "codec", "file MB", "ratio", "load s", "MB/s"
+    ))
+    for name in args.datasets:
+        df = qeds.data.load(name)
+        # without the source checksum every format and codec is written,
+        # and without the ttl no load triggers a refresh
+        meta = dict(qeds.data.loader._get_metadata(name))
+        for key in ["schema", "source", "ttl", "retrieved"]:
+            meta.pop(key, None)
+        size = df.memory_usage(deep=True).sum()
+
+        bench_name = "bench_" + name
+        register(bench_name, lambda: df, meta)
+        with temporary_data_dir(parent=args.dir):
+            for file_format in FORMATS:
+                for codec in CODECS:
+                    if file_format == "feather" and codec == "gzip":
+                        continue
+                    with temporary_options(
+                            options__file_format=file_format,
+                            options__compression=codec
+                    ):
+                        qeds.data.retrieve(bench_name)
+                        nbytes = file_bytes(
+                            qeds.data.loader._saved_path(bench_name)
+                        )
+                        seconds = _best_load_time(bench_name, args.repeat)
+                    print(row.format(
+                        name, file_format, codec, nbytes / MB, size / nbytes,
+                        seconds, size / MB / seconds
+                    ))
+
+
+if __name__ == "__main__":
+    main()
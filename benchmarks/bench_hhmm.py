@@ -0,0 +1,82 @@
+"""
+Compare building datetimes from HHMM time-of-day columns with string
+concatenation and ``pd.to_datetime`` (how ``_get_airline_data`` used to do
+it) against the numeric `qeds.data.util.hhmm_to_datetime`.
+
+The input mimics a month of the airline data: ``--rows`` flights over 31
+days, with scheduled times as integers and actual times as floats with
+about 2% missing (cancelled flights).
+
+Usage::
+
+    python benchmarks/bench_hhmm.py --rows 500000 --repeat 5
+"""
+import argparse
+import time
+
+import numpy as np
+import pandas as pd
+
+from qeds.data.util import hhmm_to_datetime
+
+
+def _flights(nrows):
+    rng = np.random.RandomState(42)
+    hhmm = rng.randint(0, 24, nrows) * 100 + rng.randint(0, 60, nrows)
+    actual = hhmm.astype(float)
+    actual[rng.rand(nrows) < 0.02] = np.nan
+    return pd.DataFrame({
+        "Date": pd.Timestamp("2016-12-01") + pd.to_timedelta(
+            rng.randint(0, 31, nrows), unit="D"
+        ),
+        "CRSDepTime": hhmm,
+        "DepTime": actual,
+    })
+
+
+def strings(df):
+    t_string = df["CRSDepTime"].astype(str).str.zfill(4)
+    dt_string = df["Date"].astype(str) + t_string
+    scheduled = pd.to_datetime(dt_string, format="%Y-%m-%d%H%M")
+
+    t_string = df["DepTime"].astype(str).str[:-2].str.zfill(4)
+    dt_string = df["Date"].astype(str) + t_string
+    actual = pd.to_datetime(dt_string, format="%Y-%m-%d%H%M", errors="coerce")
+    return scheduled, actual
+
+
+def numeric(df):
+    scheduled = hhmm_to_datetime(df["Date"], df["CRSDepTime"])
+    actual = hhmm_to_datetime(df["Date"], df["DepTime"])
+    return scheduled, actual
+
+
+def _best(func, df, repeat):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=500000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    df = _flights(args.rows)
+    for (want, have) in zip(strings(df), numeric(df)):
+        pd.testing.assert_series_equal(want, have, check_names=False)
+
+    t_strings = _best(strings, df, args.repeat)
+    t_numeric = _best(numeric, df, args.repeat)
+    print("{:>8} {:>10}".format("method", "seconds"))
+    print("{:>8} {:>10.4f}".format("strings", t_strings))
+    print("{:>8} {:>10.4f}".format("numeric", t_numeric))
+    print("speedup  {:.1f}x".format(t_strings / t_numeric))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,85 @@
+"""
+Measure the cold-start cost of ``import qeds`` against ``import pandas``.
+
+Each import is timed in a fresh interpreter ``--repeat`` times and the
+median wall clock time is reported, along with the slowest modules that
+``import qeds`` pulls in on top of pandas (from ``python -X importtime``).
+
+Usage::
+
+    python benchmarks/bench_import.py --repeat 10
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _env():
+    env = dict(os.environ)
+    env["PYTHONPATH"] = os.pathsep.join(
+        [ROOT] + [p for p in [env.get("PYTHONPATH")] if p]
+    )
+    return env
+
+
+def time_import(module, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call(
+            [sys.executable, "-c", "import " + module], env=_env()
+        )
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def slowest_modules(n):
+    """
+    Return the ``n`` modules with the largest self import time that are
+    imported by ``import qeds`` but not by ``import pandas``
+    """
+    def _importtime(module):
+        out = subprocess.run(
+            [sys.executable, "-X", "importtime", "-c", "import " + module],
+            env=_env(), stderr=subprocess.PIPE, universal_newlines=True
+        ).stderr
+        rows = {}
+        for line in out.splitlines():
+            if not line.startswith("import time:") or "self" in line:
+                continue
+            self_us, _, name = line[len("import time:"):].split("|")
+            rows[name.strip()] = int(self_us)
+        return rows
+
+    pandas_mods = _importtime("pandas")
+    extra = {
+        k: v for (k, v) in _importtime("qeds").items()
+        if k not in pandas_mods
+    }
+    return sorted(extra.items(), key=lambda kv: -kv[1])[:n]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--repeat", type=int, default=10)
+    parser.add_argument("--top", type=int, default=10)
+    args = parser.parse_args()
+
+    base = time_import("pandas", args.repeat)
+    full = time_import("qeds", args.repeat)
+    print("import pandas: {:8.1f} ms".format(base * 1000))
+    print("import qeds:   {:8.1f} ms (+{:.1f} ms)".format(
+        full * 1000, (full - base) * 1000
+    ))
+    print("\nslowest modules imported by qeds but not pandas (self time):")
+    for (name, us) in slowest_modules(args.top):
+        print("  {:8.2f} ms  {}".format(us / 1000, name))
+
+
+if __name__ == "__main__":
+    main()
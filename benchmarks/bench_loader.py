@@ -0,0 +1,219 @@
+"""
+Time and memory-profile `retrieve` (write) and `load` (read) for every
+file format, offline.
+
+The datasets are the bundled ``test`` dataset and ``shopify`` orders
+simulated with `qeds.data.shopify.simulate_orders` for each ``--sizes``
+value of N. For each format and dataset the suite measures:
+
+- ``write``: `retrieve`, which computes the schema and saves the file
+- ``load`` with each access pattern:
+
+  - ``cold``: the saved file is evicted from the operating system's page
+    cache before each read (best effort, see ``common.evict``)
+  - ``warm``: the file is in the page cache, the in-process cache is off
+  - ``cached``: served from the in-process cache (``options.cache_size``)
+
+  each for the full dataset and for the ``--columns`` subset.
+
+Every measurement is repeated ``--repeat`` times and reports the minimum
+and median time, the peak memory of the call and the size of the saved
+file. The peak is the larger of what ``tracemalloc`` sees (Python and
+numpy) and the growth of the resident memory, which also covers pyarrow's
+memory pool. Results
+are printed as a table and written as JSON to ``--output``, together
+with the versions of qeds and its dependencies, so runs can be compared
+between releases.
+
+Usage::
+
+    python benchmarks/bench_loader.py --sizes 10000 100000 \
+        --output loader.json
+"""
+import argparse
+import datetime
+import json
+import platform
+import random
+import statistics
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pyarrow
+
+import qeds
+from common import (
+    evict, file_bytes, peak_rss, register, temporary_data_dir,
+    temporary_options
+)
+
+FORMATS = ["csv", "pkl", "feather", "parquet"]
+PATTERNS = ["cold", "warm", "cached"]
+
+# simulated orders end on a fixed date and use a fixed seed so the data is
+# reproducible
+END_DATE = "2018-12-31"
+SEED = 12345
+
+# room for every dataset in the in-process cache
+CACHE_SIZE = 2 ** 40
+
+
+def _measure(func, repeat, before=None):
+    """
+    Time ``repeat`` calls of ``func``, calling ``before`` (untimed) ahead
+    of each, then make one more call under ``tracemalloc`` and another
+    while sampling the resident memory to find the peak memory it
+    allocates. Tracing slows allocations down (and takes memory of its
+    own), so it is kept out of the timed and sampled calls
+    """
+    times = []
+    for _ in range(repeat):
+        if before is not None:
+            before()
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+
+    if before is not None:
+        before()
+    tracemalloc.start()
+    try:
+        func()
+        traced = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    if before is not None:
+        before()
+    with peak_rss() as resident:
+        func()
+
+    return dict(
+        seconds_min=min(times),
+        seconds_median=statistics.median(times),
+        peak_bytes=max(traced, resident["bytes"]),
+        traced_peak_bytes=traced,
+        rss_peak_bytes=resident["bytes"],
+    )
+
+
+def _datasets(sizes):
+    # name and frame of each dataset. The frames are simulated up front so
+    # `retrieve` only measures writing them
+    spec = qeds.data.registry.get_spec("test")
+    out = [("test", qeds.data.registry.get_retriever(spec)()[0])]
+    for n in sizes:
+        # `simulate_orders` draws from both random and np.random
+        random.seed(SEED)
+        np.random.seed(SEED)
+        df = qeds.data.shopify.simulate_orders(n, end_date=END_DATE)
+        name = "bench_orders_{}".format(n)
+        register(name, lambda df=df: df)
+        out.append((name, df))
+    return out
+
+
+def _subset(df, columns):
+    return [c for c in columns if c in df.columns] or list(df.columns[:1])
+
+
+def run(sizes, formats, repeat, columns):
+    results = []
+    datasets = _datasets(sizes)
+    for file_format in formats:
+        with temporary_data_dir(options__file_format=file_format):
+            for (name, df) in datasets:
+                fn = qeds.data.loader._cache_path(name)
+                base = dict(
+                    dataset=name, rows=int(df.shape[0]), format=file_format
+                )
+
+                def _retrieve():
+                    qeds.data.retrieve(name)
+
+                stats = _measure(_retrieve, repeat)
+                size = file_bytes(fn)
+                results.append(dict(
+                    base, op="write", pattern=None, columns=None,
+                    file_bytes=size, **stats
+                ))
+
+                for pattern in PATTERNS:
+                    cache_size = CACHE_SIZE if pattern == "cached" else 0
+                    before = None
+                    if pattern == "cold":
+                        before = lambda: evict(fn)  # noqa: E731
+                    for cols in [None, _subset(df, columns)]:
+                        def _load():
+                            qeds.data.load(name, columns=cols)
+
+                        with temporary_options(
+                                options__cache_size=cache_size
+                        ):
+                            qeds.data.clear_cache()
+                            if pattern == "cached":
+                                _load()
+                            stats = _measure(_load, repeat, before)
+                        results.append(dict(
+                            base, op="load", pattern=pattern, columns=cols,
+                            file_bytes=size, **stats
+                        ))
+
+    return results
+
+
+def _environment():
+    return dict(
+        qeds=qeds.__version__,
+        pandas=pd.__version__,
+        pyarrow=pyarrow.__version__,
+        python=sys.version.split()[0],
+        platform=platform.platform(),
+        date=datetime.datetime.now().isoformat(),
+    )
+
+
+def _print(results):
+    header = "{:>22} {:>8} {:>8} {:>6} {:>7} {:>9} {:>9} {:>9} {:>9}"
+    row = "{:>22} {:>8} {:>8} {:>6} {:>7} {:>9.4f} {:>9.4f} {:>9.1f} {:>9.1f}"
+    print(header.format(
+        "dataset", "format", "op", "access", "columns", "min s", "median s",
+        "peak MB", "file MB"
+    ))
+    for r in results:
+        print(row.format(
+            r["dataset"], r["format"], r["op"], r["pattern"] or "-",
+            "all" if r["columns"] is None else len(r["columns"]),
+            r["seconds_min"], r["seconds_median"], r["peak_bytes"] / 1e6,
+            r["file_bytes"] / 1e6
+        ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument(
+        "--sizes", type=int, nargs="*", default=[10000, 100000, 1000000]
+    )
+    parser.add_argument("--formats", nargs="*", default=FORMATS)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--columns", nargs="*", default=["Day", "Customer ID", "total_sales"],
+        help="columns read by the subset loads"
+    )
+    parser.add_argument("--output", default="bench_loader.json")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.formats, args.repeat, args.columns)
+    _print(results)
+    with open(args.output, "w") as f:
+        json.dump(dict(
+            environment=_environment(), args=vars(args), results=results
+        ), f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Compare the memory used by worker processes that load the same feather
+cache with and without ``memory_map``.
+
+For each mode, ``--workers`` processes load a synthetic copy of the
+``goodreads_ratings`` dataset (``--rows`` rows of ``user_id``, ``book_id``
+and ``rating``) and report their resident (RSS) and shared memory before
+loading, after loading and after summing one column. With memory mapping
+the pages of the file are shared, so RSS only grows by the pages that are
+actually touched, and those pages are counted once for all workers by
+the operating system.
+
+Usage::
+
+    python benchmarks/bench_mmap.py --rows 6000000 --workers 4
+"""
+import argparse
+import multiprocessing
+
+import numpy as np
+import pandas as pd
+
+import qeds
+from common import register, rss, temporary_data_dir
+
+MB = 1024 ** 2
+
+
+def _ratings(nrows):
+    rng = np.random.RandomState(42)
+    return pd.DataFrame({
+        "user_id": rng.randint(1, 53425, nrows),
+        "book_id": rng.randint(1, 10001, nrows),
+        "rating": rng.randint(1, 6, nrows),
+    })
+
+
+def _worker(memory_map, queue):
+    before, _ = rss()
+    df = qeds.data.load("bench_ratings", memory_map=memory_map)
+    loaded, loaded_shared = rss()
+    df["rating"].sum()
+    touched, touched_shared = rss()
+    queue.put(dict(
+        before=before, loaded=loaded, loaded_shared=loaded_shared,
+        touched=touched, touched_shared=touched_shared,
+    ))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[1])
+    parser.add_argument("--rows", type=int, default=6000000)
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
+
+    register("bench_ratings", lambda: _ratings(args.rows))
+    ctx = multiprocessing.get_context("fork")
+
+    with temporary_data_dir(options__file_format="feather"):
+        qeds.data.retrieve("bench_ratings")
+
+        header = "{:>8} {:>6} {:>10} {:>10} {:>10} {:>10} {:>10}"
+        row = "{:>8} {:>6} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f} {:>10.1f}"
+        print(header.format(
+            "mode", "worker", "rss0 MB", "rss1 MB", "shared1", "rss2 MB",
+            "shared2"
+        ))
+        for memory_map in [False, True]:
+            queue = ctx.Queue()
+            procs = [
+                ctx.Process(target=_worker, args=(memory_map, queue))
+                for _ in range(args.workers)
+            ]
+            for p in procs:
+                p.start()
+            results = [queue.get() for _ in procs]
+            for p in procs:
+                p.join()
+
+            mode = "mmap" if memory_map else "copy"
+            for (i, r) in enumerate(results):
+                print(row.format(
+                    mode, i, r["before"] / MB, r["loaded"] / MB,
+                    r["loaded_shared"] / MB, r["touched"] / MB,
+                    r["touched_shared"] / MB
+                ))
+
+
+if __name__ == "__main__":
+    main()
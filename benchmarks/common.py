@@ -0,0 +1,151 @@
+"""
+Helpers shared by the qeds benchmark scripts.
+
+The benchmarks never touch the user's config file or data directory: all
+options are changed with ``write=False`` and data is written to a
+temporary directory.
+"""
+import contextlib
+import os
+import resource
+import shutil
+import tempfile
+import threading
+
+from qeds.data import options, registry
+
+
+def rss():
+    """
+    Return the resident and shared memory of this process in bytes.
+
+    On Linux these are the current values from ``/proc/self/statm``.
+    Elsewhere the resident size is the peak reported by ``getrusage`` and
+    the shared size is reported as 0.
+    """
+    try:
+        with open("/proc/self/statm") as f:
+            fields = f.read().split()
+        page = os.sysconf("SC_PAGE_SIZE")
+        return int(fields[1]) * page, int(fields[2]) * page
+    except OSError:
+        maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return maxrss * 1024, 0
+
+
+@contextlib.contextmanager
+def peak_rss(interval=0.001):
+    """
+    Track how much the resident memory of this process grows while the
+    block runs, sampling `rss` every ``interval`` seconds in a thread.
+    Yields a dict whose ``bytes`` entry holds the largest growth once the
+    block exits. Unlike ``tracemalloc`` this sees memory allocated outside
+    of Python and numpy, such as pyarrow's memory pool
+    """
+    start = rss()[0]
+    out = dict(bytes=0)
+    done = threading.Event()
+
+    def _sample():
+        peak = start
+        while not done.wait(interval):
+            peak = max(peak, rss()[0])
+        peak = max(peak, rss()[0])
+        out["bytes"] = max(peak - start, 0)
+
+    thread = threading.Thread(target=_sample)
+    thread.start()
+    try:
+        yield out
+    finally:
+        done.set()
+        thread.join()
+
+
+@contextlib.contextmanager
+def temporary_options(**kwargs):
+    """
+    Temporarily set config options. Keys use ``section__name`` in place of
+    ``section.name``, e.g. ``temporary_options(options__file_format="csv")``
+    """
+    old = {}
+    for (key, val) in kwargs.items():
+        section, name = key.split("__")
+        old[(section, name)] = options[section + "." + name]
+        options.set_config(section, name, val, write=False)
+    try:
+        yield
+    finally:
+        for ((section, name), val) in old.items():
+            options.set_config(section, name, val, write=False)
+
+
+@contextlib.contextmanager
+def temporary_data_dir(parent=None, **kwargs):
+    """
+    Point ``PATHS.data`` at a new temporary directory inside ``parent``
+    (the system's temporary directory by default), plus any other options
+    in ``kwargs``, and remove the directory afterwards
+    """
+    data_dir = tempfile.mkdtemp(prefix="qeds-bench-", dir=parent)
+    try:
+        with temporary_options(PATHS__data=data_dir, **kwargs):
+            yield data_dir
+    finally:
+        shutil.rmtree(data_dir, ignore_errors=True)
+
+
+def file_bytes(path):
+    """
+    Return the size of the file ``path``, or the total size of the files
+    under the directory ``path`` (datasets saved in partitions)
+    """
+    if not os.path.isdir(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, fn))
+        for (root, _, names) in os.walk(path) for fn in names
+    )
+
+
+def evict(path):
+    """
+    Ask the operating system to drop the pages of the file ``path`` (or of
+    every file in the directory ``path``) from its page cache, so the next
+    read comes from disk. This is best effort: it needs
+    ``os.posix_fadvise`` and only drops pages that are not dirty or in use.
+    Returns whether the request could be made
+    """
+    if not hasattr(os, "posix_fadvise"):
+        return False
+
+    if os.path.isdir(path):
+        files = [
+            os.path.join(root, fn)
+            for (root, _, names) in os.walk(path) for fn in names
+        ]
+    else:
+        files = [path]
+    for fn in files:
+        fd = os.open(fn, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+            os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_DONTNEED)
+        finally:
+            os.close(fd)
+    return True
+
+
+def register(name, frame_func, meta=None):
+    """
+    Make a synthetic dataset available to `qeds.data.retrieve` under
+    ``name``. ``frame_func`` is called without arguments and must return
+    a DataFrame
+    """
+    def _retrieve():
+        return frame_func(), dict(meta or dict(index=[]))
+
+    registry.register(
+        registry.DatasetSpec(name, _retrieve, "benchmark dataset"),
+        replace=True
+    )
@@ -1,7 +1,28 @@
 # flake8: noqa
+import importlib
 
 from . import data
-from . import themes
-from .data import *
+from .data import (
+    config, loader, options, load, retrieve, refresh, available, prefetch,
+    cache_info, clear_cache, memory_report
+)
 
 from .version import __version__
+
+# imported the first time they are accessed, so `import qeds` stays cheap
+_LAZY_MODULES = {
+    "themes": ".themes",
+    "shopify": ".data.shopify",
+    "retrievers": ".data.retrievers",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module(_LAZY_MODULES[name], __name__)
+    msg = "module {!r} has no attribute {!r}"
+    raise AttributeError(msg.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES))
@@ -1,17 +1,48 @@
+import importlib
+
 from . import config
-from . import shopify
 from . import loader
-from . import retrievers
+from . import compact
+from . import registry
 
-from .config import options
-from .loader import load, retrieve, available
+# These only register their config validators. The API clients themselves
+# are imported on first use, see `__getattr__`
+from . import bls, socrata, uscensus
 
-from .bls import *  # noqa: F403,F401
-from .socrata import *  # noqa: F403,F401
-from .uscensus import *  # noqa: F403,F401
+from .config import options
+from .loader import (
+    load, retrieve, refresh, available, prefetch, cache_info, clear_cache,
+    memory_report
+)
 
 
 __all__ = [
-    "config", "shopify", "loader", "retrievers", "options", "load",
-    "retrieve", "available"
+    "config", "compact", "shopify", "loader", "registry", "retrievers",
+    "options", "load", "retrieve", "refresh", "available", "prefetch",
+    "cache_info", "clear_cache", "memory_report"
 ]
+
+# submodules and client classes that are imported the first time they are
+# accessed, so `import qeds` stays cheap
+_LAZY_MODULES = ["shopify", "retrievers"]
+_LAZY_CLIENTS = {
+    "BLSData": "bls",
+    "BLSFlatFiles": "bls",
+    "SocrataData": "socrata",
+    "CensusData": "uscensus",
+    "CountyBusinessPatterns": "uscensus",
+    "ZipBusinessPatterns": "uscensus",
+}
+
+
+def __getattr__(name):
+    if name in _LAZY_MODULES:
+        return importlib.import_module("." + name, __name__)
+    if name in _LAZY_CLIENTS:
+        return getattr(globals()[_LAZY_CLIENTS[name]], name)
+    msg = "module {!r} has no attribute {!r}"
+    raise AttributeError(msg.format(__name__, name))
+
+
+def __dir__():
+    return sorted(set(globals()) | set(_LAZY_MODULES) | set(_LAZY_CLIENTS))
@@ -1,3 +1,15 @@
-from .core import BLSData
+from . import util
 
-__all__ = ["BLSData"]
+__all__ = ["BLSData", "RequestPlan", "BLSFlatFiles"]
+
+
+def __getattr__(name):
+    # The client (and with it requests) is only imported once it is used
+    if name == "BLSFlatFiles":
+        from . import flatfiles
+        return flatfiles.BLSFlatFiles
+    if name in __all__:
+        from . import core
+        return getattr(core, name)
+    msg = "module {!r} has no attribute {!r}"
+    raise AttributeError(msg.format(__name__, name))
@@ -0,0 +1,99 @@
+"""
+On-disk cache of the observations returned by the BLS API.
+
+Observations are stored per series and year, so a query that overlaps
+earlier ones only requests the series and years that aren't saved yet.
+Years that BLS may still revise (see the ``bls.revision_window``
+configuration option) expire after ``bls.cache_expiry`` seconds; older
+years are kept until the cache is cleared. The titles of the series are
+kept in `qeds.data.bls.catalog`.
+"""
+import json
+import os
+import time
+
+from ..sqlite import SQLiteStore, per_directory, transaction
+from .util import split_response
+
+
+class ResponseCache(SQLiteStore):
+    """
+    Observations of BLS series backed by SQLite
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database. It is created if it doesn't exist
+    """
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS observations (
+        series TEXT NOT NULL,
+        year INTEGER NOT NULL,
+        data TEXT NOT NULL,
+        fetched REAL NOT NULL,
+        PRIMARY KEY (series, year)
+    )
+    """
+
+    def get(self, series, startyear, endyear, recent=None, max_age=None):
+        """
+        Return the saved observations of ``series`` from ``startyear`` to
+        ``endyear`` as a dict mapping ``(series, year)`` to the list of
+        observations of that year, in the order the API returned them
+
+        Observations of years from ``recent`` on that were fetched more
+        than ``max_age`` seconds ago are left out
+        """
+        oldest = 0 if max_age is None else time.time() - max_age
+        rows = self._select_in(
+            "SELECT series, year, data, fetched FROM observations "
+            "WHERE year BETWEEN ? AND ? AND series IN ({})",
+            series, [startyear, endyear]
+        )
+        out = {}
+        for (s, year, data, fetched) in rows:
+            if recent is not None and year >= recent and fetched < oldest:
+                continue
+            out[(s, year)] = json.loads(data)
+
+        return out
+
+    def put(self, payload, startyear, endyear):
+        """
+        Save the observations in the JSON ``payload`` of a response to a
+        request for ``startyear`` to ``endyear``. Requested years without
+        observations are saved as empty, so they aren't requested again
+        """
+        now = time.time()
+        observations, _ = split_response(payload, startyear, endyear)
+        observations = [
+            (sid, year, json.dumps(rows), now)
+            for ((sid, year), rows) in observations.items()
+        ]
+
+        conn = self._connect()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO observations VALUES (?, ?, ?, ?)",
+                observations
+            )
+
+    def clear(self):
+        """
+        Remove every saved observation
+        """
+        conn = self._connect()
+        with transaction(conn):
+            conn.execute("DELETE FROM observations")
+
+
+_get_cache = per_directory(
+    lambda data_dir: ResponseCache(os.path.join(data_dir, "bls.sqlite"))
+)
+
+
+def get_cache(data_dir):
+    """
+    Return the `ResponseCache` for the cache directory ``data_dir``
+    """
+    return _get_cache(data_dir)
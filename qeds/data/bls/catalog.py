@@ -0,0 +1,89 @@
+"""
+Local copy of the catalog entries (title, survey, area, ...) of the BLS
+series that have been requested.
+
+Catalog entries don't change, so each series' entry is only requested the
+first time the series is requested with ``nice_names=True``. Later requests
+leave the catalog out of the response and take the titles from here.
+"""
+import json
+import os
+
+from ..sqlite import SQLiteStore, per_directory, transaction
+
+
+class SeriesCatalog(SQLiteStore):
+    """
+    Catalog entries of BLS series backed by SQLite. They are kept in the
+    same database as the observations of
+    `qeds.data.bls.cache.ResponseCache`, through the same connections
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database. It is created if it doesn't exist
+    """
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS catalog (
+        series TEXT PRIMARY KEY,
+        title TEXT,
+        entry TEXT NOT NULL
+    )
+    """
+
+    def _select(self, column, series):
+        return self._select_in(
+            "SELECT series, " + column + " FROM catalog "
+            "WHERE series IN ({})",
+            series
+        )
+
+    def titles(self, series):
+        """
+        Return a dict mapping each of ``series`` that has a saved title
+        to that title
+        """
+        return {
+            s: title for (s, title) in self._select("title", series)
+            if title is not None
+        }
+
+    def get(self, series):
+        """
+        Return a dict mapping each of ``series`` that has a saved catalog
+        entry to that entry
+        """
+        return {
+            s: json.loads(entry)
+            for (s, entry) in self._select("entry", series)
+        }
+
+    def put(self, payload):
+        """
+        Save the catalog entries in the JSON ``payload`` of a response
+        """
+        entries = [
+            (s["seriesID"], s["catalog"].get("series_title"),
+             json.dumps(s["catalog"]))
+            for s in payload["Results"]["series"] if s.get("catalog")
+        ]
+        if len(entries) == 0:
+            return
+
+        conn = self._connect()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR REPLACE INTO catalog VALUES (?, ?, ?)", entries
+            )
+
+
+_get_catalog = per_directory(
+    lambda data_dir: SeriesCatalog(os.path.join(data_dir, "bls.sqlite"))
+)
+
+
+def get_catalog(data_dir):
+    """
+    Return the `SeriesCatalog` for the cache directory ``data_dir``
+    """
+    return _get_catalog(data_dir)
@@ -1,17 +1,29 @@
+import collections
+import concurrent.futures
 import datetime
 import os
 
+import numpy as np
 import pandas as pd
 import requests
 from requests.adapters import HTTPAdapter
 
-from ..config import options, setup_logger
-from ..util import _make_list, QueryError, iter_chunks
+from ..config import options, setup_logger, _as_bool
+from ..util import _make_list, QueryError, RateLimiter, iter_chunks
 
-from .util import LIMITS, BLS_STATUS_CODE_REASONS
+from .cache import get_cache
+from .catalog import get_catalog
+from .quota import get_tracker
+from .util import LIMITS, BLS_STATUS_CODE_REASONS, split_response
 
 LOGGER = setup_logger(__name__)
 
+# the API limits the rate of requests from each computer, so every client
+# in the process shares one limiter
+_RATE_LIMITER = RateLimiter(
+    LIMITS["requests_per_window"], LIMITS["window_seconds"]
+)
+
 
 class BLSData(object):
     def __init__(self, url=None, key=None):
@@ -68,11 +80,15 @@ class BLSData(object):
         self.url = url
         self.headers = {"Content-Type": "application/json"}
 
+        # enough pooled connections for the concurrent requests of `get`
+        pool_size = max(10, int(options["bls.concurrency"]))
         self.sess = requests.Session()
-        self.sess.mount(self.url, HTTPAdapter(max_retries=3))
+        self.sess.mount(
+            self.url, HTTPAdapter(max_retries=3, pool_maxsize=pool_size)
+        )
 
     def get(self, series, startyear=None, endyear=None, nice_names=True,
-            wide=False):
+            wide=False, float32=False):
         """
         Get requested ``series`` from ``startyear`` to ``endyear`` as a
         pandas DataFrame
@@ -98,54 +114,119 @@ class BLSData(object):
 
         wide: bool, optional(default=False)
             Toggles the return of a wide DataFrame with the index being the
-            date and one variable per column
+            date and one variable per column. Values that aren't numbers
+            are missing in the wide DataFrame
+
+        float32: bool, optional(default=False)
+            Store the values of the wide DataFrame as float32, which halves
+            its memory. Ignored if ``wide`` is False
 
         Returns
         -------
         df : pandas.DataFrame
             A pandas DataFrame contianing the requested series
 
+        Notes
+        -----
+        The API returns at most 20 years of 50 series per request, so
+        larger queries are split into a grid of requests. Up to
+        ``bls.concurrency`` of them are sent at the same time, without
+        exceeding the API's rate limit, and the results are combined in
+        the order of the grid.
+
+        With ``nice_names=True`` the titles are only requested for series
+        that haven't been requested with ``nice_names=True`` before; the
+        titles of the others are saved on your computer (see
+        `qeds.data.bls.catalog`).
+
+        If the ``bls.cache`` configuration option is True, the
+        observations are saved on your computer (see
+        `qeds.data.bls.cache`) and only the series and years that aren't
+        saved yet are requested.
+
+        To combine several queries into as few requests as possible, see
+        `BLSData.plan`.
+
         """
+        plan = self.plan(nice_names)
+        plan.add(series, startyear, endyear)
+        return plan.run(wide, float32)[0]
 
-        series = _make_list(series)
-        nyear = LIMITS["years_per_query"]
-        nseries = LIMITS["series_per_query"]
+    def plan(self, nice_names=True):
+        """
+        Start a `RequestPlan` that combines several queries
 
-        if endyear is None:
-            endyear = datetime.datetime.now().year
-        if startyear is None:
-            startyear = endyear - (nyear - 1)
+        Parameters
+        ----------
+        nice_names : bool, optional(default=True)
+            See `BLSData.get`
 
-        # Chunk on years if user asked for more than 20 years
-        if endyear - startyear > (nyear - 1):
-            to_cat = []
-            years = range(startyear, endyear + 1)
-            for year_chunks in iter_chunks(years, nyear):
-                df = self.get(
-                    series, year_chunks[0], year_chunks[-1], nice_names, wide
-                )
-                to_cat.append(df)
-
-            return pd.concat(to_cat, ignore_index=True)
-
-        # Chunk on series if user asked for more than 50 series
-        if len(series) > nseries:
-            to_cat = []
-            for series_chunk in iter_chunks(series, nseries):
-                df = self.get(
-                    series_chunk, startyear, endyear, nice_names, wide
-                )
-                to_cat.append(df)
-
-            return pd.concat(to_cat, ignore_index=True)
+        Returns
+        -------
+        plan : RequestPlan
+            Add queries with `RequestPlan.add`, check the requests they
+            need with `RequestPlan.summary` and get the data with
+            `RequestPlan.run`
 
+        """
+        return RequestPlan(self, nice_names)
+
+    def quota(self):
+        """
+        Report the number of requests made today with this client's key
+
+        Returns
+        -------
+        quota : dict
+            The number of requests ``used`` today by every process on this
+            computer, the daily ``limit`` (the ``bls.daily_limit``
+            configuration option) and the number ``remaining``
+
+        """
+        used = get_tracker(options["PATHS.base"]).used(self.key)
+        limit = int(options["bls.daily_limit"])
+        return dict(used=used, limit=limit, remaining=max(limit - used, 0))
+
+    def _get_grid(self, grid):
+        """
+        Make the request for each ``(series, startyear, endyear, catalog)``
+        item of ``grid``, up to ``bls.concurrency`` at a time, and return
+        their responses in the order of ``grid``
+        """
+        workers = min(int(options["bls.concurrency"]), len(grid))
+
+        def _get(item):
+            return self._get_chunk(*item)
+
+        if workers <= 1:
+            return [_get(item) for item in grid]
+
+        LOGGER.debug("Making {} requests, {} at a time".format(
+            len(grid), workers
+        ))
+        with concurrent.futures.ThreadPoolExecutor(workers) as pool:
+            return list(pool.map(_get, grid))
+
+    def _get_chunk(self, series, startyear, endyear, catalog):
+        """
+        Get at most 50 ``series`` for at most 20 years with one request,
+        returning the JSON payload of the response. The response includes
+        the catalog entries of the series if ``catalog`` is True
+        """
         body = {
             "startyear": startyear,
             "endyear": endyear,
             "seriesid": series,
             "registrationKey": self.key,
-            "catalog": True if nice_names else False,
+            "catalog": True if catalog else False,
         }
+        limit = int(options["bls.daily_limit"])
+        if not get_tracker(options["PATHS.base"]).reserve(self.key, limit):
+            msg = "The daily limit of {} requests with this API key has "
+            msg += "been reached"
+            raise QueryError(msg.format(limit), None)
+
+        _RATE_LIMITER.wait()
         res = self.sess.post(self.url, json=body)
 
         if res.status_code == 200:
@@ -157,7 +238,7 @@ class BLSData(object):
             data = res.json()
         elif res.status_code in BLS_STATUS_CODE_REASONS:
             msg = "Request failed with code {} and message ".format(res.status_code)
-            msg += BLS_STATUS_CODE_REASONS(res.status_code)
+            msg += BLS_STATUS_CODE_REASONS[res.status_code]
             raise QueryError(msg, res)
         else:
             msg = "Request failed unexpectedly with code {}".format(res.status_code)
@@ -170,51 +251,433 @@ class BLSData(object):
 
             raise QueryError(msg, res)
 
+        return data
 
-        # at this point we should have data
+    def get_groups(self, groups, startyear=None, endyear=None):
+        """
+        Get the series of several groups (for example the series of every
+        state) using as few requests as possible
 
-        dfs = []
-        for series in data["Results"]["series"]:
-            df = pd.DataFrame(
-                series["data"],
-                columns=["value", "year", "period"]
-            )
-            if df.shape[0] == 0:
-                LOGGER.debug("Query was empty for " + series['seriesID'])
-                continue
+        Instead of one request per group, the series of all groups are
+        requested together, packed into requests of as many series as the
+        API allows, and the result is then split back into groups
 
-            # see if quarterly, monthly, or annual
-            freq = series["data"][0]["period"][0]
-            if freq == "M":
-                df["Date"] = pd.to_datetime(
-                    df["year"] + df["period"], format="%YM%m"
-                )
-            elif freq == "A":
-                df["Date"] = pd.to_datetime(df["year"], format="%Y")
-            elif freq == "Q":
-                df["Date"] = pd.to_datetime(df["year"] + df["period"].str[2])
-            else:
-                msg = "Unknown frequency {}. Please open an issue".format(freq)
-                raise ValueError(msg)
+        Parameters
+        ----------
+        groups : dict
+            Maps the name of each group to a BLS series name or list of
+            series names. A series may belong to more than one group, but
+            is only requested once
 
-            df.drop(["year", "period"], axis=1, inplace=True)
+        startyear, endyear : int, optional
+            See `BLSData.get`
 
-            if nice_names:
-                if "series_title" in series.get("catalog", []):
-                    df["variable"] = series["catalog"]["series_title"]
-            else:
-                df["variable"] = series["seriesID"]
+        Returns
+        -------
+        dfs : dict(pandas.DataFrame)
+            Maps the name of each group to a DataFrame with the data of its
+            series, in the long format returned by `BLSData.get` with
+            ``nice_names=False``
+
+        """
+        groups = {
+            group: _make_list(series) for (group, series) in groups.items()
+        }
+        series = list(dict.fromkeys(
+            s for group_series in groups.values() for s in group_series
+        ))
+        LOGGER.debug("Requesting {} series for {} groups".format(
+            len(series), len(groups)
+        ))
+        df = self.get(series, startyear, endyear, nice_names=False)
+
+        return {
+            group: df.loc[df["variable"].isin(group_series)]
+                     .reset_index(drop=True)
+            for (group, group_series) in groups.items()
+        }
+
+
+class RequestPlan(object):
+    """
+    Plan the requests of several `BLSData` queries together
+
+    Each series is only requested once, with the years of every query
+    that needs it, and series that need similar years share requests of
+    up to 50 series and 20 years. Titles are only requested for series
+    without a saved title, and when the ``bls.cache`` configuration option
+    is True, saved observations aren't requested again. Create one with
+    `BLSData.plan`
+
+    Parameters
+    ----------
+    client : BLSData
+        The client that makes the requests
+
+    nice_names : bool, optional(default=True)
+        See `BLSData.get`
+    """
+
+    def __init__(self, client, nice_names=True):
+        self.client = client
+        self.nice_names = nice_names
+        self.queries = []
+
+    def add(self, series, startyear=None, endyear=None):
+        """
+        Add a query for ``series`` from ``startyear`` to ``endyear`` (see
+        `BLSData.get`) and return its position in the results of `run`
+        """
+        nyear = LIMITS["years_per_query"]
+        if endyear is None:
+            endyear = datetime.datetime.now().year
+        if startyear is None:
+            startyear = endyear - (nyear - 1)
+
+        self.queries.append((_make_list(series), startyear, endyear))
+        return len(self.queries) - 1
+
+    def _series(self):
+        return list(dict.fromkeys(
+            s for (query, _, _) in self.queries for s in query
+        ))
+
+    def _saved(self):
+        # the observations and titles saved on the computer
+        titles = {}
+        if self.nice_names and len(self.queries) > 0:
+            catalog = get_catalog(options["PATHS.data"])
+            titles = catalog.titles(self._series())
+        if not _as_bool(options["bls.cache"]) or len(self.queries) == 0:
+            return {}, titles
+
+        cache = get_cache(options["PATHS.data"])
+        startyear = min(start for (_, start, _) in self.queries)
+        endyear = max(end for (_, _, end) in self.queries)
+        months = int(options["bls.revision_window"])
+        recent = (
+            datetime.datetime.now() - pd.DateOffset(months=months)
+        ).year
+        max_age = int(options["bls.cache_expiry"])
+
+        saved = cache.get(
+            self._series(), startyear, endyear, recent, max_age
+        )
+        return saved, titles
+
+    def _requests(self, saved, titles):
+        # the years each series needs across the queries...
+        needs = collections.OrderedDict()
+        for (query, start, end) in self.queries:
+            for s in query:
+                needs.setdefault(s, set()).update(range(start, end + 1))
+
+        # ... minus the saved ones, as ranges of consecutive years
+        missing = []
+        for (s, years) in needs.items():
+            if not self.nice_names or s in titles:
+                years = [y for y in years if (s, y) not in saved]
+            years = sorted(years)
+            first = 0
+            for i in range(1, len(years) + 1):
+                if i == len(years) or years[i] != years[i - 1] + 1:
+                    missing.append((s, years[first], years[i - 1]))
+                    first = i
+
+        return _merge(missing)
+
+    @property
+    def requests(self):
+        """
+        The ``(series, startyear, endyear)`` of each request that `run`
+        will make
+        """
+        return self._requests(*self._saved())
 
-            try:
-                df["value"] = df["value"].astype(float)
-            except ValueError:
-                pass
+    def summary(self):
+        """
+        Report the requests the plan needs before making them
 
-            dfs.append(df)
+        Returns
+        -------
+        summary : dict
+            The number of ``queries``, of distinct ``series``, of
+            ``requests`` that `run` will make, and of requests
+            ``remaining`` today with the client's key
 
-        df = pd.concat(dfs, ignore_index=True)
+        """
+        return dict(
+            queries=len(self.queries), series=len(self._series()),
+            requests=len(self.requests),
+            remaining=self.client.quota()["remaining"]
+        )
 
-        if wide:
-            return df.set_index(["Date", "variable"]).unstack()["value"]
+    def run(self, wide=False, float32=False):
+        """
+        Make the requests and return a DataFrame for each query, in the
+        order they were added, in the format of `BLSData.get` with the
+        given ``wide`` and ``float32``
+        """
+        saved, titles = self._saved()
+        todo = self._requests(saved, titles)
+        LOGGER.debug("Making {} requests for {} queries".format(
+            len(todo), len(self.queries)
+        ))
+
+        # only request the catalog of series without a saved title
+        grid = [
+            (chunk, start, end,
+             self.nice_names and any(s not in titles for s in chunk))
+            for (chunk, start, end) in todo
+        ]
+        observations, titles = dict(saved), dict(titles)
+        if len(grid) > 0:
+            payloads = self.client._get_grid(grid)
+            for ((_, start, end, catalog), payload) in zip(grid, payloads):
+                if catalog:
+                    get_catalog(options["PATHS.data"]).put(payload)
+                if _as_bool(options["bls.cache"]):
+                    get_cache(options["PATHS.data"]).put(payload, start, end)
+                found, found_titles = split_response(payload, start, end)
+                observations.update(found)
+                titles.update(found_titles)
+
+        # rebuild the responses each query would have received on its own
+        out = []
+        for (query, start, end) in self.queries:
+            payloads = [
+                _payload(chunk, wstart, wend, observations, titles)
+                for (chunk, wstart, wend) in _grid(query, start, end)
+            ]
+            if wide:
+                dtype = np.float32 if float32 else np.float64
+                out.append(_parse_wide(payloads, self.nice_names, dtype))
+            else:
+                out.append(_parse_response(payloads, self.nice_names))
+
+        return out
+
+
+def _payload(series, startyear, endyear, observations, titles):
+    """
+    Build the JSON payload of the response to a request for ``series``
+    from ``startyear`` to ``endyear`` from their ``observations`` (see
+    `split_response`)
+    """
+    result = []
+    for s in series:
+        # the API returns the newest observations first
+        data = [
+            row
+            for year in range(endyear, startyear - 1, -1)
+            for row in observations.get((s, year), [])
+        ]
+        entry = dict(seriesID=s, data=data)
+        if s in titles:
+            entry["catalog"] = dict(series_title=titles[s])
+        result.append(entry)
+    return dict(Results=dict(series=result))
+
+
+def _windows(startyear, endyear):
+    return len(range(startyear, endyear + 1, LIMITS["years_per_query"]))
+
+
+def _merge(missing):
+    """
+    Plan the requests for the ``(series, startyear, endyear)`` items of
+    ``missing``. Items share a request when that doesn't take more windows
+    of 20 years than they need on their own
+    """
+    clusters = []
+    for (s, start, end) in missing:
+        for cluster in clusters:
+            lo, hi = min(cluster[0], start), max(cluster[1], end)
+            most = max(_windows(*cluster[:2]), _windows(start, end))
+            if _windows(lo, hi) <= most:
+                cluster[0], cluster[1] = lo, hi
+                if s not in cluster[2]:
+                    cluster[2].append(s)
+                break
         else:
-            return df
+            clusters.append([start, end, [s]])
+
+    return [
+        item
+        for (start, end, series) in clusters
+        for item in _grid(series, start, end)
+    ]
+
+
+def _grid(series, startyear, endyear):
+    """
+    Split a query into the ``(series, startyear, endyear)`` of the
+    requests that make it up: windows of at most 20 years (the outer loop)
+    and chunks of at most 50 series
+    """
+    windows = [
+        (years[0], years[-1])
+        for years in iter_chunks(
+            range(startyear, endyear + 1), LIMITS["years_per_query"]
+        )
+    ]
+    chunks = list(iter_chunks(series, LIMITS["series_per_query"]))
+    return [
+        (chunk, start, end) for (start, end) in windows for chunk in chunks
+    ]
+
+
+# The month in which each period starts. Annual averages (M13 for monthly
+# series, Q05 for quarterly ones) are dropped
+_PERIOD_MONTHS = dict(
+    [("M{:02d}".format(m), m) for m in range(1, 13)] +
+    [("Q{:02d}".format(q), 3 * q - 2) for q in range(1, 5)] +
+    [("A01", 1)]
+)
+_AVERAGE_PERIODS = ["M13", "Q05"]
+
+
+def _to_float(values, bounds):
+    """
+    Cast the values of every series to float. If a series has values that
+    aren't numbers, its values are kept as strings
+    """
+    try:
+        return values.astype(float)
+    except ValueError:
+        pass
+
+    out = values.copy()
+    for (start, stop) in zip(bounds[:-1], bounds[1:]):
+        try:
+            out[start:stop] = values[start:stop].astype(float)
+        except ValueError:
+            pass
+    return out
+
+
+def _months(years, periods):
+    """
+    Number of months since 1970-01 of the observations of the given
+    ``years`` and ``periods``, NaN for annual averages
+    """
+    periods = pd.Series(periods, dtype=object)
+    months = periods.map(_PERIOD_MONTHS)
+    unknown = months.isna() & ~periods.isin(_AVERAGE_PERIODS)
+    if unknown.any():
+        freq = periods[unknown].iloc[0]
+        msg = "Unknown frequency {}. Please open an issue".format(freq)
+        raise ValueError(msg)
+
+    return (
+        (np.array(years, dtype=np.int64) - 1970) * 12 +
+        months.values.astype(np.float64) - 1
+    )
+
+
+def _parse_response(payloads, nice_names):
+    """
+    Build one long DataFrame with ``value``, ``Date`` and ``variable``
+    columns from the JSON ``payloads`` of one or more responses of the BLS
+    API, keeping the order of their series and observations
+    """
+    years, periods, values, variables = [], [], [], []
+    bounds = [0]
+    for data in payloads:
+        for series in data["Results"]["series"]:
+            rows = series["data"]
+            if len(rows) == 0:
+                LOGGER.debug("Query was empty for " + series["seriesID"])
+                continue
+
+            if nice_names:
+                name = series.get("catalog", {}).get("series_title")
+            else:
+                name = series["seriesID"]
+            years += [row["year"] for row in rows]
+            periods += [row["period"] for row in rows]
+            values += [row["value"] for row in rows]
+            variables += [name] * len(rows)
+            bounds.append(len(values))
+
+    return _long_frame(years, periods, values, variables, bounds, nice_names)
+
+
+def _long_frame(years, periods, values, variables, bounds, nice_names):
+    """
+    Build the long DataFrame of `BLSData.get` from the ``years``,
+    ``periods``, ``values`` and ``variables`` of the observations of one
+    series after another. ``bounds`` holds the position of the first
+    observation of each series and the number of observations
+    """
+    months = _months(years, periods)
+    keep = ~np.isnan(months)
+    dates = months[keep].astype(np.int64).astype("datetime64[M]")
+
+    df = pd.DataFrame({
+        "value": _to_float(np.array(values, dtype=object), bounds)[keep],
+        "Date": dates.astype("datetime64[ns]"),
+        "variable": np.array(variables, dtype=object)[keep],
+    })
+    if nice_names and df["variable"].isna().all():
+        # the API didn't send the titles
+        df.drop("variable", axis=1, inplace=True)
+    return df
+
+
+def _parse_wide(payloads, nice_names, dtype=np.float64):
+    """
+    Build the wide DataFrame of `BLSData.get`, with one column per
+    variable and a row per date, from the JSON ``payloads`` of one or more
+    responses of the BLS API
+    """
+    years, periods, values, variables = [], [], [], []
+    for data in payloads:
+        for series in data["Results"]["series"]:
+            rows = series["data"]
+            if len(rows) == 0:
+                LOGGER.debug("Query was empty for " + series["seriesID"])
+                continue
+
+            name = series["seriesID"]
+            if nice_names:
+                name = series.get("catalog", {}).get("series_title", name)
+            years += [row["year"] for row in rows]
+            periods += [row["period"] for row in rows]
+            values += [row["value"] for row in rows]
+            variables += [name] * len(rows)
+
+    return _wide_frame(years, periods, values, variables, dtype)
+
+
+def _wide_frame(years, periods, values, variables, dtype=np.float64):
+    """
+    Build the wide DataFrame of `BLSData.get` from the ``years``,
+    ``periods``, ``values`` and ``variables`` of a set of observations
+
+    The values are written straight into one 2-D array of ``dtype`` with a
+    row for every date of any variable, rather than pivoting the long
+    DataFrame. A series split over several responses fills the same
+    column. Values that aren't numbers are NaN
+    """
+    months = _months(years, periods)
+    keep = ~np.isnan(months)
+    dates, row = np.unique(months[keep].astype(np.int64), return_inverse=True)
+    column, names = pd.factorize(
+        np.array(variables, dtype=object)[keep], sort=True
+    )
+    values = np.array(values, dtype=object)[keep]
+    try:
+        values = values.astype(np.float64)
+    except ValueError:
+        values = pd.to_numeric(values, errors="coerce")
+
+    out = np.full((dates.shape[0], names.shape[0]), np.nan, dtype=dtype)
+    out[row, column] = values
+
+    index = pd.DatetimeIndex(
+        dates.astype("datetime64[M]").astype("datetime64[ns]"), name="Date"
+    )
+    return pd.DataFrame(
+        out, index=index, columns=pd.Index(names, name="variable")
+    )
@@ -0,0 +1,200 @@
+"""
+Read BLS time series from a local mirror of the flat files that BLS
+publishes at https://download.bls.gov/pub/time.series/.
+
+Each survey (``la`` for LAUS, ``sm`` for state CES, ...) has a directory
+with a ``<survey>.series`` file describing its series and one or more
+``<survey>.data.*`` files with their observations, all tab-delimited. A
+full history of hundreds of series is read from these files without the
+many requests the API would need for it.
+"""
+import glob
+import os
+
+import numpy as np
+import pandas as pd
+
+from ..config import options, setup_logger
+from ..util import _make_list
+from .core import _long_frame, _wide_frame
+
+LOGGER = setup_logger(__name__)
+
+# rows of a flat file read at a time
+_CHUNKSIZE = 500000
+
+_DATA_COLUMNS = ["series_id", "year", "period", "value"]
+
+
+def _read(fn, columns, chunksize):
+    """
+    Read the ``columns`` of the flat file ``fn`` in chunks of
+    ``chunksize`` rows, as strings without the padding of the file
+    """
+    reader = pd.read_csv(
+        fn, sep="\t", dtype=str, na_filter=False, chunksize=chunksize,
+        # the column names are padded with spaces too
+        usecols=lambda c: c.strip() in columns
+    )
+    for chunk in reader:
+        chunk.columns = [c.strip() for c in chunk.columns]
+        yield chunk
+
+
+class BLSFlatFiles(object):
+    def __init__(self, path=None, data_files=None, chunksize=_CHUNKSIZE):
+        """
+        Parameters
+        ----------
+        path : string, optional
+            The directory of the mirror. It holds a directory per survey
+            named like the survey (for example ``la/la.series``), or the
+            files of the surveys themselves. The default is the
+            ``bls.flat_files`` configuration option
+
+        data_files : dict, optional
+            Maps surveys to the names of the data files to read for them.
+            By default every ``<survey>.data.*`` file is read; surveys
+            whose data is split into overlapping files (like ``la``) are
+            read faster from just the files with the series you need, for
+            example ``{{"la": ["la.data.3.AllStatesS"]}}``
+
+        chunksize : int, optional(default={chunksize})
+            The number of rows read from a file at a time. Only the rows of
+            the requested series are kept from each chunk
+        """.format(chunksize=_CHUNKSIZE)
+        if path is None:
+            path = options["bls.flat_files"]
+        if path is None:
+            msg = "No directory with the BLS flat files. Pass one or set "
+            msg += "`qeds.options['bls.flat_files']`"
+            raise EnvironmentError(msg)
+
+        self.path = path
+        self.data_files = {} if data_files is None else data_files
+        self.chunksize = chunksize
+
+    def _file(self, survey, name):
+        folder = os.path.join(self.path, survey)
+        if not os.path.isdir(folder):
+            folder = self.path
+        return os.path.join(folder, name)
+
+    def _data_files(self, survey):
+        if survey in self.data_files:
+            return [
+                self._file(survey, name) for name in self.data_files[survey]
+            ]
+        files = sorted(glob.glob(self._file(survey, survey + ".data.*")))
+        if len(files) == 0:
+            msg = "No data files of the BLS survey {} in {}"
+            raise IOError(msg.format(survey, self.path))
+        return files
+
+    def _titles(self, survey, series):
+        fn = self._file(survey, survey + ".series")
+        if not os.path.exists(fn):
+            return {}
+
+        out = {}
+        columns = ["series_id", "series_title"]
+        for chunk in _read(fn, columns, self.chunksize):
+            if "series_title" not in chunk.columns:
+                return {}
+            ids = chunk["series_id"].str.strip()
+            keep = ids.isin(series)
+            titles = chunk["series_title"][keep].str.strip()
+            out.update(zip(ids[keep], titles))
+        return out
+
+    def _observations(self, survey, series, startyear, endyear):
+        found = []
+        for fn in self._data_files(survey):
+            LOGGER.debug("Reading {}".format(fn))
+            for chunk in _read(fn, _DATA_COLUMNS, self.chunksize):
+                ids = chunk["series_id"].str.rstrip()
+                keep = ids.isin(series)
+                if not keep.any():
+                    continue
+                chunk = chunk.loc[keep].apply(lambda col: col.str.strip())
+                years = chunk["year"].astype(int)
+                if startyear is not None:
+                    chunk = chunk.loc[years >= startyear]
+                if endyear is not None:
+                    chunk = chunk.loc[years <= endyear]
+                found.append(chunk)
+
+        if len(found) == 0:
+            return pd.DataFrame(columns=_DATA_COLUMNS)
+        # the data files of a survey may overlap
+        return pd.concat(found, ignore_index=True).drop_duplicates(
+            ["series_id", "year", "period"]
+        )
+
+    def get(self, series, startyear=None, endyear=None, nice_names=True,
+            wide=False, float32=False):
+        """
+        Get requested ``series`` from ``startyear`` to ``endyear`` as a
+        pandas DataFrame, in the format of `BLSData.get`
+
+        Parameters
+        ----------
+        series : string or list(string)
+            A valid BLS series name, or list of series names. The first
+            two letters of a name are its survey
+
+        startyear, endyear : int, optional
+            The first and last year of data to obtain. The default is every
+            year in the files
+
+        nice_names, wide, float32 : bool, optional
+            See `BLSData.get`. With ``nice_names=True``, series without a
+            title in the ``<survey>.series`` file keep their series name
+
+        Returns
+        -------
+        df : pandas.DataFrame
+            A pandas DataFrame containing the requested series. In the
+            long format the series are in the order of ``series``, each
+            with its newest observations first
+
+        """
+        series = list(dict.fromkeys(_make_list(series)))
+        surveys = list(dict.fromkeys(s[:2].lower() for s in series))
+
+        found, titles = [], {}
+        for survey in surveys:
+            wanted = [s for s in series if s[:2].lower() == survey]
+            found.append(
+                self._observations(survey, wanted, startyear, endyear)
+            )
+            if nice_names:
+                titles.update(self._titles(survey, wanted))
+        df = pd.concat(found, ignore_index=True)
+
+        # series in the order requested, the newest observations first
+        df["series_id"] = pd.Categorical(df["series_id"], categories=series)
+        df.sort_values(
+            ["series_id", "year", "period"], ascending=[True, False, False],
+            inplace=True, kind="mergesort"
+        )
+        codes = df["series_id"].cat.codes.values
+        counts = np.bincount(codes, minlength=len(series))
+        for s in np.array(series, dtype=object)[counts == 0]:
+            LOGGER.debug("No observations of " + s)
+
+        names = [titles.get(s, s) for s in series] if nice_names else series
+        variables = np.array(names, dtype=object)[codes]
+
+        if wide:
+            dtype = np.float32 if float32 else np.float64
+            return _wide_frame(
+                df["year"].values, df["period"].values, df["value"].values,
+                variables, dtype
+            )
+
+        bounds = [0] + np.cumsum(counts[counts > 0]).tolist()
+        return _long_frame(
+            df["year"].values, df["period"].values, df["value"].values,
+            variables, bounds, nice_names
+        )
@@ -0,0 +1,82 @@
+"""
+Count the requests made to the BLS API with each registration key.
+
+The API allows each key a limited number of requests per day (set by the
+``bls.daily_limit`` configuration option). The counts are kept in a
+SQLite database under ``PATHS.base``, so every process on the computer
+shares them. Days are counted in UTC. Keys are stored as a hash.
+"""
+import datetime
+import hashlib
+import os
+
+from ..sqlite import SQLiteStore, per_directory, transaction
+
+
+def _today():
+    return datetime.datetime.utcnow().strftime("%Y-%m-%d")
+
+
+def _key_id(key):
+    return hashlib.sha256(key.encode("utf-8")).hexdigest()[:16]
+
+
+class QuotaTracker(SQLiteStore):
+    """
+    Number of requests made with each key per day, backed by SQLite
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database. It is created if it doesn't exist
+    """
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS quota (
+        key TEXT NOT NULL,
+        day TEXT NOT NULL,
+        used INTEGER NOT NULL,
+        PRIMARY KEY (key, day)
+    )
+    """
+
+    def used(self, key):
+        """
+        Return the number of requests made today with ``key``
+        """
+        row = self._connect().execute(
+            "SELECT used FROM quota WHERE key = ? AND day = ?",
+            (_key_id(key), _today())
+        ).fetchone()
+        return 0 if row is None else row[0]
+
+    def reserve(self, key, limit, n=1):
+        """
+        Count ``n`` more requests made today with ``key``, unless that
+        would exceed ``limit``. Returns whether the requests were counted
+        """
+        key, day = _key_id(key), _today()
+        conn = self._connect()
+        with transaction(conn):
+            row = conn.execute(
+                "SELECT used FROM quota WHERE key = ? AND day = ?", (key, day)
+            ).fetchone()
+            used = 0 if row is None else row[0]
+            if used + n > limit:
+                return False
+            conn.execute(
+                "INSERT OR REPLACE INTO quota VALUES (?, ?, ?)",
+                (key, day, used + n)
+            )
+        return True
+
+
+_get_tracker = per_directory(
+    lambda base_dir: QuotaTracker(os.path.join(base_dir, "bls_quota.sqlite"))
+)
+
+
+def get_tracker(base_dir):
+    """
+    Return the `QuotaTracker` for the qeds directory ``base_dir``
+    """
+    return _get_tracker(base_dir)
@@ -0,0 +1,158 @@
+"""
+tests for qeds.data.bls.flatfiles, reading a small mirror of the BLS flat
+files written by the tests
+"""
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import pandas as pd
+from qeds.data import options
+from qeds.data.bls import core
+from qeds.data.bls.flatfiles import BLSFlatFiles
+
+_TITLES = {
+    "LASST010000000000003": "Unemployment Rate: Alabama (S)",
+    "LASST020000000000003": "Unemployment Rate: Alaska (S)",
+}
+
+
+def _value(series, year, period):
+    if series.startswith("SM") and year == 2016:
+        return "-"
+    return "{}.{}".format(year % 100, int(period[1:]))
+
+
+def _rows(series, startyear, endyear):
+    # the files have the oldest observations first and annual averages
+    return [
+        (s, year, "M{:02d}".format(month),
+         _value(s, year, "M{:02d}".format(month)))
+        for s in series
+        for year in range(startyear, endyear + 1)
+        for month in range(1, 14)
+    ]
+
+
+def _write(fn, columns, rows):
+    # the files pad their columns with spaces
+    with open(fn, "w") as f:
+        f.write("\t".join(c.ljust(30) for c in columns) + "\n")
+        for row in rows:
+            f.write("\t".join(str(x).ljust(12) for x in row) + "\n")
+
+
+def _payload(series, startyear, endyear, titles):
+    # the response of the API for the same observations
+    result = []
+    for s in series:
+        data = [
+            dict(year=str(year), period=period, value=value)
+            for (_, year, period, value) in reversed(
+                _rows([s], startyear, endyear)
+            )
+        ]
+        result.append(dict(
+            seriesID=s, data=data, catalog=dict(series_title=titles[s])
+        ))
+    return dict(Results=dict(series=result))
+
+
+class TestFlatFiles(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        la = os.path.join(self.dir, "la")
+        os.mkdir(la)
+        series = sorted(_TITLES) + ["LASST040000000000003"]
+        columns = ["series_id", "year", "period", "value", "footnote_codes"]
+        # overlapping data files
+        _write(
+            os.path.join(la, "la.data.0.CurrentS"), columns,
+            [row + ("",) for row in _rows(series, 2015, 2017)]
+        )
+        _write(
+            os.path.join(la, "la.data.1.AllStatesS"), columns,
+            [row + ("",) for row in _rows(series, 2000, 2017)]
+        )
+        _write(
+            os.path.join(la, "la.series"),
+            ["series_id", "area_code", "series_title"],
+            [(s, "ST", _TITLES[s]) for s in sorted(_TITLES)]
+        )
+        # a survey without titles, in the mirror directory itself
+        _write(
+            os.path.join(self.dir, "sm.data.1.AllData"), columns,
+            [row + ("",) for row in _rows(["SMS01000000000000001"], 2015,
+                                          2017)]
+        )
+        _write(
+            os.path.join(self.dir, "sm.series"), ["series_id", "state_code"],
+            [("SMS01000000000000001", "01")]
+        )
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_same_as_api(self):
+        series = ["LASST020000000000003", "LASST010000000000003"]
+        flat = BLSFlatFiles(self.dir, chunksize=10)
+        payload = _payload(series, 2001, 2017, _TITLES)
+        for nice_names in [True, False]:
+            pd.testing.assert_frame_equal(
+                flat.get(series, 2001, 2017, nice_names=nice_names),
+                core._parse_response([payload], nice_names)
+            )
+        pd.testing.assert_frame_equal(
+            flat.get(series, 2001, 2017, wide=True, float32=True),
+            core._parse_wide([payload], True, np.float32)
+        )
+
+    def test_years(self):
+        flat = BLSFlatFiles(self.dir)
+        df = flat.get("LASST010000000000003", nice_names=False)
+        self.assertEqual(df.shape, (18 * 12, 3))
+        self.assertEqual(df["Date"].iloc[0], pd.Timestamp("2017-12-01"))
+        self.assertEqual(df["Date"].iloc[-1], pd.Timestamp("2000-01-01"))
+
+        df = flat.get("LASST010000000000003", endyear=2005, nice_names=False)
+        self.assertEqual(df["Date"].iloc[0], pd.Timestamp("2005-12-01"))
+
+    def test_data_files(self):
+        flat = BLSFlatFiles(
+            self.dir, data_files={"la": ["la.data.0.CurrentS"]}
+        )
+        df = flat.get("LASST010000000000003")
+        self.assertEqual(df.shape, (3 * 12, 3))
+
+    def test_surveys(self):
+        flat = BLSFlatFiles(self.dir)
+        df = flat.get(["SMS01000000000000001", "LASST010000000000003"], 2016)
+        # series without a title keep their name
+        self.assertEqual(list(dict.fromkeys(df["variable"])), [
+            "SMS01000000000000001", "Unemployment Rate: Alabama (S)"
+        ])
+        # series with values that aren't numbers are kept as strings
+        self.assertEqual(df["value"].iloc[12:24].tolist(), ["-"] * 12)
+
+        with self.assertRaises(IOError):
+            flat.get("CUUR0000SA0")
+
+    def test_path(self):
+        old = options["bls.flat_files"]
+        try:
+            options.vconf.remove_option("bls", "flat_files")
+            with self.assertRaises(EnvironmentError):
+                BLSFlatFiles()
+            options.set_config("bls", "flat_files", self.dir, write=False)
+            self.assertEqual(BLSFlatFiles().path, self.dir)
+        finally:
+            options.vconf.remove_option("bls", "flat_files")
+            if old is not None:
+                options.set_config("bls", "flat_files", old, write=False)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,439 @@
+"""
+tests for qeds.data.bls that run against a fake BLS API
+"""
+import datetime
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+import numpy as np
+import pandas as pd
+import qeds
+from qeds.data import options
+from qeds.data.bls import core
+from qeds.data.bls.cache import get_cache
+from qeds.data.bls.catalog import get_catalog
+from qeds.data.bls.core import BLSData
+
+
+class _Response(object):
+
+    def __init__(self, data, status_code=200):
+        self._data = data
+        self.status_code = status_code
+
+    def json(self):
+        return self._data
+
+
+class _FakeSession(object):
+    """
+    Stands in for the ``requests.Session`` of a `BLSData`, answering every
+    request with monthly data for the requested series and years and
+    recording the request bodies in ``calls``
+    """
+
+    def __init__(self):
+        self.calls = []
+
+    @staticmethod
+    def value(series, year, month):
+        return "{}.{}".format(year, month)
+
+    def post(self, url, json=None, **kwargs):
+        self.calls.append(json)
+        series = []
+        for s in json["seriesid"]:
+            data = [
+                dict(
+                    year=str(year), period="M{:02d}".format(month),
+                    value=self.value(s, year, month)
+                )
+                # the API returns the newest observations first
+                for year in range(json["endyear"], json["startyear"] - 1, -1)
+                for month in range(12, 0, -1)
+            ]
+            entry = dict(seriesID=s, data=data)
+            if json.get("catalog"):
+                entry["catalog"] = dict(series_title="Title of " + s)
+            series.append(entry)
+
+        return _Response(dict(
+            status="REQUEST_SUCCEEDED", Results=dict(series=series)
+        ))
+
+
+def setUpModule():
+    # the fake API has no rate limit, and the tests shouldn't wait for the
+    # real one, count requests against the user's quota or save titles in
+    # the user's catalog
+    global _OLD_LIMITER, _OLD_PATHS, _BASE
+    _OLD_LIMITER = core._RATE_LIMITER
+    core._RATE_LIMITER = qeds.data.util.RateLimiter(10 ** 6, 1)
+    _OLD_PATHS = {key: options["PATHS." + key] for key in ["base", "data"]}
+    _BASE = tempfile.mkdtemp()
+    options.set_config("PATHS", "base", _BASE, write=False)
+    options.set_config("PATHS", "data", _BASE, write=False)
+
+
+def tearDownModule():
+    core._RATE_LIMITER = _OLD_LIMITER
+    for (key, val) in _OLD_PATHS.items():
+        options.set_config("PATHS", key, val, write=False)
+    shutil.rmtree(_BASE)
+
+
+def _client():
+    # skip __init__, which would look for (and save) an API key
+    b = BLSData.__new__(BLSData)
+    b.key = "0" * 32
+    b.url = qeds.data.options["bls.api_url"]
+    b.headers = {"Content-Type": "application/json"}
+    b.sess = _FakeSession()
+    return b
+
+
+class _SlowSession(_FakeSession):
+    """
+    A `_FakeSession` whose requests take a while, recording how many were
+    in flight at the same time
+    """
+
+    def __init__(self):
+        super(_SlowSession, self).__init__()
+        self.active = self.most_active = 0
+        self.lock = threading.Lock()
+
+    def post(self, url, json=None, **kwargs):
+        with self.lock:
+            self.active += 1
+            self.most_active = max(self.most_active, self.active)
+        time.sleep(0.02)
+        with self.lock:
+            self.active -= 1
+        return super(_SlowSession, self).post(url, json, **kwargs)
+
+
+class TestConcurrency(unittest.TestCase):
+
+    def setUp(self):
+        self._old = options["bls.concurrency"]
+
+    def tearDown(self):
+        options.set_config("bls", "concurrency", self._old, write=False)
+
+    def _get(self, concurrency, **kwargs):
+        options.set_config("bls", "concurrency", concurrency, write=False)
+        b = _client()
+        b.sess = _SlowSession()
+        series = ["S{:03d}".format(i) for i in range(120)]
+        df = b.get(series, 1970, 2014, **kwargs)
+        return df, b.sess
+
+    def test_wide(self):
+        long, _ = self._get("4")
+        want = long.set_index(["Date", "variable"]).unstack()["value"]
+        have, _ = self._get("4", wide=True)
+        pd.testing.assert_frame_equal(have, want)
+
+    def test_same_as_serial(self):
+        want, sess = self._get("1", nice_names=False)
+        self.assertEqual(len(sess.calls), 9)
+        self.assertEqual(sess.most_active, 1)
+
+        have, sess = self._get("4", nice_names=False)
+        self.assertGreater(sess.most_active, 1)
+        self.assertLessEqual(sess.most_active, 4)
+        pd.testing.assert_frame_equal(have, want)
+
+    def test_rate_limit(self):
+        old = core._RATE_LIMITER
+        core._RATE_LIMITER = qeds.data.util.RateLimiter(3, 0.2)
+        try:
+            start = time.monotonic()
+            self._get("4", nice_names=False)
+            elapsed = time.monotonic() - start
+        finally:
+            core._RATE_LIMITER = old
+        # 9 requests at most 3 every 0.2 seconds
+        self.assertGreaterEqual(elapsed, 0.4)
+
+
+class TestParse(unittest.TestCase):
+
+    def _payload(self, *series):
+        return dict(Results=dict(series=[
+            dict(seriesID=sid, catalog=dict(series_title=sid.lower()),
+                 data=[dict(year=y, period=p, value=v) for (y, p, v) in rows])
+            for (sid, rows) in series
+        ]))
+
+    def test_periods(self):
+        payload = self._payload(
+            ("M", [("2017", "M13", "3"), ("2017", "M12", "2"),
+                   ("2017", "M01", "1")]),
+            ("Q", [("2016", "Q05", "9"), ("2016", "Q04", "8"),
+                   ("2016", "Q01", "7")]),
+            ("A", [("2015", "A01", "6")]),
+            ("E", []),
+        )
+        df = core._parse_response([payload], nice_names=False)
+        self.assertEqual(list(df.columns), ["value", "Date", "variable"])
+        self.assertEqual(df["value"].tolist(), [2, 1, 8, 7, 6])
+        self.assertEqual(df["Date"].dt.strftime("%Y-%m").tolist(), [
+            "2017-12", "2017-01", "2016-10", "2016-01", "2015-01"
+        ])
+        self.assertEqual(df["variable"].tolist(), list("MMQQA"))
+
+        with self.assertRaises(ValueError):
+            core._parse_response(
+                [self._payload(("S", [("2017", "S01", "1")]))], False
+            )
+
+    def test_values(self):
+        payload = self._payload(
+            ("A", [("2017", "M01", "1.5")]),
+            ("B", [("2017", "M02", "-"), ("2017", "M01", "2")]),
+        )
+        df = core._parse_response([payload, payload], nice_names=True)
+        self.assertEqual(df["variable"].tolist(), list("abbabb"))
+        # series with values that aren't numbers are kept as strings
+        self.assertEqual(df["value"].tolist(), [1.5, "-", "2"] * 2)
+
+    def test_wide(self):
+        payloads = [
+            self._payload(("B", [("2017", "M02", "2"), ("2017", "M01", "1")]),
+                          ("A", [("2017", "M03", "-"), ("2017", "M13", "9")])),
+            self._payload(("B", [("2016", "M12", "0")]), ("E", [])),
+        ]
+        df = core._parse_wide(payloads, nice_names=False)
+        self.assertEqual(list(df.columns), ["A", "B"])
+        self.assertEqual(df.index.strftime("%Y-%m").tolist(), [
+            "2016-12", "2017-01", "2017-02", "2017-03"
+        ])
+        # values that aren't numbers are missing
+        self.assertTrue(df["A"].isna().all())
+        self.assertEqual(df["B"].tolist()[:3], [0, 1, 2])
+
+        long = core._parse_response(payloads, nice_names=False)
+        want = long.set_index(["Date", "variable"]).unstack()["value"]
+        pd.testing.assert_series_equal(df["B"], want["B"].astype(float))
+
+        df = core._parse_wide(payloads, True, np.float32)
+        self.assertEqual(list(df.columns), ["a", "b"])
+        self.assertTrue((df.dtypes == np.float32).all())
+
+
+class TestCache(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        config = {
+            "PATHS.data": self.dir, "bls.cache": "True",
+            "bls.cache_expiry": "86400", "bls.revision_window": "12"
+        }
+        self._old = {key: options[key] for key in config}
+        for (key, val) in config.items():
+            section, name = key.split(".")
+            options.set_config(section, name, val, write=False)
+
+    def tearDown(self):
+        for (key, val) in self._old.items():
+            section, name = key.split(".")
+            options.set_config(section, name, val, write=False)
+        shutil.rmtree(self.dir)
+
+    def _requests(self, b):
+        # concurrent requests may be sent in any order
+        return sorted(
+            [(c["seriesid"], c["startyear"], c["endyear"])
+             for c in b.sess.calls],
+            key=lambda r: r[1]
+        )
+
+    def _years(self, b):
+        return [(start, end) for (_, start, end) in self._requests(b)]
+
+    def test_reuse(self):
+        b = _client()
+        want = b.get(["S1", "S2"], 1990, 2010, nice_names=False)
+        self.assertEqual(self._years(b), [(1990, 2009), (2010, 2010)])
+
+        b = _client()
+        have = b.get(["S1", "S2"], 1990, 2010, nice_names=False)
+        self.assertEqual(b.sess.calls, [])
+        pd.testing.assert_frame_equal(have, want)
+
+        # only the missing years and series are requested, in one request
+        # since they fit in 20 years
+        b = _client()
+        have = b.get(["S1", "S2", "S3"], 1995, 2012, nice_names=False)
+        self.assertEqual(
+            self._requests(b),
+            [(["S1", "S2", "S3"], 1995, 2012)]
+        )
+        # S1 and S2 miss 1970-1989 and S3 1970-1994: two requests
+        # instead of three
+        b = _client()
+        b.get(["S1", "S2", "S3"], 1970, 2012, nice_names=False)
+        self.assertEqual(
+            self._requests(b),
+            [(["S1", "S2", "S3"], 1970, 1989),
+             (["S1", "S2", "S3"], 1990, 1994)]
+        )
+        options.set_config("bls", "cache", "False", write=False)
+        want = _client().get(["S1", "S2", "S3"], 1995, 2012, nice_names=False)
+        pd.testing.assert_frame_equal(have, want)
+
+    def test_titles(self):
+        b = _client()
+        b.get(["S1"], 2000, 2001, nice_names=False)
+        # the titles weren't requested the first time
+        df = b.get(["S1"], 2000, 2001, nice_names=True)
+        self.assertEqual(len(b.sess.calls), 2)
+        self.assertEqual(set(df["variable"]), {"Title of S1"})
+
+        df = b.get(["S1"], 2000, 2001, nice_names=True)
+        self.assertEqual(len(b.sess.calls), 2)
+        self.assertEqual(set(df["variable"]), {"Title of S1"})
+
+    def test_expiry(self):
+        now = datetime.datetime.now().year
+        b = _client()
+        b.get(["S1"], now - 5, now, nice_names=False)
+        b.get(["S1"], now - 5, now, nice_names=False)
+        self.assertEqual(len(b.sess.calls), 1)
+
+        # recent years are requested again once they expire
+        options.set_config("bls", "cache_expiry", "0", write=False)
+        b.get(["S1"], now - 5, now, nice_names=False)
+        self.assertEqual(self._years(b)[1][1], now)
+        self.assertGreaterEqual(self._years(b)[1][0], now - 1)
+
+
+class TestCatalog(unittest.TestCase):
+
+    def test_saved_titles(self):
+        b = _client()
+        want = b.get(["C1", "C2"], 2000, 2001)
+        self.assertEqual(set(want["variable"]), {"Title of C1", "Title of C2"})
+
+        # the titles are known, so the catalog isn't requested again
+        have = b.get(["C1", "C2"], 2000, 2001)
+        self.assertEqual([c["catalog"] for c in b.sess.calls], [True, False])
+        pd.testing.assert_frame_equal(have, want)
+
+        # ... unless a series of the request has no saved title
+        df = b.get(["C1", "C3"], 2000, 2001)
+        self.assertTrue(b.sess.calls[-1]["catalog"])
+        self.assertEqual(set(df["variable"]), {"Title of C1", "Title of C3"})
+
+        catalog = get_catalog(options["PATHS.data"])
+        self.assertEqual(
+            catalog.get(["C3", "C4"]), {"C3": dict(series_title="Title of C3")}
+        )
+        # one connection to bls.sqlite for the catalog and the cache
+        cache = get_cache(options["PATHS.data"])
+        self.assertIs(catalog._connect(), cache._connect())
+
+    def test_ids(self):
+        b = _client()
+        b.get(["C5"], 2000, 2001, nice_names=False)
+        self.assertFalse(b.sess.calls[0]["catalog"])
+        self.assertEqual(
+            get_catalog(options["PATHS.data"]).titles(["C5"]), {}
+        )
+
+
+class TestPlan(unittest.TestCase):
+
+    def test_merge(self):
+        b = _client()
+        plan = b.plan(nice_names=False)
+        series = ["S{:03d}".format(i) for i in range(60)]
+        first = plan.add(series[:30], 2000, 2010)
+        second = plan.add(series[20:], 2005, 2017)
+        plan.add(series[:5], 1960, 1970)
+
+        # 5 series over 1960-1970 and 60 distinct series over 2000-2017
+        self.assertEqual(
+            [(len(s), start, end) for (s, start, end) in plan.requests],
+            [(5, 1960, 1970), (50, 2000, 2017), (10, 2000, 2017)]
+        )
+        summary = plan.summary()
+        self.assertEqual(summary["queries"], 3)
+        self.assertEqual(summary["series"], 60)
+        self.assertEqual(summary["requests"], 3)
+        self.assertEqual(b.sess.calls, [])
+
+        dfs = plan.run()
+        self.assertEqual(len(b.sess.calls), 3)
+        want = _client().get(series[20:], 2005, 2017, nice_names=False)
+        pd.testing.assert_frame_equal(dfs[second], want)
+        self.assertEqual(dfs[first].shape, (30 * 11 * 12, 3))
+
+
+class TestQuota(unittest.TestCase):
+
+    def setUp(self):
+        self._old = options["bls.daily_limit"]
+
+    def tearDown(self):
+        options.set_config("bls", "daily_limit", self._old, write=False)
+
+    def test_limit(self):
+        b = _client()
+        b.key = "1" * 32
+        b.get("S1", 2000, 2001)
+        used = b.quota()["used"]
+        self.assertGreaterEqual(used, 1)
+
+        # shared with other clients using the same key
+        other = _client()
+        other.key = b.key
+        other.get("S1", 2000, 2001)
+        self.assertEqual(b.quota()["used"], used + 1)
+
+        options.set_config("bls", "daily_limit", str(used + 1), write=False)
+        self.assertEqual(b.quota()["remaining"], 0)
+        with self.assertRaises(qeds.data.util.QueryError):
+            b.get("S1", 2000, 2001)
+        self.assertEqual(len(b.sess.calls), 1)
+
+
+class TestGetGroups(unittest.TestCase):
+
+    def test_packs_requests(self):
+        b = _client()
+        groups = {
+            fips: [
+                "LASST{:02d}0000000000003".format(fips),
+                "LASST{:02d}0000000000006".format(fips),
+            ]
+            for fips in range(1, 51)
+        }
+        dfs = b.get_groups(groups, startyear=2000, endyear=2017)
+
+        # 100 series in two full requests instead of 50 small ones
+        self.assertEqual(
+            [len(body["seriesid"]) for body in b.sess.calls], [50, 50]
+        )
+        self.assertEqual(list(dfs), list(groups))
+        for (fips, df) in dfs.items():
+            self.assertEqual(set(df["variable"]), set(groups[fips]))
+            self.assertEqual(df.shape, (2 * 18 * 12, 3))
+
+    def test_shared_series(self):
+        b = _client()
+        dfs = b.get_groups(
+            {"a": ["S1", "S2"], "b": ["S2", "S3"], "c": "S3"}, 2017, 2017
+        )
+        self.assertEqual(b.sess.calls[0]["seriesid"], ["S1", "S2", "S3"])
+        self.assertEqual(set(dfs["b"]["variable"]), {"S2", "S3"})
+        self.assertEqual(set(dfs["c"]["variable"]), {"S3"})
+
+
+if __name__ == '__main__':
+    unittest.main()
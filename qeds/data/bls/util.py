@@ -1,3 +1,4 @@
+import collections
 import string
 import warnings
 from ..config import _get_option
@@ -24,6 +25,9 @@ _get_option("bls", "api_key").validator = validate_api_key
 LIMITS = {
     "years_per_query": 20,
     "series_per_query": 50,
+    # at most this many requests in any window of this many seconds
+    "requests_per_window": 50,
+    "window_seconds": 10,
 }
 
 # see https://www.bls.gov/developers/api_faqs.htm
@@ -35,3 +39,28 @@ BLS_STATUS_CODE_REASONS = {
     500: ("The server has encountered an unexpected condition, and the " +
           "request cannot be completed.")
 }
+
+
+def split_response(payload, startyear, endyear):
+    """
+    Split the JSON ``payload`` of a response to a request for
+    ``startyear`` to ``endyear`` by series and year
+
+    Returns a dict mapping ``(series, year)`` to the list of observations
+    of that year, in the order the API returned them (empty for requested
+    years without observations), and a dict mapping series to their
+    titles, for the series whose title was requested
+    """
+    observations, titles = {}, {}
+    for series in payload["Results"]["series"]:
+        sid = series["seriesID"]
+        by_year = collections.defaultdict(list)
+        for row in series["data"]:
+            by_year[int(row["year"])].append(row)
+        for year in range(startyear, endyear + 1):
+            observations[(sid, year)] = by_year[year]
+        title = series.get("catalog", {}).get("series_title")
+        if title is not None:
+            titles[sid] = title
+
+    return observations, titles
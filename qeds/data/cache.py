@@ -0,0 +1,137 @@
+"""
+An in-process, size bounded cache for the DataFrames returned by
+`qeds.data.load`
+"""
+import collections
+import threading
+
+import pandas as pd
+
+CacheInfo = collections.namedtuple(
+    "CacheInfo", ["hits", "misses", "maxsize", "currsize"]
+)
+
+
+def _copy_on_write():
+    try:
+        return bool(pd.get_option("mode.copy_on_write"))
+    except KeyError:
+        # option doesn't exist in this version of pandas
+        return False
+
+
+def _nbytes(df):
+    return int(df.memory_usage(index=True, deep=True).sum())
+
+
+class DataFrameCache(object):
+    """
+    Least recently used cache of DataFrames with a budget in bytes
+
+    Entries are keyed by tuples whose first element is the dataset name.
+    DataFrames handed out by the cache are never the cached object itself:
+    when pandas' copy-on-write mode is enabled a cheap shallow copy is
+    returned, otherwise a deep copy. Either way callers may modify the
+    result without corrupting the cache.
+
+    Parameters
+    ----------
+    maxsize : int, optional(default=0)
+        The maximum number of bytes held by the cache. A value of 0
+        disables caching
+    """
+    def __init__(self, maxsize=0):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._currsize = 0
+        self._data = collections.OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        return len(self._data)
+
+    def __contains__(self, key):
+        return key in self._data
+
+    @staticmethod
+    def _view(df):
+        return df.copy(deep=not _copy_on_write())
+
+    def get(self, key):
+        """
+        Return a copy of the DataFrame stored under ``key``, or None if
+        there is no such entry
+        """
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.misses += 1
+                return None
+
+            self._data.move_to_end(key)
+            self.hits += 1
+            return self._view(item[0])
+
+    def put(self, key, df):
+        """
+        Store ``df`` under ``key`` and return a copy of it to hand to the
+        caller. DataFrames larger than ``maxsize`` are not stored
+        """
+        nbytes = _nbytes(df)
+        if nbytes > self.maxsize:
+            return df
+
+        with self._lock:
+            self._pop(key)
+            self._data[key] = (df, nbytes)
+            self._currsize += nbytes
+            self._evict()
+
+        return self._view(df)
+
+    def _pop(self, key):
+        item = self._data.pop(key, None)
+        if item is not None:
+            self._currsize -= item[1]
+
+    def _evict(self):
+        while self._currsize > self.maxsize and len(self._data) > 0:
+            key = next(iter(self._data))
+            self._pop(key)
+
+    def resize(self, maxsize):
+        """
+        Change the budget of the cache, evicting entries if needed
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            self._evict()
+
+    def discard(self, name):
+        """
+        Remove all entries for the dataset ``name``
+        """
+        with self._lock:
+            for key in [k for k in self._data if k[0] == name]:
+                self._pop(key)
+
+    def clear(self):
+        """
+        Remove all entries and reset the hit/miss counters
+        """
+        with self._lock:
+            self._data.clear()
+            self._currsize = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        """
+        Return a `CacheInfo` tuple with the hit and miss counters and
+        the current and maximum size of the cache in bytes
+        """
+        with self._lock:
+            return CacheInfo(
+                self.hits, self.misses, self.maxsize, self._currsize
+            )
@@ -0,0 +1,103 @@
+"""
+Convert the columns of retrieved datasets to memory-compact dtypes.
+
+`compact` is applied by `qeds.data.retrieve` (and by `qeds.data.load`, to
+copies saved before it was enabled) when the ``options.compact``
+configuration option is True:
+
+- text columns with few distinct values become categoricals
+- other text columns become pyarrow-backed strings
+- integers are downcast to the smallest width that holds their values
+- floats become float32 when that doesn't change any value
+
+Named index levels are compacted like columns.
+"""
+import numpy as np
+import pandas as pd
+from pandas.api.types import infer_dtype, is_object_dtype
+
+# text columns with at most this many distinct values per row become
+# categoricals
+_CATEGORY_RATIO = 0.5
+
+
+def _arrow_strings():
+    try:
+        return pd.StringDtype("pyarrow")
+    except (ImportError, TypeError):
+        # pandas < 1.3 or no pyarrow
+        return None
+
+
+def _compact_text(values):
+    if infer_dtype(values, skipna=True) != "string":
+        # mixed types are left alone
+        return values
+    n = values.shape[0]
+    if values.nunique(dropna=True) <= _CATEGORY_RATIO * n:
+        return values.astype("category")
+    dtype = _arrow_strings()
+    return values if dtype is None else values.astype(dtype)
+
+
+def _compact_float(values):
+    small = values.astype(np.float32)
+    same = (small.astype(values.dtype) == values) | values.isna()
+    return small if same.all() else values
+
+
+def compact_column(values):
+    """
+    Return the Series ``values`` converted to its most compact dtype that
+    represents every value exactly
+    """
+    dtype = values.dtype
+    if is_object_dtype(dtype):
+        return _compact_text(values)
+    if dtype.kind in "iu":
+        return pd.to_numeric(values, downcast="integer")
+    if dtype.kind == "f" and dtype.itemsize > 4:
+        return _compact_float(values)
+    return values
+
+
+def compact(df):
+    """
+    Return a copy of ``df`` whose columns and named index levels use
+    memory-compact dtypes
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        The DataFrame to compact
+
+    Returns
+    -------
+    out : pandas.DataFrame
+        The compacted DataFrame. Values, column order and index are the
+        same as in ``df``
+
+    """
+    names = list(df.index.names)
+    named = all(n is not None for n in names)
+    if named:
+        df = df.reset_index()
+    if df.shape[1] == 0:
+        return df.copy()
+
+    # by position, so duplicated column names are kept
+    out = pd.concat(
+        [compact_column(df.iloc[:, i]) for i in range(df.shape[1])], axis=1
+    )
+    out.columns = df.columns
+    if named:
+        out.set_index(names, inplace=True)
+    return out
+
+
+def memory_usage(df):
+    """
+    Total number of bytes used by ``df``, including its index and the
+    Python objects held by object columns
+    """
+    return int(df.memory_usage(deep=True, index=True).sum())
@@ -14,9 +14,6 @@ _BASE_PATH = os.path.join(_home, ".qeds")
 CFG_FILE = os.path.join(_BASE_PATH, "config.ini")
 BASE_DATA_DIR = os.path.join(_BASE_PATH, "data")
 
-if not os.path.isdir(_BASE_PATH):
-    os.mkdir(_BASE_PATH)
-
 
 class Option:
     __slots__ = ["name", "default", "doc", "validator"]
@@ -53,6 +50,38 @@ def _member_validation(allowed):
     return func
 
 
+def _int_validation(minimum=None):
+    def func(val):
+        try:
+            val = int(val)
+        except (TypeError, ValueError):
+            msg = "Value {} not allowed. Value must be an integer"
+            raise configparser.Error(msg.format(val))
+
+        if minimum is not None and val < minimum:
+            msg = "Value {} not allowed. Value must be at least {}"
+            raise configparser.Error(msg.format(val, minimum))
+
+    return func
+
+
+_TRUE_STRINGS = ["true", "yes", "on", "1"]
+_FALSE_STRINGS = ["false", "no", "off", "0"]
+
+
+def _bool_validation(val):
+    if str(val).lower() not in _TRUE_STRINGS + _FALSE_STRINGS:
+        msg = "Value {} not allowed. Value must be True or False"
+        raise configparser.Error(msg.format(val))
+
+
+def _as_bool(val):
+    """
+    Interpret the string ``val`` from the config file as a bool
+    """
+    return str(val).lower() in _TRUE_STRINGS
+
+
 # dict holding all config options. Maps from vconf section name to a list of
 # options
 _valid_options = {
@@ -75,7 +104,43 @@ _valid_options = {
             "file_format",
             "csv",
             "File format for saving loaded data",
-            _member_validation(["pkl", "csv", "feather"])
+            _member_validation(["pkl", "csv", "feather", "parquet"])
+        ),
+        Option(
+            "compression",
+            "none",
+            """Codec used to compress saved data. csv and pkl files are\
+            compressed as a whole (adding .gz, .lz4 or .zst to the file\
+            name), feather and parquet files with the format's own\
+            compression. feather doesn't support gzip. With none, parquet\
+            files keep their default snappy compression""",
+            _member_validation(["none", "gzip", "lz4", "zstd"])
+        ),
+        Option(
+            "cache_size",
+            "0",
+            """Maximum number of bytes of DataFrames kept in memory by\
+            `load` so repeated loads skip reading from disk. 0 disables\
+            the cache""",
+            _int_validation(0)
+        ),
+        Option(
+            "memory_map",
+            "False",
+            """Whether `load` memory maps feather files instead of copying\
+            them into memory. Processes loading the same file then share\
+            its pages. The numeric and date columns of the result are then\
+            read-only; call .copy() on it before modifying it in place""",
+            _bool_validation
+        ),
+        Option(
+            "compact",
+            "False",
+            """Whether retrieved datasets are converted to memory-compact\
+            dtypes: categoricals for repetitive text, pyarrow strings for\
+            other text and the smallest integer and float types that hold\
+            the values. See `qeds.data.memory_report`""",
+            _bool_validation
         ),
         Option(
             "log_level",
@@ -132,6 +197,53 @@ _valid_options = {
             "https://api.bls.gov/publicAPI/v2/timeseries/data/",
             "URL through which to access the BLS API",
             _no_validation
+        ),
+        Option(
+            "concurrency",
+            "4",
+            """Maximum number of requests that `BLSData.get` sends to the\
+            BLS API at the same time""",
+            _int_validation(1)
+        ),
+        Option(
+            "daily_limit",
+            "500",
+            """Number of requests the BLS API allows per API key and day.\
+            `BLSData` stops making requests once this many were made\
+            today""",
+            _int_validation(0)
+        ),
+        Option(
+            "cache",
+            "False",
+            """Whether `BLSData.get` saves the observations it receives on\
+            your computer and reuses them in later queries""",
+            _bool_validation
+        ),
+        Option(
+            "cache_expiry",
+            "86400",
+            """Number of seconds after which saved BLS observations of\
+            years that may still be revised (see revision_window) are\
+            requested again""",
+            _int_validation(0)
+        ),
+        Option(
+            "revision_window",
+            "12",
+            """Number of months before the last one saved that `refresh`\
+            downloads again when it updates a BLS dataset, because BLS\
+            revises recent estimates. Saved BLS observations (see cache)\
+            of the years in this window expire""",
+            _int_validation(0)
+        ),
+        Option(
+            "flat_files",
+            None,
+            """Directory with a local mirror of the BLS flat files at\
+            https://download.bls.gov/pub/time.series/, read by\
+            `BLSFlatFiles`""",
+            _no_validation
         )
     ],
     "socrata": [
@@ -204,13 +316,15 @@ class _DictOptions(object):
         self.load_config()
 
     def load_config(self):
-        if os.path.exists(CFG_FILE):
+        changed = not os.path.exists(CFG_FILE)
+        if not changed:
             self.vconf.read(CFG_FILE)
 
         # add defaults to config
         for (sec, opts) in _valid_options.items():
             if not self.vconf.has_section(sec):
                 self.vconf.add_section(sec)
+                changed = True
 
             for o in opts:
                 if self.vconf.has_option(sec, o.name):
@@ -218,9 +332,12 @@ class _DictOptions(object):
                 # vconf doesn't have option, write one if we have a default
                 if o.default is not None:
                     self.vconf.set(sec, o.name, o.default)
+                    changed = True
 
-        # save updated config
-        self.write_config()
+        # save updated config, but only when it has new entries so that
+        # importing qeds doesn't rewrite the file every time
+        if changed:
+            self.write_config()
 
     def validate_config(self, warn=True):
         """
@@ -244,6 +361,8 @@ class _DictOptions(object):
                     _opt.validator(value)
 
     def write_config(self):
+        if not os.path.isdir(os.path.dirname(CFG_FILE)):
+            os.makedirs(os.path.dirname(CFG_FILE))
         with open(CFG_FILE, "w") as config_file:
             self.vconf.write(config_file)
 
@@ -267,7 +386,7 @@ class _DictOptions(object):
             updating the value
         """
         _validate_config_setting(section, name, value)
-        self.vconf.set(section, name, value)
+        self.vconf.set(section, name, str(value))
 
         if write:
             self.write_config()
@@ -0,0 +1,254 @@
+"""
+Helpers for downloading the files behind the datasets and for checking
+whether they changed upstream since they were downloaded.
+
+Retrievers that use `fetch` or `download` return the ``source``
+description (url, ``ETag`` and ``Last-Modified`` headers and the sha256
+checksum of the content) in their metadata. `unchanged` later uses it to
+ask the server for the file only if it was modified, so an unchanged file
+costs a single ``304 Not Modified`` response instead of a full download.
+
+`fetch` holds the whole file in memory. `download` streams large files to
+disk instead and resumes interrupted downloads with HTTP range requests.
+"""
+import hashlib
+import json
+import os
+import time
+
+import requests
+
+from .config import setup_logger
+
+LOGGER = setup_logger(__name__)
+
+# seconds to wait for the server to respond
+TIMEOUT = 60
+
+# bytes read from the network at a time. Bytes of an unfinished chunk are
+# lost when the connection fails, so this is kept small
+CHUNK_SIZE = 64 * 1024
+
+# seconds to wait before the second retry of a download, and added for
+# every retry after that
+_RETRY_WAIT = 1
+
+# errors after which a download is resumed
+_RETRY_ERRORS = (
+    requests.exceptions.ConnectionError,
+    requests.exceptions.ChunkedEncodingError,
+    requests.exceptions.Timeout,
+)
+
+
+def _source(url, response, sha256):
+    return dict(
+        url=url,
+        etag=response.headers.get("ETag"),
+        last_modified=response.headers.get("Last-Modified"),
+        sha256=sha256,
+    )
+
+
+def fetch(url, timeout=TIMEOUT):
+    """
+    Download ``url``
+
+    Parameters
+    ----------
+    url : string
+        The url of the file
+
+    timeout : float, optional(default=60)
+        Seconds to wait for the server to respond
+
+    Returns
+    -------
+    content : bytes
+        The body of the response
+
+    source : dict
+        The ``url``, ``etag``, ``last_modified`` and ``sha256`` of the file
+    """
+    LOGGER.debug("Downloading {}".format(url))
+    res = requests.get(url, timeout=timeout)
+    res.raise_for_status()
+    sha256 = hashlib.sha256(res.content).hexdigest()
+    return res.content, _source(url, res, sha256)
+
+
+def unchanged(source, timeout=TIMEOUT):
+    """
+    Check whether the file described by ``source`` (as returned by
+    `fetch`) is unchanged upstream, using a conditional request
+
+    Returns False when the server has no validators for the file or
+    doesn't support conditional requests
+    """
+    headers = {}
+    if source.get("etag"):
+        headers["If-None-Match"] = source["etag"]
+    if source.get("last_modified"):
+        headers["If-Modified-Since"] = source["last_modified"]
+    if len(headers) == 0:
+        return False
+
+    # stream so that we don't download the body if the file did change
+    with requests.get(
+            source["url"], headers=headers, stream=True, timeout=timeout
+    ) as res:
+        LOGGER.debug("Conditional request for {} returned {}".format(
+            source["url"], res.status_code
+        ))
+        return res.status_code == 304
+
+
+def _sha256(fn, chunk_size=1024 * 1024):
+    h = hashlib.sha256()
+    with open(fn, "rb") as f:
+        for block in iter(lambda: f.read(chunk_size), b""):
+            h.update(block)
+    return h.hexdigest()
+
+
+def _read_state(fn, url):
+    # validators of the partial download in ``fn``, if it is for ``url``
+    try:
+        with open(fn) as f:
+            state = json.load(f)
+    except (OSError, ValueError):
+        return None
+    return state if state.get("url") == url else None
+
+
+def _write_state(fn, state):
+    with open(fn, "w") as f:
+        json.dump(state, f)
+
+
+def _remove(*fns):
+    for fn in fns:
+        if os.path.exists(fn):
+            os.remove(fn)
+
+
+def _download_once(url, part, state, timeout, chunk_size):
+    """
+    Append the missing bytes of ``url`` to ``part`` (or start over if the
+    server can't resume) and return the state of the download
+    """
+    offset = os.path.getsize(part) if state and os.path.exists(part) else 0
+    # byte offsets only make sense for the body as it is stored
+    headers = {"Accept-Encoding": "identity"}
+    if offset > 0:
+        if state.get("total") == offset:
+            return state
+        headers["Range"] = "bytes={}-".format(offset)
+        validator = state.get("etag") or state.get("last_modified")
+        if validator:
+            # the server sends the whole file if it changed since
+            headers["If-Range"] = validator
+
+    with requests.get(
+            url, headers=headers, stream=True, timeout=timeout
+    ) as res:
+        if res.status_code == 416:
+            # the partial download doesn't fit the file, start over
+            _remove(part)
+            return _download_once(url, part, None, timeout, chunk_size)
+        res.raise_for_status()
+        if res.status_code == 206:
+            LOGGER.debug("Resuming {} at byte {}".format(url, offset))
+            mode = "ab"
+        else:
+            mode = "wb"
+            total = res.headers.get("Content-Length")
+            state = dict(
+                url=url,
+                etag=res.headers.get("ETag"),
+                last_modified=res.headers.get("Last-Modified"),
+                total=int(total) if total is not None else None,
+            )
+            _write_state(part + ".json", state)
+
+        with open(part, mode) as f:
+            for block in res.iter_content(chunk_size):
+                f.write(block)
+
+    return state
+
+
+def download(url, fn, sha256=None, timeout=TIMEOUT, retries=5,
+             chunk_size=CHUNK_SIZE):
+    """
+    Stream ``url`` to the file ``fn``
+
+    The data is written to ``fn + ".part"`` as it arrives and only moved to
+    ``fn`` once it is complete. If the connection fails, the download is
+    resumed where it stopped with an HTTP range request (up to ``retries``
+    times). A partial download left behind by an earlier call is resumed
+    too. If the server doesn't support range requests, or the file
+    changed in the meantime, the download starts over.
+
+    Parameters
+    ----------
+    url : string
+        The url of the file
+
+    fn : string
+        Where to save the file
+
+    sha256 : string, optional(default=None)
+        The expected sha256 checksum of the file. If given and the
+        downloaded file doesn't match, the download is discarded and an
+        error raised
+
+    timeout : float, optional(default=60)
+        Seconds to wait for the server to respond
+
+    retries : int, optional(default=5)
+        How many times to resume after a failed connection
+
+    chunk_size : int, optional(default=64KB)
+        Bytes read from the network at a time
+
+    Returns
+    -------
+    source : dict
+        The ``url``, ``etag``, ``last_modified`` and ``sha256`` of the file
+    """
+    part = fn + ".part"
+    for attempt in range(retries + 1):
+        # written as soon as the server responds, so it is there even if
+        # the previous attempt failed half way
+        state = _read_state(part + ".json", url)
+        try:
+            LOGGER.debug("Downloading {} to {}".format(url, fn))
+            state = _download_once(url, part, state, timeout, chunk_size)
+            break
+        except _RETRY_ERRORS as e:
+            if attempt == retries:
+                raise
+            LOGGER.debug("Download of {} failed ({}), resuming".format(url, e))
+            time.sleep(_RETRY_WAIT * attempt)
+
+    size = os.path.getsize(part)
+    if state.get("total") is not None and size != state["total"]:
+        _remove(part, part + ".json")
+        msg = "Downloaded {} bytes of {} but expected {}"
+        raise IOError(msg.format(size, url, state["total"]))
+
+    checksum = _sha256(part)
+    if sha256 is not None and checksum != sha256:
+        _remove(part, part + ".json")
+        msg = "Checksum of {} is {} but expected {}"
+        raise IOError(msg.format(url, checksum, sha256))
+
+    os.replace(part, fn)
+    _remove(part + ".json")
+    return dict(
+        url=url,
+        etag=state.get("etag"),
+        last_modified=state.get("last_modified"),
+        sha256=checksum,
+    )
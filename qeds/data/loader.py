@@ -2,38 +2,90 @@
 This file provides the `data_read` function which reads data
 from a particular folder on the computer
 """
-import json
+import collections
+import concurrent.futures
+import contextlib
+import operator
 import os
+import shutil
+import threading
+import time
+import warnings
+import numpy as np
 import pandas as pd
-from .config import options, setup_logger
+from pandas.api.extensions import ExtensionDtype
+from pandas.api.types import (
+    CategoricalDtype, infer_dtype, is_datetime64_any_dtype, is_object_dtype,
+    pandas_dtype
+)
+from .cache import DataFrameCache
+from .compact import compact, memory_usage
+from .config import options, setup_logger, _as_bool
+from .metadata import get_store
+from .partition import _coerce, partition_files, write_partitioned
+from .registry import get_retriever, get_spec, get_updater, specs
 from .util import _ensure_dir
 
 LOGGER = setup_logger(__name__)
 
-_ensure_dir(options["PATHS.data"])
+_CACHE = DataFrameCache()
 
-_METADATA_FN = os.path.join(options["PATHS.data"], "metadata.json")
-if not os.path.isfile(_METADATA_FN):
-    with open(_METADATA_FN, "w") as f:
-        json.dump(dict(), f)
+# One lock per dataset so that threads needing the same dataset (directly
+# or as a dependency of another one) retrieve it only once
+_LOCKS = collections.defaultdict(threading.RLock)
+_LOCKS_LOCK = threading.Lock()
 
 
-def _update_metadata(name, metadata):
-    with open(_METADATA_FN, "r") as f:
-        current = json.load(f)
+def _dataset_lock(name):
+    with _LOCKS_LOCK:
+        return _LOCKS[name]
+
+
+@contextlib.contextmanager
+def _atomic_path(fn):
+    """
+    Yield a temporary path next to ``fn`` and move it over ``fn`` once the
+    block completes, so readers never see a partially written file
+    """
+    tmp = "{}.{}-{}.tmp".format(fn, os.getpid(), threading.get_ident())
+    try:
+        yield tmp
+        if os.path.isdir(tmp) or os.path.isdir(fn):
+            _replace_dir(tmp, fn)
+        else:
+            os.replace(tmp, fn)
+    finally:
+        _remove(tmp)
+
+
+def _replace_dir(src, dst):
+    # A directory can't replace an existing directory (or file) in one
+    # step, so move the old one aside first and delete it afterwards
+    old = "{}.{}-{}.old".format(dst, os.getpid(), threading.get_ident())
+    if os.path.exists(dst):
+        os.replace(dst, old)
+    os.replace(src, dst)
+    _remove(old)
+
+
+def _remove(path):
+    if os.path.isdir(path):
+        shutil.rmtree(path)
+    elif os.path.exists(path):
+        os.remove(path)
 
-    current[name] = metadata
-    with open(_METADATA_FN, "w") as f:
-        json.dump(current, f)
 
-    return current
+def _get_store():
+    return get_store(options["PATHS.data"])
+
+
+def _update_metadata(name, metadata):
+    return _get_store().set(name, metadata)
 
 
 def _get_metadata(name):
-    with open(_METADATA_FN, "r") as f:
-        current = json.load(f)
+    return _get_store().get(name)
 
-    return current.get(name, dict())
 
 def _remove_old_index(df):
     if "Unnamed: 0" in df.columns:
@@ -42,46 +94,837 @@ def _remove_old_index(df):
     return df
 
 
-def load(name, kwargs={}):
+# Comparison operators understood by the ``filters`` argument of ``load``.
+# These mirror the operators accepted by ``pyarrow.parquet.read_table``
+_FILTER_OPS = {
+    "=": operator.eq,
+    "==": operator.eq,
+    "!=": operator.ne,
+    "<": operator.lt,
+    "<=": operator.le,
+    ">": operator.gt,
+    ">=": operator.ge,
+    "in": lambda x, val: x.isin(val),
+    "not in": lambda x, val: ~x.isin(val),
+}
+
+# Number of rows per parquet row group. Smaller groups let filters skip
+# more data at the cost of a slightly larger file
+_PARQUET_ROW_GROUP_SIZE = 100000
+
+# Number of rows per record batch of compressed feather files. Each batch
+# is decompressed as a whole, which bounds the memory of chunked reads
+_FEATHER_BATCH_SIZE = 65536
+
+
+# Datetimes are written to csv files in a fixed format so `load` can parse
+# them without inferring the format
+_CSV_DATE_FORMAT = "%Y-%m-%d %H:%M:%S"
+_CSV_DATE_FORMAT_FRACTIONAL = "%Y-%m-%d %H:%M:%S.%f"
+
+
+# csv and pickle files are compressed as a whole, with the codec recorded
+# in the file name. feather and parquet files compress their own pages
+_STREAM_FORMATS = ["csv", "pkl"]
+_CODEC_SUFFIX = {"gzip": "gz", "lz4": "lz4", "zstd": "zst"}
+
+
+def _codec():
+    codec = options["options.compression"]
+    return None if codec == "none" else codec
+
+
+def _check_codec(extension):
+    # checked before a dataset is downloaded, not once it is written
+    if extension == "feather" and _codec() == "gzip":
+        msg = "feather files can't be compressed with gzip. Use lz4 or zstd"
+        raise ValueError(msg)
+
+
+def _file_name(base, extension):
+    fn = base + "." + extension
+    codec = _codec()
+    if extension in _STREAM_FORMATS and codec is not None:
+        fn += "." + _CODEC_SUFFIX[codec]
+    return fn
+
+
+def _cache_path(name, extension=None):
+    if extension is None:
+        extension = _file_format(name)
+    return _file_name(os.path.join(options["PATHS.data"], name), extension)
+
+
+def _saved_path(name, extension=None):
+    """
+    Path of the saved copy of ``name``: the one for the configured codec
+    or, if ``options.compression`` changed since it was retrieved, the one
+    written with another codec
+    """
+    if extension is None:
+        extension = _file_format(name)
+    fn = _cache_path(name, extension)
+    if not os.path.exists(fn):
+        for other in _cache_variants(name, extension):
+            if os.path.exists(other):
+                return other
+    return fn
+
+
+def _cache_variants(name, extension):
+    base = os.path.join(options["PATHS.data"], name) + "." + extension
+    if extension not in _STREAM_FORMATS:
+        return [base]
+    return [base] + [base + "." + sfx for sfx in _CODEC_SUFFIX.values()]
+
+
+def _is_compressed(fn):
+    return fn.rsplit(".", 1)[-1] in _CODEC_SUFFIX.values()
+
+
+@contextlib.contextmanager
+def _open(fn):
+    # pandas can't read every codec, so pyarrow decompresses the stream
+    if not _is_compressed(fn):
+        yield fn
+        return
+
+    import pyarrow as pa
+
+    with pa.input_stream(fn, compression="detect") as f:
+        yield f
+
+
+def _reset_named_index(df):
+    # Columnar formats can't store an index, so we write any named index
+    # levels as regular columns and let `load` restore them from metadata
+    if any(n is not None for n in df.index.names):
+        return df.reset_index()
+    return df.reset_index(drop=True)
+
+
+def _dtype_name(dtype):
+    # str() of every string dtype is "string", whatever its storage
+    if isinstance(dtype, pd.StringDtype):
+        return "string[{}]".format(dtype.storage)
+    return str(dtype)
+
+
+def _schema(df):
+    """
+    Describe the dtypes of the columns (and named index levels) of ``df``
+    so that text formats can be read back without inferring them
+    """
+    items = []
+    if any(n is not None for n in df.index.names):
+        items += [
+            (n, df.index.get_level_values(i))
+            for (i, n) in enumerate(df.index.names)
+        ]
+    items += list(df.items())
+
+    dtypes, categories = {}, {}
+    fractional = False
+    columns = [col for (col, _) in items]
+    for (col, values) in items:
+        dtype = values.dtype
+        if isinstance(dtype, CategoricalDtype):
+            cats = dtype.categories
+            if is_datetime64_any_dtype(cats):
+                # can't be represented in json; let the reader infer it
+                continue
+            categories[col] = dict(
+                categories=cats.tolist(), ordered=bool(dtype.ordered)
+            )
+        elif is_object_dtype(dtype):
+            # only columns holding nothing but strings can be read back
+            # as strings. Others (e.g. mixed numbers) are left to the reader
+            if infer_dtype(values, skipna=True) not in ["string", "empty"]:
+                continue
+        elif is_datetime64_any_dtype(dtype) and not fractional:
+            stamps = pd.DatetimeIndex(values).dropna()
+            fractional = bool((stamps.microsecond != 0).any())
+        dtypes[col] = _dtype_name(dtype)
+
+    date_format = _CSV_DATE_FORMAT_FRACTIONAL if fractional else \
+        _CSV_DATE_FORMAT
+    return dict(
+        columns=columns, dtypes=dtypes, categories=categories,
+        date_format=date_format
+    )
+
+
+def _csv_kwargs(meta, read_cols, kwargs):
+    """
+    Build the keyword arguments for `pd.read_csv`: the dtypes recorded in
+    the dataset's schema (if any), the columns to read and the user's
+    ``kwargs``, which take precedence
+    """
+    out = dict()
+    schema = meta.get("schema")
+    if schema:
+        dtype = {}
+        for (col, dt) in schema["dtypes"].items():
+            if read_cols is not None and col not in read_cols:
+                continue
+            if col in schema["categories"]:
+                dtype[col] = CategoricalDtype(**schema["categories"][col])
+            elif dt.startswith("datetime64"):
+                # read as text and parsed with the known format later
+                dtype[col] = object
+            elif dt.startswith(("timedelta64", "period", "interval")):
+                continue
+            else:
+                dtype[col] = dt
+        out["dtype"] = dtype
+
+    if read_cols is not None:
+        out["usecols"] = read_cols
+
+    out.update(kwargs)
+    return out
+
+
+def _arrow_csv_options(schema, read_cols):
+    """
+    Build pyarrow csv `ConvertOptions` that read the columns described by
+    ``schema`` straight into their recorded types, with datetimes parsed
+    by pyarrow's ISO 8601 parser
+    """
+    import pyarrow as pa
+    from pyarrow import csv
+
+    include = schema["columns"] if read_cols is None else read_cols
+    types = {}
+    for col in include:
+        dt = schema["dtypes"].get(col)
+        if dt is None:
+            continue
+        if col in schema["categories"]:
+            cats = schema["categories"][col]["categories"]
+            if len(cats) > 0:
+                types[col] = pa.array(cats).type
+        elif dt == "datetime64[ns]":
+            types[col] = pa.timestamp("ns")
+        elif dt.startswith(("datetime64", "string")) or dt == "object":
+            types[col] = pa.string()
+        else:
+            try:
+                # nullable extension types (Int64, boolean, ...) are read
+                # as their numpy counterpart and converted afterwards
+                np_dtype = np.dtype(dt.lower().replace("boolean", "bool"))
+            except TypeError:
+                continue
+            if np_dtype.kind in "biuf":
+                types[col] = pa.from_numpy_dtype(np_dtype)
+            else:
+                # pyarrow can't parse the text pandas writes for other
+                # types (timedeltas, complex numbers, ...), so they are
+                # read as text and converted by `_apply_schema`
+                types[col] = pa.string()
+
+    return csv.ConvertOptions(
+        column_types=types, include_columns=include,
+        timestamp_parsers=[csv.ISO8601], strings_can_be_null=True
+    )
+
+
+def _use_arrow_csv(meta, kwargs):
+    # pyarrow can only be used when we know the columns and the caller
+    # didn't ask for pandas specific options
+    return "columns" in meta.get("schema", {}) and len(kwargs) == 0
+
+
+def _read_csv(fn, meta, read_cols, kwargs):
+    if _use_arrow_csv(meta, kwargs):
+        from pyarrow import csv
+
+        convert = _arrow_csv_options(meta["schema"], read_cols)
+        return csv.read_csv(fn, convert_options=convert).to_pandas()
+
+    with _open(fn) as src:
+        return pd.read_csv(src, **_csv_kwargs(meta, read_cols, kwargs))
+
+
+def _to_feather(df, fn, **kwargs):
+    # One uncompressed record batch lets `_read_feather_mapped` hand out
+    # the pages of the file without copying or concatenating them.
+    # Compressed files can't be shared that way, so they are split into
+    # batches that `_feather_batches` decompresses one at a time
+    kwargs = dict({"compression": "uncompressed"}, **kwargs)
+    if kwargs["compression"] == "uncompressed":
+        kwargs.setdefault("chunksize", max(len(df), 1))
+    else:
+        kwargs.setdefault("chunksize", _FEATHER_BATCH_SIZE)
+    df.to_feather(fn, **kwargs)
+
+
+def _read_feather_mapped(fn, columns=None):
+    # Columns of fixed width types without missing values are views of the
+    # memory mapped file, so their pages are shared between processes and
+    # only become resident once they are touched. Other columns (strings,
+    # columns with nulls) are converted as usual, and compressed files are
+    # decompressed into memory
+    from pyarrow import feather
+
+    table = feather.read_table(fn, columns=columns, memory_map=True)
+    return table.to_pandas(split_blocks=True)
+
+
+def _normalize_filters(filters):
+    """
+    Convert ``filters`` to disjunctive normal form: a list of lists of
+    ``(column, op, value)`` tuples
+    """
+    if not filters:
+        return []
+
+    if isinstance(filters[0][0], str):
+        filters = [filters]
+
+    out = []
+    for conjunction in filters:
+        clauses = []
+        for clause in conjunction:
+            if len(clause) != 3 or clause[1] not in _FILTER_OPS:
+                msg = "Invalid filter {}. Filters must have the form "
+                msg += "(column, op, value) with op one of {}"
+                raise ValueError(msg.format(clause, list(_FILTER_OPS)))
+            clauses.append(tuple(clause))
+        out.append(clauses)
+
+    return out
+
+
+def _filter_columns(filters):
+    return list(dict.fromkeys(c[0] for conj in filters for c in conj))
+
+
+def _apply_filters(df, filters):
+    """
+    Keep the rows of ``df`` that satisfy ``filters``. Filters may refer to
+    columns or to levels of the index
+    """
+    if not filters:
+        return df
+
+    mask = None
+    for conjunction in filters:
+        conj_mask = None
+        for (col, op, val) in conjunction:
+            if col in df.columns:
+                x = df[col]
+            else:
+                x = pd.Series(df.index.get_level_values(col), index=df.index)
+            m = _FILTER_OPS[op](x, val).values
+            conj_mask = m if conj_mask is None else conj_mask & m
+        mask = conj_mask if mask is None else mask | conj_mask
+
+    return df.loc[mask]
+
+
+def _parquet_filters(fn, filters):
+    # pyarrow does not compare timestamp columns against strings, so convert
+    # string values for those columns the way pandas would
+    import pyarrow.parquet as pq
+
+    schema = pq.read_schema(fn)
+
+    def _is_timestamp(col):
+        return col in schema.names and \
+            str(schema.field(col).type).startswith("timestamp")
+
+    return [
+        [(col, op, _coerce(val) if _is_timestamp(col) else val)
+         for (col, op, val) in conj]
+        for conj in filters
+    ]
+
+
+def _cache_key(name, fn, extension, kwargs, columns, filters):
+    # The modification time and size of the file are part of the key, so
+    # entries are invalidated as soon as the file on disk changes
+    st = os.stat(fn)
+    return (
+        name, fn, st.st_mtime_ns, st.st_size, extension,
+        repr(sorted(kwargs.items())), repr(columns), repr(filters),
+        options["options.compact"]
+    )
+
+
+def cache_info():
+    """
+    Report statistics for the in-process cache used by `load`
+
+    Returns
+    -------
+    info : CacheInfo
+        A named tuple with the number of ``hits`` and ``misses`` and the
+        ``maxsize`` and ``currsize`` of the cache in bytes. The size of
+        the cache is set by the ``options.cache_size`` configuration option
+    """
+    _CACHE.resize(int(options["options.cache_size"]))
+    return _CACHE.info()
+
+
+def clear_cache():
+    """
+    Remove all DataFrames from the in-process cache used by `load`
+    """
+    _CACHE.clear()
+
+
+def memory_report(names=None):
+    """
+    Report how much memory compaction saved for each dataset retrieved
+    with the ``options.compact`` configuration option set
+
+    Parameters
+    ----------
+    names : list(string), optional(default=None)
+        The datasets to report on. If None, every dataset on your computer
+        that was compacted when it was retrieved
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        One row per dataset with the number of bytes used by the
+        retrieved DataFrame ``before`` and ``after`` compaction and the
+        ``ratio`` between the two
+
+    """
+    if names is None:
+        names = available()
+    rows = []
+    for name in names:
+        memory = _get_metadata(name).get("memory")
+        if memory is not None:
+            rows.append(dict(name=name, **memory))
+
+    report = pd.DataFrame(rows, columns=["name", "before", "after"])
+    report["ratio"] = report["before"] / report["after"]
+    return report.set_index("name")
+
+
+def load(name, kwargs={}, columns=None, filters=None, memory_map=None,
+         chunksize=None, max_age=None):
+    """
+    Load a dataset from your computer. If the dataset has not been saved
+    locally yet, it is first obtained using `retrieve`
+
+    Parameters
+    ----------
+    name : string
+        The name of the dataset. See `available` for a list of options
+
+    kwargs : dict, optional(default={})
+        Additional keyword arguments passed to the pandas reader
+
+    columns : list(string), optional(default=None)
+        Only load these columns. Index columns listed in the dataset
+        metadata are always loaded. For the parquet format only the
+        requested columns are read from disk
+
+    filters : list(tuple) or list(list(tuple)), optional(default=None)
+        Only keep rows satisfying these predicates. Each predicate has the
+        form ``(column, op, value)``, where ``op`` is one of ``=``, ``==``,
+        ``!=``, ``<``, ``<=``, ``>``, ``>=``, ``in`` or ``not in``. The
+        predicates in a list are combined with "and", and a list of such
+        lists is combined with "or". For the parquet format the filters are
+        pushed down to the reader, so row groups that can not match are
+        never decoded. Datasets saved in partitions (see
+        `qeds.data.partition`) only read the partitions that can match
+
+    memory_map : bool, optional(default=None)
+        Memory map the cached file instead of reading it into memory. This
+        only applies to the feather format, for datasets that aren't saved
+        in partitions. Numeric and date columns of the
+        result then share the operating system's page cache with every
+        other process that maps the same file. Those columns are read-only
+        views of the file: assigning to them (e.g. ``df.loc[0, "A"] = 5``)
+        raises ``ValueError: assignment destination is read-only``, so
+        call ``df.copy()`` before modifying the result in place. If None,
+        the value of the ``options.memory_map`` configuration option is
+        used
+
+    chunksize : int, optional(default=None)
+        If given, return an iterator of DataFrames instead of a single
+        DataFrame. Each chunk holds at most ``chunksize`` rows and has the
+        dataset's index and date columns applied, so memory use is bounded
+        by the chunk size rather than the size of the dataset (except for
+        the pkl format, which can only be read as a whole). Compressed
+        feather files are decompressed one record batch of 65536 rows at
+        a time, so their memory use is bounded by the larger of the two
+        sizes. Datasets saved in partitions are streamed one partition
+        after the other
+
+    max_age : float, optional(default=None)
+        The maximum age in seconds of the copy of the dataset saved on
+        your computer. Older copies are refreshed (see `refresh`) before
+        loading. If None, the freshness policy of the dataset is used:
+        most datasets never expire, while ones that change upstream are
+        refreshed after a fixed time. If the refresh fails, a warning is
+        issued and the saved copy is used
+
+    Returns
+    -------
+    df : pandas.DataFrame or iterator(pandas.DataFrame)
+        The requested data
+
+    Notes
+    -----
+    When the ``options.cache_size`` configuration option is positive, the
+    DataFrames returned by `load` are kept in memory (up to that many
+    bytes) and later calls for the same dataset return a copy of the
+    cached result instead of reading from disk. See `cache_info`.
+
+    When the ``options.compact`` configuration option is True, text,
+    integer and float columns are converted to memory-compact dtypes (see
+    `qeds.data.compact`). Datasets retrieved with the option set are saved
+    that way; others are compacted each time they are loaded, except when
+    they are read in chunks.
+
+    """
     # Create the file name that corresponds to where this file
     # should be stored
-    EXTENSION = options["options.file_format"]
-    fn = os.path.join(options["PATHS.data"], name) + "." + EXTENSION
+    EXTENSION = _file_format(name)
+    fn = _saved_path(name, EXTENSION)
+    filters = _normalize_filters(filters)
+    if memory_map is None:
+        memory_map = _as_bool(options["options.memory_map"])
+    memory_map = memory_map and EXTENSION == "feather"
+
+    if not os.path.exists(fn):
+        with _dataset_lock(name):
+            # another thread may have retrieved it while we waited
+            if not os.path.exists(fn):
+                df = retrieve(name)
+                if columns is None and not filters and chunksize is None:
+                    return df
+    elif _is_stale(name, fn, max_age):
+        _refresh_stale(name, fn, max_age)
+    # a new copy is written with the configured codec, which may not be
+    # the one of the copy found above (that one is then removed)
+    fn = _saved_path(name, EXTENSION)
+
+    # partitions are concatenated, which copies them anyway
+    memory_map = memory_map and not os.path.isdir(fn)
 
-    def _update_using_meta(df):
-        meta = _get_metadata(name)
-        for col in meta.get("parse_dates", []):
+    if chunksize is not None:
+        return _iter_chunks(
+            name, fn, EXTENSION, chunksize, columns, filters, kwargs
+        )
+
+    # memory mapped frames are already cheap to create and copying them
+    # into the cache would defeat the purpose
+    use_cache = int(options["options.cache_size"]) > 0 and not memory_map
+    if use_cache:
+        _CACHE.resize(int(options["options.cache_size"]))
+        key = _cache_key(name, fn, EXTENSION, kwargs, columns, filters)
+        out = _CACHE.get(key)
+        if out is not None:
+            LOGGER.debug("Loading {} from in-process cache".format(name))
+            return out
+
+    meta = _get_metadata(name)
+    read_cols = _read_columns(meta, columns, filters)
+
+    LOGGER.debug("Loading data from {}".format(fn))
+    # If it exists, read it in directly
+    if os.path.isdir(fn):
+        out = _read_partitioned(
+            fn, EXTENSION, meta, read_cols, filters, kwargs
+        )
+    else:
+        out = _read_file(
+            fn, EXTENSION, meta, read_cols, filters, kwargs, memory_map
+        )
+    if EXTENSION == "parquet":
+        # filters were applied by the reader
+        filters = None
+
+    out = _update_using_meta(out, meta, EXTENSION)
+    if os.path.isdir(fn) and len(meta.get("index", [])) > 0:
+        # partitions are read one after the other
+        out.sort_index(inplace=True)
+    out = _select(out, columns, filters)
+    if _as_bool(options["options.compact"]) and not meta.get("compacted"):
+        # saved before compaction was turned on
+        out = compact(out)
+    if use_cache:
+        out = _CACHE.put(key, out)
+
+    return out
+
+
+def _read_file(fn, extension, meta, read_cols, filters, kwargs,
+               memory_map=False):
+    """
+    Read the file ``fn``, before metadata is applied. Only the parquet
+    reader uses ``filters``; for the other formats the caller filters
+    the result
+    """
+    if extension == "csv":
+        return _read_csv(fn, meta, read_cols, kwargs)
+    elif extension == "pkl":
+        with _open(fn) as src:
+            return pd.read_pickle(src, **kwargs)
+    elif extension == "feather" and memory_map:
+        return _read_feather_mapped(fn, read_cols)
+    elif extension == "feather":
+        return pd.read_feather(fn, columns=read_cols, **kwargs)
+    elif extension == "parquet":
+        pq_filters = _parquet_filters(fn, filters) if filters else None
+        return pd.read_parquet(
+            fn, columns=read_cols, filters=pq_filters, **kwargs
+        )
+    else:
+        raise ValueError("Unknown extension type {}".format(extension))
+
+
+def _matching_partitions(path, meta, filters):
+    files = partition_files(path, meta, filters)
+    LOGGER.debug("Reading {} partitions of {}".format(len(files), path))
+    return files
+
+
+def _read_partitioned(path, extension, meta, read_cols, filters, kwargs):
+    """
+    Read the partitions of the dataset saved in the directory ``path``
+    that may hold rows satisfying ``filters``
+    """
+    files = _matching_partitions(path, meta, filters)
+    if len(files) == 0:
+        # nothing matches, but we still need the columns
+        fn = partition_files(path, meta)[0]
+        return _read_file(fn, extension, meta, read_cols, None, kwargs)[:0]
+
+    dfs = [
+        _read_file(fn, extension, meta, read_cols, filters, kwargs)
+        for fn in files
+    ]
+    # pickles keep their index; for the other formats it is restored
+    # from the metadata
+    return pd.concat(dfs, ignore_index=extension != "pkl")
+
+
+def _read_columns(meta, columns, filters):
+    # columns we need to read from disk to answer the request
+    if columns is None:
+        return None
+    extra = meta.get("index", []) + _filter_columns(filters)
+    return list(dict.fromkeys(extra + list(columns)))
+
+
+def _apply_schema(df, schema):
+    """
+    Convert the columns of ``df`` that a reader could not produce directly
+    (categoricals, nullable and timezone aware types, ...) to the dtypes
+    recorded in ``schema``
+    """
+    for (col, dt) in schema["dtypes"].items():
+        if col not in df.columns:
+            continue
+        current = df[col].dtype
+        if col in schema["categories"]:
+            want = CategoricalDtype(**schema["categories"][col])
+            if current != want:
+                df[col] = df[col].astype(want)
+        elif _dtype_name(current) == dt:
+            continue
+        elif dt == "datetime64[ns]":
+            # parse with the format the file was written with, which is
+            # much faster than letting pandas work out the format
+            df[col] = pd.to_datetime(df[col], format=schema["date_format"])
+        elif dt.startswith("datetime64"):
+            # timezone aware, written as text with its UTC offset (see
+            # `_format_aware`) and converted back to its timezone
+            tz = dt[dt.index(",") + 1:-1].strip()
+            df[col] = pd.to_datetime(df[col], utc=True).dt.tz_convert(tz)
+        elif dt.startswith("timedelta64"):
+            df[col] = pd.to_timedelta(df[col])
+        elif isinstance(pandas_dtype(dt), ExtensionDtype):
+            df[col] = df[col].astype(dt)
+
+    return df
+
+
+def _update_using_meta(df, meta, extension):
+    if meta.get("schema"):
+        df = _apply_schema(df, meta["schema"])
+
+    for col in meta.get("parse_dates", []):
+        if col in df.columns and not is_datetime64_any_dtype(df[col]):
             df[col] = pd.to_datetime(df[col])
-        if len(meta.get("index", dict())) > 0:
-            if EXTENSION in ["csv", "feather"]:
-                df.set_index(meta["index"], inplace=True)
+    if len(meta.get("index", [])) > 0:
+        if extension in ["csv", "feather", "parquet"]:
+            df.set_index(meta["index"], inplace=True)
 
-        return df
+    return df
 
-    # Check whether the file exists
-    if os.path.exists(fn):
-        LOGGER.debug("Loading data from {}".format(fn))
-        # If it exists, read it in directly
-        if EXTENSION == "csv":
-            out = _update_using_meta(pd.read_csv(fn, **kwargs))
-        elif EXTENSION == "pkl":
-            out = _update_using_meta(pd.read_pickle(fn, **kwargs))
-        elif EXTENSION == "feather":
-            out = _update_using_meta(pd.read_feather(fn, **kwargs))
 
-        else:
-            raise ValueError("Unknown extension type {}".format(EXTENSION))
+def _select(df, columns, filters):
+    df = _apply_filters(df, filters)
+    if columns is not None:
+        keep = [c for c in columns if c in df.columns]
+        if keep != list(df.columns):
+            df = df[keep]
+
+    return _remove_old_index(df)
+
+
+def _rechunk_arrow(batches, chunksize):
+    """
+    Regroup an iterable of pyarrow record batches into tables of exactly
+    ``chunksize`` rows (the last one may be shorter)
+    """
+    import pyarrow as pa
+
+    pending, nrows = [], 0
+    for batch in batches:
+        pending.append(batch)
+        nrows += batch.num_rows
+        while nrows >= chunksize:
+            table = pa.Table.from_batches(pending)
+            yield table.slice(0, chunksize)
+            rest = table.slice(chunksize)
+            pending, nrows = rest.to_batches(), rest.num_rows
+
+    if nrows > 0:
+        yield pa.Table.from_batches(pending)
+
+
+def _arrow_to_pandas(batches, chunksize):
+    # number the rows consecutively across chunks, like pd.read_csv does
+    start = 0
+    for table in _rechunk_arrow(batches, chunksize):
+        df = table.to_pandas()
+        df.index = pd.RangeIndex(start, start + df.shape[0])
+        start += df.shape[0]
+        yield df
+
+
+def _feather_batches(fn, columns):
+    """
+    Yield the record batches of the feather file ``fn`` one at a time,
+    restricted to ``columns`` (all of them if None)
+
+    The file is memory mapped, so an uncompressed batch is only read as
+    its rows are converted. Each batch of a compressed file is only
+    decompressed when it is reached, unlike with ``feather.read_table``,
+    which decompresses the whole table
+    """
+    import pyarrow as pa
+    from pyarrow import ipc
+
+    with pa.memory_map(fn) as source:
+        reader = ipc.open_file(source)
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i)
+            if columns is not None:
+                batch = pa.RecordBatch.from_arrays(
+                    [batch.column(c) for c in columns], names=columns
+                )
+            yield batch
 
-        return _remove_old_index(out)
+
+def _iter_raw_chunks(fn, extension, chunksize, meta, read_cols, filters,
+                     kwargs):
+    """
+    Yield DataFrames of at most ``chunksize`` rows from the file ``fn``,
+    before metadata is applied. Only the parquet reader uses ``filters``;
+    for the other formats the caller filters each chunk
+    """
+    if extension == "csv" and _use_arrow_csv(meta, kwargs):
+        from pyarrow import csv
+
+        convert = _arrow_csv_options(meta["schema"], read_cols)
+        reader = csv.open_csv(fn, convert_options=convert)
+        for chunk in _arrow_to_pandas(reader, chunksize):
+            yield chunk
+    elif extension == "csv":
+        kwargs = _csv_kwargs(meta, read_cols, kwargs)
+        with _open(fn) as src:
+            for chunk in pd.read_csv(src, chunksize=chunksize, **kwargs):
+                yield chunk
+    elif extension == "pkl":
+        # pickles can't be read incrementally, so this only bounds the
+        # size of the chunks handed to the caller
+        with _open(fn) as src:
+            df = pd.read_pickle(src, **kwargs)
+        for start in range(0, df.shape[0], chunksize):
+            yield df.iloc[start:(start + chunksize)]
+    elif extension == "feather":
+        batches = _feather_batches(fn, read_cols)
+        for chunk in _arrow_to_pandas(batches, chunksize):
+            yield chunk
+    elif extension == "parquet":
+        import pyarrow.dataset as ds
+
+        dataset = ds.dataset(fn, format="parquet")
+        expr = None
+        if filters:
+            expr = _filters_to_expression(_parquet_filters(fn, filters))
+        batches = dataset.to_batches(
+            columns=read_cols, filter=expr, batch_size=chunksize
+        )
+        for chunk in _arrow_to_pandas(batches, chunksize):
+            yield chunk
     else:
-        return retrieve(name)
+        raise ValueError("Unknown extension type {}".format(extension))
+
+
+def _filters_to_expression(filters):
+    import pyarrow.parquet as pq
+
+    # public since pyarrow 10
+    func = getattr(pq, "filters_to_expression", None)
+    if func is None:
+        func = pq._filters_to_expression
+    return func(filters)
+
+
+def _iter_files(files, extension, chunksize, meta, read_cols, filters,
+                kwargs):
+    for fn in files:
+        chunks = _iter_raw_chunks(
+            fn, extension, chunksize, meta, read_cols, filters, kwargs
+        )
+        for chunk in chunks:
+            yield chunk
+
+
+def _iter_chunks(name, fn, extension, chunksize, columns, filters, kwargs):
+    meta = _get_metadata(name)
+    read_cols = _read_columns(meta, columns, filters)
+    if os.path.isdir(fn):
+        files = _matching_partitions(fn, meta, filters)
+    else:
+        files = [fn]
+    chunks = _iter_files(
+        files, extension, chunksize, meta, read_cols, filters, kwargs
+    )
+    if extension == "parquet":
+        # filters were applied by the reader
+        filters = None
+
+    LOGGER.debug("Streaming data from {}".format(fn))
+    start = 0
+    for chunk in chunks:
+        chunk = _update_using_meta(chunk, meta, extension)
+        if len(files) > 1 and isinstance(chunk.index, pd.RangeIndex):
+            # keep numbering the rows across partitions
+            chunk.index = pd.RangeIndex(start, start + chunk.shape[0])
+            start += chunk.shape[0]
+        chunk = _select(chunk, columns, filters)
+        if chunk.shape[0] > 0:
+            yield chunk
 
 
 def retrieve(name, kwargs={}):
     """
-    Retrieves a dataset according to the instructions maintained in
-    another function `_data_retrieve_{name}` and saves it to your
-    computer
+    Retrieves a dataset with the retriever of its `DatasetSpec` (see
+    `qeds.data.registry`) and saves it to your computer
 
     Parameters
     ----------
@@ -94,39 +937,236 @@ def retrieve(name, kwargs={}):
     None
 
     """
-    from .retrievers import __dict__ as retrievers
+    spec = get_spec(name)
+    func = get_retriever(spec)
+    _check_codec(_file_format(name))
 
-    func_name = "_retrieve_{}".format(name)
-    func = retrievers.get(func_name, None)
-    if func is None:
-        msg = "The dataset name that you gave ({}) is not on your computer \n"
-        msg += "and can not be retrieved by our library. Are you sure \n"
-        msg += "you typed it correctly?"
-        raise ValueError(msg.format(name))
+    with _dataset_lock(name):
+        # Call retrieval function
+        df, metadata = func()
+        df = _save(name, spec, df, metadata, kwargs)
 
-    # Call retrieval function
-    df, metadata = func()
-    _update_metadata(name, metadata)
+    return df
 
-    # Save file
-    EXTENSION = options["options.file_format"]
-    fn = os.path.join(options["PATHS.data"], name + "." + EXTENSION)
+
+def _save(name, spec, df, metadata, kwargs):
+    """
+    Save ``df`` and its ``metadata`` as the copy of dataset ``name`` on
+    your computer. Returns ``df``, compacted if ``options.compact`` is set
+    """
+    _CACHE.discard(name)
+    if spec.partition_by and "partition_by" not in metadata:
+        metadata = dict(metadata, partition_by=spec.partition_by)
+    if _as_bool(options["options.compact"]):
+        before = memory_usage(df)
+        df = compact(df)
+        memory = dict(before=before, after=memory_usage(df))
+        metadata = dict(metadata, compacted=True, memory=memory)
+
+    EXTENSION = _file_format(name)
+    fn = _cache_path(name, EXTENSION)
+
+    # If the upstream file has the same checksum as the one we saved
+    # last time, the file on disk is already up to date
+    previous = _get_metadata(name).get("source", dict())
+    sha256 = metadata.get("source", dict()).get("sha256")
+    same = sha256 is not None and sha256 == previous.get("sha256")
+
+    schema = _schema(df)
+    _update_metadata(
+        name, dict(metadata, schema=schema, retrieved=time.time())
+    )
+
+    if same and os.path.exists(fn):
+        LOGGER.debug("{} is unchanged upstream".format(name))
+        return df
 
     # Check whether the folder exists and if not create it
-    if not os.path.exists(options["PATHS.data"]):
-        os.makedirs(options["PATHS.data"])
+    _ensure_dir(options["PATHS.data"])
 
     # Save data into folder
     if EXTENSION == "csv":
-        df.to_csv(fn, **kwargs)
-    elif EXTENSION == "pkl":
-        df.to_pickle(fn, **kwargs)
-    elif EXTENSION == "feather":
-        df.reset_index().to_feather(fn, **kwargs)
+        kwargs = dict({"date_format": schema["date_format"]}, **kwargs)
+    with _atomic_path(fn) as tmp:
+        if metadata.get("partition_by"):
+            _write_partitioned(
+                df, tmp, EXTENSION, kwargs, metadata["partition_by"]
+            )
+        else:
+            _write(df, tmp, EXTENSION, kwargs)
+
+    # copies written with another codec are now out of date
+    for other in _cache_variants(name, EXTENSION):
+        if other != fn:
+            _remove(other)
+
+    return df
+
+
+def _is_stale(name, fn, max_age=None):
+    """
+    Check whether the saved copy of ``name`` is older than ``max_age``
+    seconds, or than the ``ttl`` recorded by its retriever if ``max_age``
+    is None. Datasets without a ttl never expire
+    """
+    meta = _get_metadata(name)
+    ttl = meta.get("ttl") if max_age is None else max_age
+    if ttl is None:
+        return False
+
+    # datasets saved by older versions of qeds don't record this
+    retrieved = meta.get("retrieved", os.path.getmtime(fn))
+    return time.time() - retrieved > ttl
+
+
+def refresh(name, force=False):
+    """
+    Bring the copy of a dataset saved on your computer up to date
+
+    If the dataset was downloaded from a file whose ``ETag`` or
+    ``Last-Modified`` header we recorded, a conditional request is made
+    first and the dataset is only retrieved again if the file changed.
+
+    Time series whose spec has an ``updater`` (see
+    `qeds.data.registry.DatasetSpec`) are updated incrementally: only the
+    periods after the last one saved, plus a window of recent periods
+    that may have been revised, are downloaded and merged into the saved
+    copy.
+
+    Otherwise the dataset is retrieved, but the file on your computer is
+    only rewritten when the checksum of the downloaded content differs.
+
+    Parameters
+    ----------
+    name : string
+        The name of the dataset
+
+    force : bool, optional(default=False)
+        Skip the conditional request and incremental update, and always
+        retrieve the whole dataset
+
+    Returns
+    -------
+    retrieved : bool
+        Whether the dataset was retrieved again
+
+    """
+    source = _get_metadata(name).get("source")
+    if not force and source:
+        from .download import unchanged
+
+        if unchanged(source):
+            LOGGER.debug("{} is unchanged upstream".format(name))
+            _get_store().update(name, dict(retrieved=time.time()))
+            return False
+
+    spec = get_spec(name)
+    updater = get_updater(spec)
+    if not force and updater is not None and os.path.exists(_saved_path(name)):
+        with _dataset_lock(name):
+            _update(name, spec, updater)
+        return True
+
+    retrieve(name)
+    return True
+
+
+def _update(name, spec, updater):
+    """
+    Merge the rows returned by the ``updater`` of dataset ``name`` into
+    the copy saved on your computer
+    """
+    # with an infinite max_age a stale copy isn't refreshed while we read it
+    _check_codec(_file_format(name))
+    old = load(name, max_age=float("inf"))
+    new, metadata = updater(old)
+    LOGGER.debug("Updating {} with {} rows".format(name, new.shape[0]))
+
+    # the new rows replace saved rows with the same index
+    df = pd.concat([old[~old.index.isin(new.index)], new]).sort_index()
+    _save(name, spec, df, metadata, {})
+
+
+def _refresh_stale(name, fn, max_age):
+    with _dataset_lock(name):
+        # another thread may have refreshed it while we waited
+        if not _is_stale(name, fn, max_age):
+            return
+        try:
+            refresh(name)
+        except Exception as e:
+            msg = "Could not refresh dataset {} ({}). Using the copy saved "
+            msg += "on your computer"
+            warnings.warn(msg.format(name, e))
+
+
+def _write(df, fn, extension, kwargs):
+    codec = _codec()
+    if extension in _STREAM_FORMATS and codec is not None:
+        import pyarrow as pa
+
+        with pa.output_stream(fn, compression=codec) as f:
+            _write_uncompressed(df, f, extension, kwargs)
+        return
+
+    _check_codec(extension)
+    if codec is not None:
+        kwargs = dict({"compression": codec}, **kwargs)
+    _write_uncompressed(df, fn, extension, kwargs)
+
+
+def _write_partitioned(df, path, extension, kwargs, partition_by):
+    def _write_part(part, directory):
+        fn = os.path.join(directory, _file_name("part", extension))
+        _write(part, fn, extension, kwargs)
+
+    write_partitioned(df, path, partition_by, _write_part)
+
+
+def _format_aware(df, date_format):
+    """
+    Return ``df`` with its timezone aware columns and index levels written
+    out as text in ``date_format`` followed by their UTC offset.
+    ``to_csv`` would apply ``date_format`` to them without the offset
+    """
+    def _aware(values):
+        return isinstance(values.dtype, pd.DatetimeTZDtype)
+
+    def _text(values):
+        return pd.Index(values).strftime(date_format + "%z")
+
+    columns = [col for (col, values) in df.items() if _aware(values)]
+    levels = [
+        df.index.get_level_values(i) for i in range(df.index.nlevels)
+    ]
+    if len(columns) == 0 and not any(_aware(v) for v in levels):
+        return df
 
+    df = df.copy(deep=False)
+    for col in columns:
+        df[col] = _text(df[col]).values
+    if any(_aware(v) for v in levels):
+        arrays = [_text(v) if _aware(v) else v for v in levels]
+        df.index = pd.MultiIndex.from_arrays(arrays, names=df.index.names) \
+            if len(arrays) > 1 else pd.Index(arrays[0], name=df.index.name)
     return df
 
 
+def _write_uncompressed(df, fn, extension, kwargs):
+    if extension == "csv":
+        date_format = kwargs.get("date_format", _CSV_DATE_FORMAT)
+        _format_aware(df, date_format).to_csv(fn, **kwargs)
+    elif extension == "pkl":
+        df.to_pickle(fn, **kwargs)
+    elif extension == "feather":
+        _to_feather(_reset_named_index(df), fn, **kwargs)
+    elif extension == "parquet":
+        kwargs = dict({"row_group_size": _PARQUET_ROW_GROUP_SIZE}, **kwargs)
+        _reset_named_index(df).to_parquet(fn, index=False, **kwargs)
+    else:
+        raise ValueError("Unknown extension type {}".format(extension))
+
+
 def available(name=None):
     """
     Return a list of available datasets
@@ -144,12 +1184,153 @@ def available(name=None):
         A list of available
     """
 
-    from .retrievers import __dict__ as retrievers
-
-    skip = len("_retrieve_")
-    out = (k[skip:] for k in retrievers.keys() if k.startswith("_retrieve_"))
+    # the registry knows every dataset without importing the retrievers
+    out = (spec.name for spec in specs())
 
     if name is None:
         return list(out)
 
     return list(k for k in out if name in k)
+
+
+def _file_format(name):
+    # the format the dataset's spec asks for, if any
+    try:
+        file_format = get_spec(name).file_format
+    except ValueError:
+        file_format = None
+    return file_format or options["options.file_format"]
+
+
+def _dependencies(name):
+    try:
+        return list(get_spec(name).dependencies)
+    except ValueError:
+        # reported as a failure by `retrieve`
+        return []
+
+
+def _size(name):
+    try:
+        return get_spec(name).size or 0
+    except ValueError:
+        return 0
+
+
+def _prefetch_one(name, force, settings):
+    # runs in a worker thread or process. Settings are passed explicitly
+    # so that worker processes use the same (possibly unsaved) options
+    for (key, val) in settings.items():
+        section, option = key.split(".")
+        if options[key] != val:
+            options.set_config(section, option, val, write=False)
+
+    start = time.perf_counter()
+    try:
+        fn = _saved_path(name)
+        with _dataset_lock(name):
+            if not force and os.path.exists(fn):
+                return "cached", time.perf_counter() - start, None
+            retrieve(name)
+        return "retrieved", time.perf_counter() - start, None
+    except Exception as e:
+        return "failed", time.perf_counter() - start, repr(e)
+
+
+def prefetch(names=None, max_workers=4, processes=False, force=False):
+    """
+    Retrieve several datasets concurrently so later calls to `load` read
+    them from disk
+
+    Datasets that others depend on (such as ``state_fips``) are retrieved
+    once, before the datasets that need them. A failure is recorded in the
+    report and does not stop the other datasets; datasets whose
+    dependencies failed are skipped.
+
+    Parameters
+    ----------
+    names : list(string), optional(default=None)
+        The datasets to retrieve. If None, all datasets returned by
+        `available` are retrieved
+
+    max_workers : int, optional(default=4)
+        The maximum number of datasets retrieved at the same time
+
+    processes : bool, optional(default=False)
+        Use a pool of processes instead of a pool of threads. This helps
+        when retrievers spend most of their time parsing rather than
+        downloading
+
+    force : bool, optional(default=False)
+        Retrieve datasets even if they are already saved on your computer
+
+    Returns
+    -------
+    report : pandas.DataFrame
+        One row per dataset (including dependencies) with its ``status``
+        ("retrieved", "cached", "failed" or "skipped"), the wall clock
+        ``seconds`` it took and the ``error`` message for failures
+
+    """
+    if names is None:
+        names = available()
+
+    # order datasets in waves such that all dependencies of a dataset are
+    # in an earlier wave
+    levels = {}
+
+    def _level(name, seen=()):
+        if name in seen:
+            msg = "Circular dependency between datasets {}"
+            raise ValueError(msg.format(list(seen) + [name]))
+        if name not in levels:
+            deps = _dependencies(name)
+            seen = seen + (name,)
+            levels[name] = 1 + max([_level(d, seen) for d in deps] + [-1])
+        return levels[name]
+
+    for name in names:
+        _level(name)
+
+    settings = {
+        key: options[key]
+        for key in ["PATHS.data", "options.file_format", "options.compression"]
+    }
+    if processes:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers)
+    else:
+        pool = concurrent.futures.ThreadPoolExecutor(max_workers)
+
+    results = {}
+    with pool:
+        for level in range(max(levels.values(), default=-1) + 1):
+            futures = {}
+            # largest datasets first, so they don't hold up the wave
+            wave = [k for (k, v) in levels.items() if v == level]
+            for name in sorted(wave, key=_size, reverse=True):
+                failed = [
+                    d for d in _dependencies(name)
+                    if results[d][0] in ["failed", "skipped"]
+                ]
+                if len(failed) > 0:
+                    msg = "dependencies {} were not retrieved".format(failed)
+                    results[name] = ("skipped", 0.0, msg)
+                    continue
+                futures[name] = pool.submit(
+                    _prefetch_one, name, force, settings
+                )
+
+            for (name, future) in futures.items():
+                results[name] = future.result()
+                LOGGER.debug("prefetch {}: {} in {:.2f}s".format(
+                    name, results[name][0], results[name][1]
+                ))
+
+    order = [k for k in levels if k in names] + [
+        k for k in levels if k not in names
+    ]
+    report = pd.DataFrame.from_dict(
+        results, orient="index", columns=["status", "seconds", "error"]
+    ).loc[order]
+    report.index.name = "name"
+    return report
@@ -0,0 +1,146 @@
+"""
+Storage for the metadata (index, date columns, ...) that the retrievers
+record alongside each cached dataset.
+
+Metadata lives in a small SQLite database with one row per dataset, so
+looking up a single dataset doesn't parse the others and concurrent
+processes retrieving different datasets can't overwrite each other's
+entries. Older versions of qeds kept everything in a ``metadata.json``
+file; its entries are imported the first time the database is opened.
+"""
+import json
+import os
+import time
+
+from .config import setup_logger
+from .sqlite import SQLiteStore, per_directory, transaction
+
+LOGGER = setup_logger(__name__)
+
+
+class MetadataStore(SQLiteStore):
+    """
+    Per-dataset metadata backed by SQLite
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database. It is created if it doesn't exist
+
+    legacy : string, optional(default=None)
+        Path to a ``metadata.json`` file written by older versions of qeds.
+        If the file exists, its entries are added to the database (entries
+        already in the database win) and the file is renamed to
+        ``metadata.json.migrated``
+    """
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS metadata (
+        name TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        updated REAL NOT NULL
+    )
+    """
+
+    def __init__(self, path, legacy=None):
+        super(MetadataStore, self).__init__(path)
+        self.legacy = legacy
+        self._migrated = False
+
+    def _opened(self, conn):
+        if not self._migrated:
+            self._migrate(conn)
+            self._migrated = True
+
+    def _migrate(self, conn):
+        if self.legacy is None or not os.path.isfile(self.legacy):
+            return
+
+        with open(self.legacy, "r") as f:
+            try:
+                legacy = json.load(f)
+            except ValueError:
+                LOGGER.warning("Could not parse {}".format(self.legacy))
+                return
+
+        LOGGER.debug("Migrating metadata from {}".format(self.legacy))
+        now = time.time()
+        with transaction(conn):
+            conn.executemany(
+                "INSERT OR IGNORE INTO metadata VALUES (?, ?, ?)",
+                [(k, json.dumps(v), now) for (k, v) in legacy.items()]
+            )
+
+        try:
+            os.replace(self.legacy, self.legacy + ".migrated")
+        except OSError:
+            # another process migrated the file before us
+            pass
+
+    def get(self, name):
+        """
+        Return the metadata for ``name`` or an empty dict if there is none
+        """
+        row = self._connect().execute(
+            "SELECT value FROM metadata WHERE name = ?", (name,)
+        ).fetchone()
+        return dict() if row is None else json.loads(row[0])
+
+    def set(self, name, metadata):
+        """
+        Replace the metadata for ``name``
+        """
+        self._connect().execute(
+            "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+            (name, json.dumps(metadata), time.time())
+        )
+        return metadata
+
+    def update(self, name, changes):
+        """
+        Atomically merge the dict ``changes`` into the metadata for
+        ``name`` and return the result
+        """
+        conn = self._connect()
+        with transaction(conn):
+            row = conn.execute(
+                "SELECT value FROM metadata WHERE name = ?", (name,)
+            ).fetchone()
+            metadata = dict() if row is None else json.loads(row[0])
+            metadata.update(changes)
+            conn.execute(
+                "INSERT OR REPLACE INTO metadata VALUES (?, ?, ?)",
+                (name, json.dumps(metadata), time.time())
+            )
+        return metadata
+
+    def delete(self, name):
+        """
+        Remove the metadata for ``name``
+        """
+        self._connect().execute(
+            "DELETE FROM metadata WHERE name = ?", (name,)
+        )
+
+    def names(self):
+        """
+        Return a list of the datasets that have metadata
+        """
+        rows = self._connect().execute(
+            "SELECT name FROM metadata ORDER BY name"
+        )
+        return [r[0] for r in rows]
+
+
+_get_store = per_directory(
+    lambda data_dir: MetadataStore(
+        os.path.join(data_dir, "metadata.sqlite"),
+        legacy=os.path.join(data_dir, "metadata.json")
+    )
+)
+
+
+def get_store(data_dir):
+    """
+    Return the `MetadataStore` for the cache directory ``data_dir``
+    """
+    return _get_store(data_dir)
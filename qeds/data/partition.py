@@ -0,0 +1,200 @@
+"""
+Hive-style partitioned layout for saved datasets.
+
+A retriever can declare ``partition_by`` in its metadata: a list whose
+items are either the name of a column (or index level), or a ``(column,
+freq)`` pair that partitions a datetime column by the pandas period
+``freq`` (``"M"`` for months, ``"D"`` for days, ...). The dataset is then
+saved as a directory with one sub-directory per partition, e.g.::
+
+    state_industry_employment.parquet/
+        state=Alabama/part.parquet
+        state=Alaska/part.parquet
+        ...
+
+The partition columns are kept in the files, so each file is a regular
+saved dataset. The directory names are only used by `partition_files` to
+skip partitions that can't satisfy the filters passed to `load`.
+"""
+import os
+from urllib.parse import quote, unquote
+
+import pandas as pd
+from pandas.api.types import pandas_dtype
+
+# name used by Hive for the partition of missing values
+_NULL_PARTITION = "__HIVE_DEFAULT_PARTITION__"
+
+# Whether some value in the closed interval [lo, hi] can satisfy each of
+# the filter operators of `load`
+_RANGE_OPS = {
+    "=": lambda lo, hi, val: lo <= val <= hi,
+    "==": lambda lo, hi, val: lo <= val <= hi,
+    "!=": lambda lo, hi, val: not (lo == hi == val),
+    "<": lambda lo, hi, val: lo < val,
+    "<=": lambda lo, hi, val: lo <= val,
+    ">": lambda lo, hi, val: hi > val,
+    ">=": lambda lo, hi, val: hi >= val,
+    "in": lambda lo, hi, val: any(lo <= v <= hi for v in val),
+    "not in": lambda lo, hi, val: not (lo == hi and lo in val),
+}
+
+
+def partition_key(item):
+    """
+    Split an item of ``partition_by`` into its column and period frequency
+    (None for plain columns)
+    """
+    if isinstance(item, str):
+        return item, None
+    column, freq = item
+    return column, freq
+
+
+def _key_values(df, column, freq):
+    if column in df.columns:
+        values = df[column]
+    else:
+        values = pd.Series(df.index.get_level_values(column))
+    if freq is not None:
+        values = values.dt.to_period(freq)
+    return values.values
+
+
+def _format_value(value):
+    if pd.isna(value):
+        return _NULL_PARTITION
+    return quote(str(value), safe="")
+
+
+def write_partitioned(df, path, partition_by, write):
+    """
+    Save ``df`` in the directory ``path``, with one sub-directory for each
+    combination of the values of the ``partition_by`` keys. ``write`` is
+    called with each partition and the directory it should be saved in
+    """
+    os.makedirs(path)
+    if df.shape[0] == 0:
+        write(df, path)
+        return
+
+    keys = [partition_key(item) for item in partition_by]
+    arrays = [_key_values(df, column, freq) for (column, freq) in keys]
+    # a single grouper gives scalar keys on every version of pandas
+    grouper = arrays[0] if len(arrays) == 1 else arrays
+    groups = df.groupby(grouper, sort=True, dropna=False, observed=True)
+    for (values, part) in groups:
+        if not isinstance(values, tuple):
+            values = (values,)
+        subdir = os.path.join(path, *[
+            "{}={}".format(column, _format_value(value))
+            for ((column, _), value) in zip(keys, values)
+        ])
+        os.makedirs(subdir)
+        write(part, subdir)
+
+
+def _parse_value(raw, column, schema):
+    # Convert the text of a directory name back to a value of the column,
+    # or leave it as text if we can't be sure of the conversion
+    if column in schema.get("categories", {}):
+        for cat in schema["categories"][column]["categories"]:
+            if str(cat) == raw:
+                return cat
+        return raw
+
+    dtype = schema.get("dtypes", {}).get(column)
+    if dtype is None:
+        return raw
+    if dtype.startswith("datetime64"):
+        return pd.Timestamp(raw)
+    try:
+        kind = pandas_dtype(dtype).kind
+    except TypeError:
+        return raw
+    if kind in "iuf":
+        return pd.to_numeric(raw)
+    if kind == "b":
+        return raw == "True"
+    return raw
+
+
+def _bounds(relpath, meta):
+    """
+    The smallest and largest value of each partition column in the
+    partition stored under ``relpath``, or None for missing values
+    """
+    freqs = dict(partition_key(item) for item in meta.get("partition_by", []))
+    schema = meta.get("schema", {})
+    out = {}
+    if relpath == os.curdir:
+        return out
+
+    for part in relpath.split(os.sep):
+        column, _, raw = part.partition("=")
+        if raw == _NULL_PARTITION:
+            out[column] = None
+        elif freqs.get(column) is not None:
+            period = pd.Period(unquote(raw), freq=freqs[column])
+            out[column] = (period.start_time, period.end_time)
+        else:
+            value = _parse_value(unquote(raw), column, schema)
+            out[column] = (value, value)
+
+    return out
+
+
+def _coerce(value):
+    """
+    Convert the strings in the value of a filter on a date column to
+    timestamps, the way pandas compares them
+    """
+    if isinstance(value, str):
+        return pd.Timestamp(value)
+    if isinstance(value, (list, tuple, set)):
+        return [pd.Timestamp(v) if isinstance(v, str) else v for v in value]
+    return value
+
+
+def _may_satisfy(bounds, column, op, value):
+    if column not in bounds:
+        return True
+    if bounds[column] is None:
+        # missing values only satisfy negations
+        return op in ["!=", "not in"]
+
+    lo, hi = bounds[column]
+    if isinstance(lo, pd.Timestamp):
+        value = _coerce(value)
+    try:
+        return bool(_RANGE_OPS[op](lo, hi, value))
+    except (TypeError, ValueError):
+        # can't compare, so the partition has to be read
+        return True
+
+
+def _may_match(bounds, filters):
+    if not filters:
+        return True
+    return any(
+        all(_may_satisfy(bounds, *clause) for clause in conjunction)
+        for conjunction in filters
+    )
+
+
+def partition_files(path, meta, filters=None):
+    """
+    List the files of the partitioned dataset saved in ``path`` that may
+    hold rows satisfying ``filters`` (in disjunctive normal form), in
+    partition order
+    """
+    out = []
+    for (root, dirs, files) in os.walk(path):
+        dirs.sort()
+        if len(files) == 0:
+            continue
+        bounds = _bounds(os.path.relpath(root, path), meta)
+        if _may_match(bounds, filters):
+            out.extend(os.path.join(root, fn) for fn in sorted(files))
+
+    return out
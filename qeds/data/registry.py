@@ -0,0 +1,275 @@
+"""
+The datasets that `qeds.data.load` knows how to retrieve.
+
+Each dataset is described by a `DatasetSpec`. Retrievers are usually
+given as ``"module:function"`` strings that are only imported when the
+dataset is retrieved, so listing the datasets (see
+`qeds.data.available`) doesn't import any of the network clients.
+
+Other packages can add their own datasets with `register`, or by
+declaring an entry point in the ``qeds.datasets`` group, e.g. in
+``setup.py``::
+
+    entry_points={
+        "qeds.datasets": ["mydata = mypackage.datasets:SPECS"]
+    }
+
+where ``SPECS`` is a `DatasetSpec`, a list of them, or a function
+returning either. Entry points are loaded the first time the registry is
+used.
+"""
+import collections
+import importlib
+import threading
+import warnings
+
+ENTRY_POINT_GROUP = "qeds.datasets"
+
+DatasetSpec = collections.namedtuple(
+    "DatasetSpec", [
+        "name", "retriever", "description", "source", "file_format",
+        "partition_by", "dependencies", "size", "updater"
+    ],
+    defaults=["", None, None, None, (), None, None]
+)
+DatasetSpec.__doc__ = """
+Description of a dataset
+
+Parameters
+----------
+name : string
+    The name used to `load` the dataset
+
+retriever : callable or string
+    Function called without arguments that returns the dataset and its
+    metadata (see `qeds.data.retrieve`), or the ``"module:function"``
+    path to import it from
+
+description : string, optional(default="")
+    A short description of the dataset
+
+source : string, optional(default=None)
+    Where the data comes from (a url or the name of an API)
+
+file_format : string, optional(default=None)
+    Save the dataset in this format instead of the one set by the
+    ``options.file_format`` configuration option
+
+partition_by : list, optional(default=None)
+    Save the dataset in partitions (see `qeds.data.partition`)
+
+dependencies : list(string), optional(default=())
+    Datasets that the retriever loads. `qeds.data.prefetch` retrieves
+    them first
+
+size : int, optional(default=None)
+    Approximate number of rows. `qeds.data.prefetch` starts the largest
+    datasets first
+
+updater : callable or string, optional(default=None)
+    Function (or ``"module:function"`` path) used by `qeds.data.refresh`
+    to update a saved copy of the dataset without retrieving all of it.
+    It is called with the saved DataFrame and returns the new and revised
+    rows and the metadata, like the retriever. Rows of the saved copy
+    with the same index are replaced
+"""
+
+_BUILTIN = [
+    DatasetSpec(
+        "test", "qeds.data.retrievers:_retrieve_test",
+        "A small DataFrame for testing", size=3
+    ),
+    DatasetSpec(
+        "state_fips", "qeds.data.retrievers:_retrieve_state_fips",
+        "FIPS codes and abbreviations of the US states", size=50
+    ),
+    DatasetSpec(
+        "state_employment", "qeds.data.retrievers:_retrieve_state_employment",
+        "Monthly unemployment rate and labor force by state, from 2000",
+        source="BLS API", dependencies=["state_fips"], size=16000,
+        updater="qeds.data.retrievers:_update_state_employment"
+    ),
+    DatasetSpec(
+        "state_industry_employment",
+        "qeds.data.retrievers:_retrieve_state_industry_employment",
+        "Monthly employment by industry and state, from 2000",
+        source="BLS API", partition_by=["state"],
+        dependencies=["state_fips"], size=16000,
+        updater="qeds.data.retrievers:_update_state_industry_employment"
+    ),
+    DatasetSpec(
+        "goodreads_books", "qeds.data.retrievers:_retrieve_goodreads_books",
+        "Books of the goodbooks-10k dataset",
+        source="https://github.com/zygmuntz/goodbooks-10k", size=10000
+    ),
+    DatasetSpec(
+        "goodreads_ratings",
+        "qeds.data.retrievers:_retrieve_goodreads_ratings",
+        "Ratings of the goodbooks-10k dataset",
+        source="https://github.com/zygmuntz/goodbooks-10k", size=6000000
+    ),
+    DatasetSpec(
+        "goodreads_tags", "qeds.data.retrievers:_retrieve_goodreads_tags",
+        "Tags of the goodbooks-10k dataset",
+        source="https://github.com/zygmuntz/goodbooks-10k", size=34000
+    ),
+    DatasetSpec(
+        "goodreads_book_tags",
+        "qeds.data.retrievers:_retrieve_goodreads_book_tags",
+        "Tags of each book of the goodbooks-10k dataset",
+        source="https://github.com/zygmuntz/goodbooks-10k", size=1000000
+    ),
+    # each airline dataset covers one month, so it is saved in a partition
+    # per day
+    DatasetSpec(
+        "airline_performance_dec16",
+        "qeds.data.retrievers:_retrieve_airline_performance_dec16",
+        "On-time performance of US domestic flights in December 2016",
+        source="https://datascience.quantecon.org/assets/data/",
+        partition_by=[("Date", "D")], size=460000
+    ),
+    DatasetSpec(
+        "airline_performance_nov16",
+        "qeds.data.retrievers:_retrieve_airline_performance_nov16",
+        "On-time performance of US domestic flights in November 2016",
+        source="https://datascience.quantecon.org/assets/data/",
+        partition_by=[("Date", "D")], size=450000
+    ),
+    DatasetSpec(
+        "airline_carrier_codes",
+        "qeds.data.retrievers:_retrieve_airline_carrier_codes",
+        "Names of the airline carrier codes",
+        source="https://datascience.quantecon.org/assets/data/", size=1500
+    ),
+    DatasetSpec(
+        "nyc_employee", "qeds.data.retrievers:_retrieve_nyc_employee",
+        "Payroll of New York City employees",
+        source="NYC Open Data (Socrata)", size=3000000
+    ),
+    DatasetSpec(
+        "chipotle_raw", "qeds.data.retrievers:_retrieve_chipotle_raw",
+        "Chipotle orders collected by The Upshot",
+        source="https://github.com/TheUpshot/chipotle", size=4600
+    ),
+]
+
+_REGISTRY = collections.OrderedDict((spec.name, spec) for spec in _BUILTIN)
+_LOCK = threading.RLock()
+_entry_points_loaded = False
+
+
+def register(spec, replace=False):
+    """
+    Add a dataset to the registry
+
+    Parameters
+    ----------
+    spec : DatasetSpec
+        The description of the dataset
+
+    replace : bool, optional(default=False)
+        Replace a dataset that is already registered under the same name.
+        If False, registering an existing name raises a ValueError
+
+    """
+    if not isinstance(spec, DatasetSpec):
+        msg = "Expected a DatasetSpec, got {}".format(type(spec).__name__)
+        raise ValueError(msg)
+    with _LOCK:
+        _load_entry_points()
+        if spec.name in _REGISTRY and not replace:
+            msg = "A dataset named {} is already registered"
+            raise ValueError(msg.format(spec.name))
+        _REGISTRY[spec.name] = spec
+
+
+def unregister(name):
+    """
+    Remove the dataset ``name`` from the registry
+    """
+    with _LOCK:
+        _REGISTRY.pop(name, None)
+
+
+def get_spec(name):
+    """
+    Return the `DatasetSpec` of the dataset ``name``
+    """
+    with _LOCK:
+        _load_entry_points()
+        spec = _REGISTRY.get(name)
+    if spec is None:
+        msg = "The dataset name that you gave ({}) is not on your computer \n"
+        msg += "and can not be retrieved by our library. Are you sure \n"
+        msg += "you typed it correctly?"
+        raise ValueError(msg.format(name))
+    return spec
+
+
+def specs():
+    """
+    Return the `DatasetSpec` of every registered dataset
+    """
+    with _LOCK:
+        _load_entry_points()
+        return list(_REGISTRY.values())
+
+
+def get_retriever(spec):
+    """
+    Return the retriever function of ``spec``, importing it if needed
+    """
+    return _import(spec.retriever)
+
+
+def get_updater(spec):
+    """
+    Return the updater function of ``spec`` (None if it has none),
+    importing it if needed
+    """
+    if spec.updater is None:
+        return None
+    return _import(spec.updater)
+
+
+def _import(func):
+    if callable(func):
+        return func
+    module, _, name = func.partition(":")
+    return getattr(importlib.import_module(module), name)
+
+
+def _entry_points():
+    try:
+        from importlib.metadata import entry_points
+    except ImportError:
+        # python 3.7
+        try:
+            from importlib_metadata import entry_points
+        except ImportError:
+            return []
+
+    eps = entry_points()
+    if hasattr(eps, "select"):
+        return list(eps.select(group=ENTRY_POINT_GROUP))
+    return list(eps.get(ENTRY_POINT_GROUP, []))
+
+
+def _load_entry_points():
+    global _entry_points_loaded
+    if _entry_points_loaded:
+        return
+    _entry_points_loaded = True
+
+    for ep in _entry_points():
+        try:
+            found = ep.load()
+            if callable(found) and not isinstance(found, DatasetSpec):
+                found = found()
+            if isinstance(found, DatasetSpec):
+                found = [found]
+            for spec in found:
+                register(spec)
+        except Exception as e:
+            msg = "Could not register the datasets of entry point {} ({})"
+            warnings.warn(msg.format(ep.name, e))
@@ -1,16 +1,37 @@
 """
-This file is used to retrieve various datasets.
+This file is used to retrieve various datasets. The datasets themselves
+(and the retriever of each) are listed in `qeds.data.registry`.
 
 """
 import io
+import os
+import zipfile
 import pandas as pd
-from .config import setup_logger
+from .config import options, setup_logger
+from .download import download, fetch
 from .loader import load
 from .bls import BLSData
 from .socrata import SocrataData
+from .util import _ensure_dir, hhmm_to_datetime
 
 LOGGER = setup_logger(__name__)
 
+# `load` refreshes datasets whose metadata has a ``ttl`` (in seconds) once
+# the saved copy is older than that. Datasets without one never expire
+_DAY = 24 * 60 * 60
+
+
+def _read_remote_csv(url, **kwargs):
+    """
+    Download the csv file at ``url`` and read it with ``pd.read_csv``
+
+    Returns the DataFrame and the ``source`` of the file (see
+    `qeds.data.download.fetch`), which should be stored in the metadata
+    of the dataset so it can be refreshed with a conditional request
+    """
+    content, source = fetch(url)
+    return pd.read_csv(io.BytesIO(content), **kwargs), source
+
 
 def _retrieve_test():
     df = pd.DataFrame({"A": [0, 1, 2],
@@ -76,20 +97,50 @@ def _retrieve_state_fips():
     return pd.read_csv(src), dict(index=[])
 
 
-def _retrieve_state_employment():
+# First year of the BLS datasets. They run through the current year,
+# whether they are retrieved in full or updated
+_BLS_START_YEAR = 2000
+
+
+def _bls_years():
+    """
+    The years to request from BLS to retrieve a whole BLS dataset
+    """
+    return _BLS_START_YEAR, pd.Timestamp.now().year
+
+
+def _bls_update_years(df):
+    """
+    The years to request from BLS to update the saved BLS dataset ``df``:
+    from the year of the month ``bls.revision_window`` months before the
+    last one saved, through the current year
+    """
+    last = df.index.get_level_values("Date").max()
+    months = int(options["bls.revision_window"])
+    start = last - pd.DateOffset(months=months)
+    return start.year, _bls_years()[1]
+
+
+def _state_employment(startyear, endyear):
     b = BLSData()
 
     states = load("state_fips")
 
-    dfs = []
-    for state_fips in states["FIPS"]:
+    def get_codes(state_fips):
         code = str(state_fips).zfill(2)
-        codes = [
+        return [
             "LASST{}0000000000003".format(code),
             "LASST{}0000000000006".format(code),
         ]
-        LOGGER.debug("Querying bls for {}".format(codes))
-        df = b.get(codes, startyear=2000, endyear=2017, nice_names=False)
+
+    # one request per 50 series instead of one per state
+    groups = b.get_groups(
+        {fips: get_codes(fips) for fips in states["FIPS"]},
+        startyear=startyear, endyear=endyear
+    )
+
+    dfs = []
+    for (state_fips, df) in groups.items():
         df["state"] = states.loc[states.FIPS == state_fips, "Name"].iloc[0]
         df.loc[df["variable"].str[-1] == "3", "variable"] = "UnemploymentRate"
         df.loc[df["variable"].str[-1] == "6", "variable"] = "LaborForce"
@@ -102,7 +153,15 @@ def _retrieve_state_employment():
     return pd.concat(dfs).sort_index(), meta
 
 
-def _retrieve_state_industry_employment():
+def _retrieve_state_employment():
+    return _state_employment(*_bls_years())
+
+
+def _update_state_employment(df):
+    return _state_employment(*_bls_update_years(df))
+
+
+def _state_industry_employment(startyear, endyear):
     b = BLSData()
 
     states = load("state_fips")
@@ -125,15 +184,15 @@ def _retrieve_state_industry_employment():
             "SMS{}000009000000001".format(code): "government"
         }
 
+    # one request per 50 series instead of one per state
+    groups = b.get_groups(
+        {fips: list(get_codes(fips)) for fips in states["FIPS"]},
+        startyear=startyear, endyear=endyear
+    )
+
     dfs = []
-    for state_fips in states["FIPS"]:
-        codes = get_codes(state_fips)
-        LOGGER.debug("Querying bls for {}".format(codes))
-        df = b.get(
-            list(codes.keys()), startyear=2000, endyear=2017,
-            nice_names=False
-        )
-        df.replace({"variable": codes}, inplace=True)
+    for (state_fips, df) in groups.items():
+        df.replace({"variable": get_codes(state_fips)}, inplace=True)
         df["state"] = states.loc[states.FIPS == state_fips, "Name"].iloc[0]
         df.set_index(["Date", "state", "variable"], inplace=True)
         df = df.unstack(level="variable")["value"]
@@ -144,53 +203,65 @@ def _retrieve_state_industry_employment():
     return pd.concat(dfs).sort_index(), meta
 
 
+def _retrieve_state_industry_employment():
+    return _state_industry_employment(*_bls_years())
+
+
+def _update_state_industry_employment(df):
+    return _state_industry_employment(*_bls_update_years(df))
+
+
 def _retrieve_goodreads_books():
     LOGGER.debug("Downloading goodreads books.csv from github")
     url = "https://raw.githubusercontent.com/zygmuntz/goodbooks-10k/"
     url += "c8a6e0a9a3b620c3f89301b0b3dc2a6653972294/books.csv"
-    return pd.read_csv(url), dict(index=[])
+    df, source = _read_remote_csv(url)
+    return df, dict(index=[], source=source)
 
 
 def _retrieve_goodreads_ratings():
     LOGGER.debug("Downloading goodreads ratings.csv from github")
     url = "https://raw.githubusercontent.com/zygmuntz/goodbooks-10k/"
     url += "c8a6e0a9a3b620c3f89301b0b3dc2a6653972294/ratings.csv"
-    return pd.read_csv(url), dict(index=[])
+    df, source = _read_remote_csv(url)
+    return df, dict(index=[], source=source)
 
 
 def _retrieve_goodreads_tags():
     LOGGER.debug("Downloading goodreads tags.csv from github")
     url = "https://raw.githubusercontent.com/zygmuntz/goodbooks-10k/"
     url += "c8a6e0a9a3b620c3f89301b0b3dc2a6653972294/tags.csv"
-    return pd.read_csv(url), dict(index=[])
+    df, source = _read_remote_csv(url)
+    return df, dict(index=[], source=source)
 
 
 def _retrieve_goodreads_book_tags():
     LOGGER.debug("Downloading goodreads book_tags.csv from github")
     url = "https://raw.githubusercontent.com/zygmuntz/goodbooks-10k/"
     url += "c8a6e0a9a3b620c3f89301b0b3dc2a6653972294/book_tags.csv"
-    return pd.read_csv(url), dict(index=[])
+    df, source = _read_remote_csv(url)
+    return df, dict(index=[], source=source)
 
 
-def _get_airline_data(url):
-    LOGGER.debug("Downloading airline data from {}".format(url))
-    df = pd.read_csv(url)
+def _iter_zipped_csv(fn, chunksize, **kwargs):
+    # decompress and parse the first file of the archive a chunk at a time
+    with zipfile.ZipFile(fn) as zf:
+        with zf.open(zf.namelist()[0]) as f:
+            for chunk in pd.read_csv(f, chunksize=chunksize, **kwargs):
+                yield chunk
+
+
+def _clean_airline_data(df):
     df["Date"] = pd.to_datetime(df["FlightDate"])
     df.drop("FlightDate", axis=1, inplace=True)
     bad_cols = list(filter(lambda x: x.startswith("Unnamed"), list(df)))
     df.drop(bad_cols, axis=1, inplace=True)
 
-    for col in ["CRSDepTime", "CRSArrTime"]:
-        LOGGER.debug("Converting column {} to datetime".format(col))
-        dt_string = df["Date"].astype(str) + df[col].astype(str).str.zfill(4)
-        df[col] = pd.to_datetime(dt_string, format="%Y-%m-%d%H%M")
-
-    for col in ["DepTime", "ArrTime"]:
+    # scheduled and actual times are HHMM numbers (actual ones are missing
+    # for cancelled flights)
+    for col in ["CRSDepTime", "CRSArrTime", "DepTime", "ArrTime"]:
         LOGGER.debug("Converting column {} to datetime".format(col))
-        t_string = df[col].astype(str).str[:-2].str.zfill(4)
-        dt_string = df["Date"].astype(str) + t_string
-        df[col] = pd.to_datetime(dt_string, format="%Y-%m-%d%H%M",
-                                 errors="coerce")
+        df[col] = hhmm_to_datetime(df["Date"], df[col])
 
     # If the delay value is a NaN then no delay for any of these reasons...
     # Replace with 0.0
@@ -199,10 +270,35 @@ def _get_airline_data(url):
         "LateAircraftDelay"
     ]
     df.loc[:, delays] = df.loc[:, delays].fillna(0.0)
+    return df
+
+
+# rows of the airline csv files parsed and cleaned at a time
+_AIRLINE_CHUNKSIZE = 100000
+
+
+def _get_airline_data(url):
+    LOGGER.debug("Downloading airline data from {}".format(url))
+    # The archive is streamed to disk (resuming if the connection drops)
+    # and parsed in chunks, so neither the archive nor the raw text of the
+    # csv file is ever held in memory as a whole
+    download_dir = os.path.join(options["PATHS.data"], "downloads")
+    _ensure_dir(download_dir)
+    fn = os.path.join(download_dir, url.rsplit("/", 1)[-1])
+    source = download(url, fn)
+    try:
+        dfs = [
+            _clean_airline_data(chunk)
+            for chunk in _iter_zipped_csv(fn, _AIRLINE_CHUNKSIZE)
+        ]
+    finally:
+        os.remove(fn)
+    df = pd.concat(dfs, ignore_index=True)
 
     meta = dict(
         index=[],
-        parse_dates=["Date", "CRSDepTime", "CRSArrTime", "DepTime", "ArrTime"]
+        parse_dates=["Date", "CRSDepTime", "CRSArrTime", "DepTime", "ArrTime"],
+        source=source
     )
 
     return df, meta
@@ -222,7 +318,9 @@ def _retrieve_airline_performance_nov16():
 
 def _retrieve_airline_carrier_codes():
     url = "https://datascience.quantecon.org/assets/data/Carrier_Codes.csv"
-    return pd.read_csv(url).set_index("Code"), dict(index=["Code"])
+    df, source = _read_remote_csv(url)
+    meta = dict(index=["Code"], source=source, ttl=30 * _DAY)
+    return df.set_index("Code"), meta
 
 
 def _retrieve_nyc_employee():
@@ -256,10 +354,12 @@ def _retrieve_nyc_employee():
                           .str.upper()  # Capitalize
                           .replace(pd.np.nan, ""))
 
-    return df, dict(index=[], parse_dates=["agency_start_date"])
+    meta = dict(index=[], parse_dates=["agency_start_date"], ttl=30 * _DAY)
+    return df, meta
 
 
 def _retrieve_chipotle_raw():
     url = "https://raw.githubusercontent.com/TheUpshot/"
     url += "chipotle/master/orders.tsv"
-    return pd.read_csv(url, sep="\t"), dict(index=[])
+    df, source = _read_remote_csv(url, sep="\t")
+    return df, dict(index=[], source=source)
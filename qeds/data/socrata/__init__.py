@@ -1,3 +1,10 @@
-from .core import SocrataData
-
 __all__ = ["SocrataData"]
+
+
+def __getattr__(name):
+    # The client (and with it requests) is only imported once it is used
+    if name in __all__:
+        from . import core
+        return getattr(core, name)
+    msg = "module {!r} has no attribute {!r}"
+    raise AttributeError(msg.format(__name__, name))
@@ -0,0 +1,129 @@
+"""
+Plumbing shared by the small SQLite databases that qeds keeps: the
+dataset metadata (`qeds.data.metadata`) and, for the BLS client, the
+response cache, series catalog and request quota.
+
+Connections are opened once per thread, process and database file, so
+objects that keep different tables in the same file share them.
+"""
+import os
+import sqlite3
+import threading
+
+from .util import _ensure_dir, iter_chunks
+
+# seconds to wait for another process to release its lock on a database
+_TIMEOUT = 60
+
+# sqlite limits the number of parameters of a statement
+_PARAMS_PER_QUERY = 500
+
+_LOCAL = threading.local()
+
+
+def connect(path):
+    """
+    Return this thread's connection to the SQLite database at ``path``,
+    opening it (and creating the database) the first time
+    """
+    # sqlite connections can't be shared across threads or forked
+    # processes, so keep one per thread and per process
+    if getattr(_LOCAL, "pid", None) != os.getpid():
+        _LOCAL.conns = {}
+        _LOCAL.pid = os.getpid()
+
+    conn = _LOCAL.conns.get(path)
+    if conn is not None and not os.path.exists(path):
+        # the database was removed, e.g. with its data directory
+        conn.close()
+        conn = None
+    if conn is None:
+        conn = sqlite3.connect(path, timeout=_TIMEOUT, isolation_level=None)
+        _LOCAL.conns[path] = conn
+    return conn
+
+
+class transaction(object):
+    """
+    Run a block of statements in a single ``BEGIN IMMEDIATE`` transaction
+    """
+    def __init__(self, conn):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        if exc_type is None:
+            self.conn.execute("COMMIT")
+        else:
+            self.conn.execute("ROLLBACK")
+
+
+class SQLiteStore(object):
+    """
+    Base class of the objects that keep their data in a SQLite database
+
+    Subclasses set ``_SCHEMA`` to the statement creating their table,
+    which runs the first time each connection is used by the object, and
+    may override `_opened` to do more at that point
+
+    Parameters
+    ----------
+    path : string
+        Path to the SQLite database. It is created if it doesn't exist
+    """
+    _SCHEMA = None
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connect(self):
+        conn = connect(self.path)
+        if getattr(self._local, "conn", None) is not conn:
+            if self._SCHEMA is not None:
+                conn.execute(self._SCHEMA)
+            self._opened(conn)
+            self._local.conn = conn
+        return conn
+
+    def _opened(self, conn):
+        pass
+
+    def _select_in(self, query, values, params=()):
+        """
+        Yield the rows of ``query`` for every chunk of ``values``. The
+        ``{}`` in ``query`` is replaced by the placeholders of a chunk,
+        which follow the other ``params``
+        """
+        conn = self._connect()
+        for chunk in iter_chunks(list(values), _PARAMS_PER_QUERY):
+            rows = conn.execute(
+                query.format(", ".join("?" * len(chunk))),
+                list(params) + chunk
+            )
+            for row in rows:
+                yield row
+
+
+def per_directory(build):
+    """
+    Return a function that maps a directory to the object
+    ``build(directory)``, creating the directory and the object the first
+    time and returning the same object afterwards
+    """
+    objects = {}
+    lock = threading.Lock()
+
+    def get(directory):
+        with lock:
+            obj = objects.get(directory)
+            if obj is None:
+                _ensure_dir(directory)
+                obj = build(directory)
+                objects[directory] = obj
+        return obj
+
+    return get
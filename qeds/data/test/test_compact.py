@@ -0,0 +1,99 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import qeds
+from qeds.data import options, registry
+from qeds.data.compact import compact
+from qeds.data.registry import DatasetSpec
+from test_loader import _TempDataDir
+
+
+def _frame():
+    idx = pd.MultiIndex.from_product(
+        [pd.date_range("2017-01-01", periods=4, freq="MS"),
+         ["Alabama", "New York", "Ohio"]],
+        names=["Date", "state"]
+    )
+    df = pd.DataFrame({
+        "count": np.arange(12) * 1000,
+        "value": np.arange(12) / 4,
+        "ratio": np.arange(12) / 3,
+        "title": ["title {}".format(i) for i in range(12)],
+        "kind": ["a", "b"] * 6,
+    }, index=idx)
+    return df, dict(index=["Date", "state"])
+
+
+class TestCompact(unittest.TestCase):
+
+    def test_dtypes(self):
+        df, _ = _frame()
+        df["mixed"] = [1, "a"] * 6
+        have = compact(df)
+        self.assertEqual(str(have["count"].dtype), "int16")
+        self.assertEqual(str(have["value"].dtype), "float32")
+        # thirds can't be represented exactly in float32
+        self.assertEqual(str(have["ratio"].dtype), "float64")
+        self.assertEqual(have["title"].dtype, pd.StringDtype("pyarrow"))
+        self.assertEqual(str(have["kind"].dtype), "category")
+        self.assertEqual(str(have["mixed"].dtype), "object")
+        self.assertEqual(
+            str(have.index.get_level_values("state").dtype), "category"
+        )
+        self.assertEqual(list(have.columns), list(df.columns))
+        self.assertTrue(
+            have.memory_usage(deep=True).sum() <
+            df.memory_usage(deep=True).sum()
+        )
+
+    def test_values(self):
+        df, _ = _frame()
+        have = compact(df).reset_index()
+        want = df.reset_index()
+        for col in want.columns:
+            self.assertEqual(have[col].tolist(), want[col].tolist(), col)
+
+
+class TestCompactLoad(_TempDataDir):
+    config = {"options.compact": "True"}
+
+    def setUp(self):
+        super(TestCompactLoad, self).setUp()
+        registry.register(DatasetSpec("cmp", _frame, partition_by=["state"]))
+
+    def tearDown(self):
+        registry.unregister("cmp")
+        super(TestCompactLoad, self).tearDown()
+
+    def test_roundtrip(self):
+        for fmt in ["csv", "pkl", "feather", "parquet"]:
+            options.set_config("options", "file_format", fmt, write=False)
+            want = qeds.data.retrieve("cmp")
+            self.assertEqual(str(want["kind"].dtype), "category", fmt)
+            pd.testing.assert_frame_equal(qeds.data.load("cmp"), want)
+
+            have = pd.concat(qeds.data.load("cmp", chunksize=5))
+            pd.testing.assert_frame_equal(have.sort_index(), want)
+
+    def test_report(self):
+        qeds.data.retrieve("cmp")
+        report = qeds.data.memory_report(["cmp", "test"])
+        self.assertEqual(list(report.index), ["cmp"])
+        self.assertGreater(report.loc["cmp", "ratio"], 1)
+
+    def test_load_uncompacted(self):
+        options.set_config("options", "compact", "False", write=False)
+        qeds.data.retrieve("cmp")
+        self.assertEqual(
+            str(qeds.data.load("cmp")["kind"].dtype), "object"
+        )
+
+        options.set_config("options", "compact", "True", write=False)
+        self.assertEqual(
+            str(qeds.data.load("cmp")["kind"].dtype), "category"
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,289 @@
+import functools
+import hashlib
+import http.server
+import io
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+import warnings
+import zipfile
+import pandas as pd
+import qeds
+from qeds.data import download, retrievers
+
+from qeds.data import options
+from qeds.data.registry import DatasetSpec, register, unregister
+from test_loader import _TempDataDir
+
+
+class _QuietHandler(http.server.SimpleHTTPRequestHandler):
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(_TempDataDir):
+    """
+    Serve a temporary directory over http and register a dataset,
+    ``dl_remote``, that is read from a csv file in it
+    """
+
+    def setUp(self):
+        super(_Server, self).setUp()
+        self.root = tempfile.mkdtemp()
+        self.write("A,B\n1,2\n3,4\n")
+
+        handler = functools.partial(_QuietHandler, directory=self.root)
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), handler
+        )
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/remote.csv".format(
+            self.server.server_port
+        )
+
+        self.calls = calls = []
+
+        def _remote():
+            calls.append("dl_remote")
+            df, source = retrievers._read_remote_csv(self.url)
+            return df, dict(index=[], source=source, ttl=self.ttl)
+
+        self.ttl = None
+        register(DatasetSpec("dl_remote", _remote))
+
+    def tearDown(self):
+        unregister("dl_remote")
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.root)
+        super(_Server, self).tearDown()
+
+    def write(self, content, mtime=None):
+        fn = os.path.join(self.root, "remote.csv")
+        with open(fn, "w") as f:
+            f.write(content)
+        if mtime is not None:
+            os.utime(fn, (mtime, mtime))
+
+
+class TestRefresh(_Server):
+
+    def test_source(self):
+        qeds.data.retrieve("dl_remote")
+        source = qeds.data.loader._get_metadata("dl_remote")["source"]
+        self.assertEqual(source["url"], self.url)
+        self.assertIsNotNone(source["last_modified"])
+        self.assertEqual(len(source["sha256"]), 64)
+
+    def test_unchanged(self):
+        qeds.data.load("dl_remote")
+        self.assertFalse(qeds.data.refresh("dl_remote"))
+        self.assertEqual(self.calls, ["dl_remote"])
+
+    def test_changed(self):
+        qeds.data.load("dl_remote")
+        self.write("A,B\n5,6\n", mtime=time.time() + 10)
+        self.assertTrue(qeds.data.refresh("dl_remote"))
+        self.assertEqual(self.calls, ["dl_remote", "dl_remote"])
+        self.assertEqual(qeds.data.load("dl_remote")["A"].tolist(), [5])
+
+    def test_same_checksum_keeps_file(self):
+        qeds.data.load("dl_remote")
+        fn = qeds.data.loader._cache_path("dl_remote", self.file_format)
+        before = os.stat(fn).st_mtime_ns
+        self.assertTrue(qeds.data.refresh("dl_remote", force=True))
+        self.assertEqual(os.stat(fn).st_mtime_ns, before)
+
+
+class TestMaxAge(_Server):
+
+    def test_no_ttl_never_expires(self):
+        qeds.data.load("dl_remote")
+        self.write("A,B\n5,6\n", mtime=time.time() + 10)
+        self.assertEqual(qeds.data.load("dl_remote")["A"].tolist(), [1, 3])
+        self.assertEqual(self.calls, ["dl_remote"])
+
+    def test_ttl(self):
+        self.ttl = 0
+        qeds.data.load("dl_remote")
+        self.write("A,B\n5,6\n", mtime=time.time() + 10)
+        self.assertEqual(qeds.data.load("dl_remote")["A"].tolist(), [5])
+        self.assertEqual(self.calls, ["dl_remote", "dl_remote"])
+
+    def test_max_age(self):
+        qeds.data.load("dl_remote")
+        qeds.data.load("dl_remote", max_age=3600)
+        self.assertEqual(self.calls, ["dl_remote"])
+
+        # stale, but unchanged upstream, so no new download
+        qeds.data.load("dl_remote", max_age=0)
+        self.assertEqual(self.calls, ["dl_remote"])
+
+    def test_failed_refresh_uses_saved_copy(self):
+        qeds.data.load("dl_remote")
+        os.remove(os.path.join(self.root, "remote.csv"))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter("always")
+            df = qeds.data.load("dl_remote", max_age=0)
+        self.assertEqual(df["A"].tolist(), [1, 3])
+        self.assertEqual(len(w), 1)
+
+
+class _RangeHandler(http.server.BaseHTTPRequestHandler):
+    """
+    Serve ``server.content`` with support for ``Range`` and ``If-Range``.
+    If ``server.cut`` is set, the next response is cut off after that
+    many bytes of the body
+    """
+
+    def log_message(self, *args):
+        pass
+
+    def do_GET(self):
+        server = self.server
+        server.requests.append(dict(self.headers))
+        body = server.content
+        etag = '"{}"'.format(hashlib.md5(body).hexdigest())
+
+        start = 0
+        if "Range" in self.headers:
+            if self.headers.get("If-Range", etag) == etag:
+                start = int(self.headers["Range"][6:].split("-")[0])
+        if start > 0:
+            self.send_response(206)
+            self.send_header("Content-Range", "bytes {}-{}/{}".format(
+                start, len(body) - 1, len(body)
+            ))
+        else:
+            self.send_response(200)
+        self.send_header("ETag", etag)
+        self.send_header("Content-Length", str(len(body) - start))
+        self.end_headers()
+
+        data = body[start:]
+        if server.cut is not None:
+            data, server.cut = data[:server.cut], None
+            self.close_connection = True
+        self.wfile.write(data)
+
+
+class _RangeServer(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.fn = os.path.join(self.dir, "file.zip")
+        self.server = http.server.ThreadingHTTPServer(
+            ("127.0.0.1", 0), _RangeHandler
+        )
+        self.server.content = os.urandom(100000)
+        self.server.cut = None
+        self.server.requests = []
+        threading.Thread(target=self.server.serve_forever, daemon=True).start()
+        self.url = "http://127.0.0.1:{}/file.zip".format(
+            self.server.server_port
+        )
+        self._wait, download._RETRY_WAIT = download._RETRY_WAIT, 0
+
+    def tearDown(self):
+        download._RETRY_WAIT = self._wait
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dir)
+
+    def _read(self):
+        with open(self.fn, "rb") as f:
+            return f.read()
+
+
+class TestDownload(_RangeServer):
+
+    def test_download(self):
+        source = download.download(self.url, self.fn, chunk_size=1000)
+        self.assertEqual(self._read(), self.server.content)
+        self.assertEqual(
+            source["sha256"], hashlib.sha256(self.server.content).hexdigest()
+        )
+        self.assertEqual(os.listdir(self.dir), ["file.zip"])
+
+    def test_resume(self):
+        self.server.cut = 30000
+        download.download(self.url, self.fn, chunk_size=1000)
+        self.assertEqual(self._read(), self.server.content)
+
+        self.assertEqual(len(self.server.requests), 2)
+        self.assertNotIn("Range", self.server.requests[0])
+        self.assertEqual(self.server.requests[1]["Range"], "bytes=30000-")
+
+    def test_resume_later_call(self):
+        self.server.cut = 30000
+        with self.assertRaises(Exception):
+            download.download(self.url, self.fn, retries=0, chunk_size=1000)
+        self.assertFalse(os.path.exists(self.fn))
+
+        download.download(self.url, self.fn)
+        self.assertEqual(self._read(), self.server.content)
+        self.assertEqual(self.server.requests[1]["Range"], "bytes=30000-")
+
+    def test_changed_while_interrupted(self):
+        self.server.cut = 30000
+        with self.assertRaises(Exception):
+            download.download(self.url, self.fn, retries=0)
+
+        # If-Range doesn't match, so the whole new file is sent
+        self.server.content = os.urandom(50000)
+        download.download(self.url, self.fn)
+        self.assertEqual(self._read(), self.server.content)
+
+    def test_checksum(self):
+        with self.assertRaises(IOError):
+            download.download(self.url, self.fn, sha256="0" * 64)
+        self.assertEqual(os.listdir(self.dir), [])
+
+        sha256 = hashlib.sha256(self.server.content).hexdigest()
+        download.download(self.url, self.fn, sha256=sha256)
+        self.assertEqual(self._read(), self.server.content)
+
+
+class TestAirline(_RangeServer):
+
+    def setUp(self):
+        super(TestAirline, self).setUp()
+        self.csv = "\n".join([
+            "FlightDate,CRSDepTime,DepTime,CRSArrTime,ArrTime,"
+            "WeatherDelay,CarrierDelay,NASDelay,SecurityDelay,"
+            "LateAircraftDelay,Unnamed: 11",
+            "2016-12-01,0905,0910.0,1130,1200.0,,15.0,,,,",
+            "2016-12-01,1500,,1700,,,,,,,",
+            "2016-12-02,0700,0655.0,0900,0851.0,1.0,,,,,",
+        ]) + "\n"
+        buf = io.BytesIO()
+        with zipfile.ZipFile(buf, "w", zipfile.ZIP_DEFLATED) as zf:
+            zf.writestr("flights.csv", self.csv)
+        self.server.content = buf.getvalue()
+
+        self._old = options["PATHS.data"], retrievers._AIRLINE_CHUNKSIZE
+        options.set_config("PATHS", "data", self.dir, write=False)
+        retrievers._AIRLINE_CHUNKSIZE = 2
+
+    def tearDown(self):
+        options.set_config("PATHS", "data", self._old[0], write=False)
+        retrievers._AIRLINE_CHUNKSIZE = self._old[1]
+        super(TestAirline, self).tearDown()
+
+    def test_chunked(self):
+        self.server.cut = 100
+        have, meta = retrievers._get_airline_data(self.url)
+
+        want = pd.read_csv(io.StringIO(self.csv))
+        want = retrievers._clean_airline_data(want)
+        pd.testing.assert_frame_equal(have, want)
+        self.assertEqual(meta["source"]["url"], self.url)
+        self.assertEqual(os.listdir(os.path.join(self.dir, "downloads")), [])
+
+
+if __name__ == '__main__':
+    unittest.main()
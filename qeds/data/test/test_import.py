@@ -0,0 +1,26 @@
+import subprocess
+import sys
+import unittest
+
+_CHECK = """
+import sys
+import qeds
+heavy = ["requests", "qeds.data.retrievers", "qeds.data.bls.core",
+         "qeds.data.socrata.core", "qeds.data.uscensus.core", "qeds.themes",
+         "matplotlib"]
+loaded = [m for m in heavy if m in sys.modules]
+assert not loaded, loaded
+assert "test" in qeds.data.available()
+loaded = [m for m in heavy if m in sys.modules]
+assert not loaded, loaded
+assert qeds.data.BLSData.__name__ == "BLSData"
+assert "qeds.data.bls.core" in sys.modules
+"""
+
+
+class TestImport(unittest.TestCase):
+
+    def test_import_is_lazy(self):
+        # run in a fresh interpreter so other tests can't have imported
+        # the clients already
+        subprocess.check_call([sys.executable, "-c", _CHECK])
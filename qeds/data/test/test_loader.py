@@ -1,6 +1,10 @@
+import os
+import shutil
+import tempfile
 import unittest
 import qeds
 import pandas as pd
+from qeds.data import options
 
 
 class TestAllLoaders(unittest.TestCase):
@@ -10,3 +14,530 @@ class TestAllLoaders(unittest.TestCase):
             if ds != "nyc_employee":
                 print("Trying", ds)
                 self.assertIsInstance(qeds.data.load(ds), pd.DataFrame)
+
+
+class _TempDataDir(unittest.TestCase):
+    """
+    Point ``PATHS.data`` at a temporary directory for the duration of each
+    test, without touching the user's config file
+    """
+    file_format = "csv"
+    config = {}
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        config = dict(self.config)
+        config["PATHS.data"] = self.dir
+        config["options.file_format"] = self.file_format
+        config.setdefault("options.compression", "none")
+
+        self._old = {key: options[key] for key in config}
+        for (key, val) in config.items():
+            section, name = key.split(".")
+            options.set_config(section, name, val, write=False)
+
+    def tearDown(self):
+        for (key, val) in self._old.items():
+            section, name = key.split(".")
+            options.set_config(section, name, val, write=False)
+        shutil.rmtree(self.dir)
+
+
+class TestParquet(_TempDataDir):
+    file_format = "parquet"
+
+    def test_roundtrip(self):
+        want = qeds.data.retrieve("test")
+        have = qeds.data.load("test")
+        self.assertTrue(want.equals(have))
+
+    def test_columns(self):
+        have = qeds.data.load("test", columns=["C", "A"])
+        self.assertEqual(list(have.columns), ["C", "A"])
+        self.assertEqual(have.shape, (3, 2))
+
+    def test_filters(self):
+        have = qeds.data.load("test", filters=[("A", ">=", 1)])
+        self.assertEqual(have["A"].tolist(), [1, 2])
+
+        have = qeds.data.load(
+            "test", columns=["B"], filters=[[("A", "=", 0)], [("C", "=", 8)]]
+        )
+        self.assertEqual(list(have.columns), ["B"])
+        self.assertEqual(have["B"].tolist(), [3, 5])
+
+
+class TestFilterCSV(_TempDataDir):
+
+    def test_filters(self):
+        have = qeds.data.load(
+            "test", columns=["B"], filters=[("A", "in", [0, 2])]
+        )
+        self.assertEqual(list(have.columns), ["B"])
+        self.assertEqual(have["B"].tolist(), [3, 5])
+
+    def test_bad_filter(self):
+        with self.assertRaises(ValueError):
+            qeds.data.load("test", filters=[("A", "~", 0)])
+
+
+class TestCache(_TempDataDir):
+    config = {"options.cache_size": "1000000"}
+
+    def setUp(self):
+        super(TestCache, self).setUp()
+        qeds.data.clear_cache()
+
+    def tearDown(self):
+        qeds.data.clear_cache()
+        super(TestCache, self).tearDown()
+
+    def test_hits_and_misses(self):
+        qeds.data.retrieve("test")
+        first = qeds.data.load("test")
+        second = qeds.data.load("test")
+        self.assertTrue(first.equals(second))
+
+        info = qeds.data.cache_info()
+        self.assertEqual((info.hits, info.misses), (1, 1))
+        self.assertGreater(info.currsize, 0)
+
+        # results can be modified without changing the cached copy
+        second.loc[0, "A"] = 100
+        self.assertEqual(qeds.data.load("test").loc[0, "A"], 0)
+
+    def test_retrieve_invalidates(self):
+        qeds.data.retrieve("test")
+        qeds.data.load("test")
+        qeds.data.retrieve("test")
+        self.assertEqual(qeds.data.cache_info().currsize, 0)
+
+    def test_lru_eviction(self):
+        from qeds.data.cache import DataFrameCache
+
+        df = pd.DataFrame({"A": range(100)})
+        size = df.memory_usage(index=True, deep=True).sum()
+        cache = DataFrameCache(maxsize=2 * size)
+        cache.put(("a",), df)
+        cache.put(("b",), df)
+        cache.get(("a",))
+        cache.put(("c",), df)
+        self.assertIn(("a",), cache)
+        self.assertNotIn(("b",), cache)
+        self.assertIn(("c",), cache)
+
+
+class TestMemoryMap(_TempDataDir):
+    file_format = "feather"
+
+    def test_memory_map(self):
+        want = qeds.data.load("test", memory_map=False)
+        have = qeds.data.load("test", memory_map=True)
+        self.assertTrue(want.equals(have))
+
+        have = qeds.data.load("test", columns=["B"], memory_map=True)
+        self.assertEqual(have["B"].tolist(), [3, 4, 5])
+
+
+class TestPrefetch(_TempDataDir):
+
+    def setUp(self):
+        super(TestPrefetch, self).setUp()
+        from qeds.data.registry import DatasetSpec, register
+
+        self.calls = calls = []
+
+        def _base():
+            calls.append("pf_base")
+            return pd.DataFrame({"A": [1, 2]}), dict(index=[])
+
+        def _child():
+            calls.append("pf_child")
+            base = qeds.data.load("pf_base")
+            return base * 2, dict(index=[])
+
+        def _broken():
+            raise RuntimeError("no network")
+
+        self.specs = [
+            DatasetSpec("pf_base", _base),
+            DatasetSpec("pf_child", _child, dependencies=["pf_base"]),
+            DatasetSpec("pf_other_child", _child, dependencies=["pf_base"]),
+            DatasetSpec("pf_broken", _broken),
+            DatasetSpec(
+                "pf_needs_broken", _child, dependencies=["pf_broken"]
+            ),
+        ]
+        for spec in self.specs:
+            register(spec)
+
+    def tearDown(self):
+        from qeds.data.registry import unregister
+
+        for spec in self.specs:
+            unregister(spec.name)
+        super(TestPrefetch, self).tearDown()
+
+    def test_prefetch(self):
+        names = ["pf_child", "pf_other_child", "pf_needs_broken"]
+        report = qeds.data.prefetch(names, max_workers=3)
+
+        self.assertEqual(self.calls.count("pf_base"), 1)
+        self.assertEqual(report.loc["pf_base", "status"], "retrieved")
+        self.assertEqual(report.loc["pf_child", "status"], "retrieved")
+        self.assertEqual(report.loc["pf_broken", "status"], "failed")
+        self.assertIn("no network", report.loc["pf_broken", "error"])
+        self.assertEqual(report.loc["pf_needs_broken", "status"], "skipped")
+        self.assertEqual(
+            qeds.data.load("pf_other_child")["A"].tolist(), [2, 4]
+        )
+
+        report = qeds.data.prefetch(["pf_child"])
+        self.assertEqual(report.loc["pf_child", "status"], "cached")
+
+
+class TestChunks(_TempDataDir):
+
+    def test_chunks(self):
+        want = qeds.data.load("test")
+        for fmt in ["csv", "pkl", "feather", "parquet"]:
+            options.set_config("options", "file_format", fmt, write=False)
+            qeds.data.retrieve("test")
+            chunks = list(qeds.data.load("test", chunksize=2))
+            self.assertEqual([c.shape[0] for c in chunks], [2, 1], fmt)
+            self.assertTrue(pd.concat(chunks).equals(want), fmt)
+
+            chunks = list(qeds.data.load(
+                "test", chunksize=2, columns=["C"], filters=[("A", "!=", 1)]
+            ))
+            have = pd.concat(chunks)
+            self.assertEqual(have["C"].tolist(), [6, 8], fmt)
+            self.assertEqual(list(have.columns), ["C"], fmt)
+
+
+class TestSchema(_TempDataDir):
+
+    def setUp(self):
+        super(TestSchema, self).setUp()
+        from qeds.data.registry import DatasetSpec, register
+
+        def _typed():
+            df = pd.DataFrame({
+                "Date": pd.to_datetime(["2017-01-01", "2017-02-01", None]),
+                "stamp": pd.to_datetime([
+                    "2017-01-01 10:30:00.5", "2017-01-02", "2017-01-03"
+                ]),
+                "state": pd.Categorical(["b", "a", "b"], ["b", "a"]),
+                "count": pd.array([1, None, 3], dtype="Int64"),
+                "flag": [True, False, True],
+                "code": ["01", "02", "10"],
+                "value": [1.5, 2.0, None],
+                "local": pd.to_datetime([
+                    "2017-01-01 09:00", "2017-07-01 23:30", None
+                ]).tz_localize("America/New_York"),
+                "wait": pd.to_timedelta([5, 10, None], unit="m"),
+            })
+            return df.set_index("Date"), dict(index=["Date"])
+
+        register(DatasetSpec("typed", _typed))
+
+    def tearDown(self):
+        from qeds.data.registry import unregister
+
+        unregister("typed")
+        super(TestSchema, self).tearDown()
+
+    def test_csv_roundtrip(self):
+        want = qeds.data.retrieve("typed")
+        have = qeds.data.load("typed")
+        pd.testing.assert_frame_equal(have, want)
+
+        # pandas options make load use pd.read_csv instead of pyarrow
+        have = qeds.data.load("typed", kwargs={"nrows": 3})
+        pd.testing.assert_frame_equal(have, want)
+
+        have = pd.concat(qeds.data.load("typed", chunksize=2))
+        pd.testing.assert_frame_equal(have, want)
+
+    def test_csv_timezone(self):
+        want = qeds.data.retrieve("typed")["local"]
+        # every read path keeps the wall time and offset of the values
+        for kwargs in [{}, {"kwargs": {"nrows": 3}}]:
+            have = qeds.data.load("typed", **kwargs)["local"]
+            pd.testing.assert_series_equal(have, want)
+        have = pd.concat(qeds.data.load("typed", chunksize=2))["local"]
+        pd.testing.assert_series_equal(have, want)
+        self.assertEqual(have.iloc[0].hour, 9)
+
+    def test_csv_timedelta(self):
+        want = qeds.data.retrieve("typed")["wait"]
+        for kwargs in [{}, {"kwargs": {"nrows": 3}}]:
+            have = qeds.data.load("typed", **kwargs)["wait"]
+            pd.testing.assert_series_equal(have, want)
+        have = pd.concat(qeds.data.load("typed", chunksize=2))["wait"]
+        pd.testing.assert_series_equal(have, want)
+        have = qeds.data.load("typed", columns=["wait"])["wait"]
+        pd.testing.assert_series_equal(have, want)
+
+
+class TestCompression(_TempDataDir):
+
+    def _set(self, **kwargs):
+        for (name, val) in kwargs.items():
+            options.set_config("options", name, val, write=False)
+
+    def test_roundtrip(self):
+        formats = {
+            "csv": ["gzip", "lz4", "zstd"],
+            "pkl": ["gzip", "lz4", "zstd"],
+            "feather": ["lz4", "zstd"],
+            "parquet": ["gzip", "lz4", "zstd"],
+        }
+        for (file_format, codecs) in formats.items():
+            for codec in codecs:
+                self._set(file_format=file_format, compression=codec)
+                want = qeds.data.retrieve("test")
+                have = qeds.data.load("test")
+                pd.testing.assert_frame_equal(have, want)
+
+                have = pd.concat(qeds.data.load("test", chunksize=2))
+                pd.testing.assert_frame_equal(have, want)
+
+    def test_file_name(self):
+        self._set(compression="zstd")
+        qeds.data.retrieve("test")
+        self.assertEqual(os.listdir(self.dir).count("test.csv.zst"), 1)
+
+        # the copy written with another codec is still used...
+        self._set(compression="gzip")
+        self.assertEqual(qeds.data.load("test").shape, (3, 3))
+        self.assertNotIn("test.csv.gz", os.listdir(self.dir))
+
+        # ...until the dataset is retrieved again
+        qeds.data.retrieve("test")
+        self.assertIn("test.csv.gz", os.listdir(self.dir))
+        self.assertNotIn("test.csv.zst", os.listdir(self.dir))
+
+    def test_stale_codec_change(self):
+        from qeds.data.registry import DatasetSpec, register, unregister
+
+        def _ttl():
+            return pd.DataFrame({"A": [0, 1], "B": [2, 3]}), dict(
+                index=[], ttl=0
+            )
+
+        register(DatasetSpec("ttl", _ttl))
+        try:
+            qeds.data.retrieve("ttl")
+            # refreshing the stale copy replaces it with a gzip one
+            self._set(compression="gzip")
+            have = qeds.data.load("ttl", columns=["A"])
+        finally:
+            unregister("ttl")
+        self.assertEqual(have["A"].tolist(), [0, 1])
+        self.assertEqual(os.listdir(self.dir).count("ttl.csv.gz"), 1)
+        self.assertNotIn("ttl.csv", os.listdir(self.dir))
+
+    def test_feather_batches(self):
+        from pyarrow import ipc
+        from qeds.data import loader
+
+        self._set(file_format="feather", compression="zstd")
+        old = loader._FEATHER_BATCH_SIZE
+        loader._FEATHER_BATCH_SIZE = 2
+        try:
+            want = qeds.data.retrieve("test")
+        finally:
+            loader._FEATHER_BATCH_SIZE = old
+
+        # compressed files are split so chunks are decompressed one by one
+        fn = os.path.join(self.dir, "test.feather")
+        with open(fn, "rb") as f:
+            self.assertEqual(ipc.open_file(f).num_record_batches, 2)
+        chunks = list(qeds.data.load("test", chunksize=1, columns=["A"]))
+        self.assertEqual(len(chunks), 3)
+        pd.testing.assert_frame_equal(pd.concat(chunks), want[["A"]])
+
+    def test_feather_gzip(self):
+        from qeds.data.registry import DatasetSpec, register, unregister
+
+        calls = []
+
+        def _counted():
+            calls.append(1)
+            return pd.DataFrame({"A": [0, 1]}), dict(index=[])
+
+        register(DatasetSpec("counted", _counted))
+        self._set(file_format="feather", compression="gzip")
+        try:
+            with self.assertRaises(ValueError):
+                qeds.data.retrieve("counted")
+        finally:
+            unregister("counted")
+        # rejected before anything was downloaded
+        self.assertEqual(calls, [])
+
+
+class TestPartition(_TempDataDir):
+
+    def setUp(self):
+        super(TestPartition, self).setUp()
+        from qeds.data.registry import DatasetSpec, register
+
+        def _by_state():
+            dates = pd.date_range("2017-01-01", periods=4, freq="MS")
+            idx = pd.MultiIndex.from_product(
+                [dates, ["Alabama", "New York", "Ohio"]],
+                names=["Date", "state"]
+            )
+            df = pd.DataFrame({"value": range(12)}, index=idx)
+            return df, dict(index=["Date", "state"])
+
+        def _by_month():
+            df = pd.DataFrame({
+                "Date": pd.date_range("2016-11-25", periods=10, freq="2D"),
+                "delay": [float(x) for x in range(10)],
+            })
+            return df, dict(index=[], partition_by=[("Date", "M")])
+
+        # partitions can be declared by the spec or by the metadata
+        register(DatasetSpec("by_state", _by_state, partition_by=["state"]))
+        register(DatasetSpec("by_month", _by_month))
+
+    def tearDown(self):
+        from qeds.data.registry import unregister
+
+        unregister("by_state")
+        unregister("by_month")
+        super(TestPartition, self).tearDown()
+
+    def _files(self, name, filters):
+        fn = qeds.data.loader._saved_path(name)
+        meta = qeds.data.loader._get_metadata(name)
+        filters = qeds.data.loader._normalize_filters(filters)
+        return qeds.data.partition.partition_files(fn, meta, filters)
+
+    def test_layout(self):
+        qeds.data.retrieve("by_state")
+        fn = qeds.data.loader._saved_path("by_state")
+        self.assertEqual(
+            sorted(os.listdir(fn)),
+            ["state=Alabama", "state=New%20York", "state=Ohio"]
+        )
+
+    def test_roundtrip(self):
+        for file_format in ["csv", "pkl", "feather", "parquet"]:
+            options.set_config("options", "file_format", file_format,
+                               write=False)
+            for name in ["by_state", "by_month"]:
+                want = qeds.data.retrieve(name)
+                have = qeds.data.load(name)
+                pd.testing.assert_frame_equal(have, want)
+
+                # chunks come partition by partition
+                have = pd.concat(qeds.data.load(name, chunksize=2))
+                pd.testing.assert_frame_equal(have.sort_index(), want)
+
+    def test_pruning(self):
+        qeds.data.retrieve("by_state")
+        self.assertEqual(len(self._files("by_state", None)), 3)
+        self.assertEqual(
+            len(self._files("by_state", [("state", "=", "Ohio")])), 1
+        )
+        self.assertEqual(
+            len(self._files("by_state", [("state", "in", ["Ohio", "Utah"])])),
+            1
+        )
+        self.assertEqual(
+            len(self._files("by_state", [("state", "!=", "Ohio")])), 2
+        )
+
+        qeds.data.retrieve("by_month")
+        self.assertEqual(len(self._files("by_month", None)), 2)
+        filters = [("Date", ">=", "2016-12-01")]
+        self.assertEqual(len(self._files("by_month", filters)), 1)
+
+        have = qeds.data.load("by_month", filters=filters)
+        self.assertEqual(have["delay"].tolist(), [3.0, 4.0, 5.0, 6.0, 7.0,
+                                                  8.0, 9.0])
+
+    def test_no_match(self):
+        have = qeds.data.load("by_state", filters=[("state", "=", "Utah")])
+        self.assertEqual(have.shape, (0, 1))
+        self.assertEqual(have.index.names, ["Date", "state"])
+
+
+class TestIncremental(_TempDataDir):
+    file_format = "parquet"
+    config = {"bls.revision_window": "2"}
+
+    def setUp(self):
+        super(TestIncremental, self).setUp()
+        from qeds.data.registry import DatasetSpec, register
+
+        self.seen = seen = []
+        # the values published upstream, by month
+        self.upstream = upstream = {
+            "2017-01-01": [1.0, 2.0], "2017-02-01": [3.0, 4.0]
+        }
+
+        def _frame(dates):
+            idx = pd.MultiIndex.from_product(
+                [pd.to_datetime(dates), ["a", "b"]], names=["Date", "state"]
+            )
+            value = [v for d in dates for v in upstream[d]]
+            df = pd.DataFrame({"value": value}, index=idx)
+            return df, dict(index=["Date", "state"])
+
+        def _full():
+            return _frame(sorted(upstream))
+
+        def _update(df):
+            last = df.index.get_level_values("Date").max()
+            seen.append(last)
+            start = (last - pd.DateOffset(months=1)).strftime("%Y-%m-%d")
+            return _frame([d for d in sorted(upstream) if d >= start])
+
+        register(DatasetSpec(
+            "inc", _full, partition_by=["state"], updater=_update
+        ))
+
+    def tearDown(self):
+        from qeds.data.registry import unregister
+
+        unregister("inc")
+        super(TestIncremental, self).tearDown()
+
+    def test_refresh(self):
+        qeds.data.retrieve("inc")
+        # February was revised and March is new
+        self.upstream["2017-02-01"] = [5.0, 6.0]
+        self.upstream["2017-03-01"] = [7.0, 8.0]
+        self.assertTrue(qeds.data.refresh("inc"))
+        self.assertEqual(self.seen, [pd.Timestamp("2017-02-01")])
+
+        have = qeds.data.load("inc")
+        self.assertEqual(have.shape, (6, 1))
+        self.assertTrue(have.index.is_monotonic_increasing)
+        self.assertEqual(
+            have["value"].tolist(), [1.0, 2.0, 5.0, 6.0, 7.0, 8.0]
+        )
+
+        # a forced refresh retrieves the whole dataset again, which
+        # covers the same months as the updated copy
+        self.assertTrue(qeds.data.refresh("inc", force=True))
+        self.assertEqual(len(self.seen), 1)
+        pd.testing.assert_frame_equal(qeds.data.load("inc"), have)
+
+    def test_update_years(self):
+        from qeds.data import retrievers
+
+        df, _ = qeds.data.registry.get_retriever(
+            qeds.data.registry.get_spec("inc")
+        )()
+        # two months before February 2017
+        start, end = retrievers._bls_update_years(df)
+        self.assertEqual(start, 2016)
+        self.assertEqual(end, pd.Timestamp.now().year)
+        # updates end where a full retrieval does
+        self.assertEqual(retrievers._bls_years(), (2000, end))
@@ -0,0 +1,65 @@
+import json
+import multiprocessing
+import os
+import shutil
+import tempfile
+import unittest
+
+from qeds.data.metadata import MetadataStore
+
+
+def _write_entries(path, worker, n):
+    store = MetadataStore(path)
+    for i in range(n):
+        store.set("ds_{}_{}".format(worker, i), dict(index=[], worker=worker))
+
+
+class TestMetadataStore(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "metadata.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_get_set(self):
+        store = MetadataStore(self.path)
+        self.assertEqual(store.get("missing"), dict())
+
+        meta = dict(index=["Date"], parse_dates=["Date"])
+        store.set("a", meta)
+        self.assertEqual(store.get("a"), meta)
+
+        store.set("a", dict(index=[]))
+        self.assertEqual(store.get("a"), dict(index=[]))
+        self.assertEqual(store.names(), ["a"])
+
+        store.delete("a")
+        self.assertEqual(store.names(), [])
+
+    def test_migrate_json(self):
+        legacy = os.path.join(self.dir, "metadata.json")
+        with open(legacy, "w") as f:
+            json.dump(dict(a=dict(index=["x"]), b=dict(index=[])), f)
+
+        store = MetadataStore(self.path, legacy=legacy)
+        self.assertEqual(store.get("a"), dict(index=["x"]))
+        self.assertEqual(store.names(), ["a", "b"])
+        self.assertFalse(os.path.exists(legacy))
+        self.assertTrue(os.path.exists(legacy + ".migrated"))
+
+    def test_concurrent_writers(self):
+        n_workers, n = 4, 25
+        procs = [
+            multiprocessing.Process(
+                target=_write_entries, args=(self.path, w, n)
+            )
+            for w in range(n_workers)
+        ]
+        for p in procs:
+            p.start()
+        for p in procs:
+            p.join()
+
+        self.assertEqual(len(MetadataStore(self.path).names()), n_workers * n)
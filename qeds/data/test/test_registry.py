@@ -0,0 +1,96 @@
+import unittest
+import warnings
+
+import pandas as pd
+import qeds
+from qeds.data import registry
+from qeds.data.registry import DatasetSpec
+from test_loader import _TempDataDir
+
+
+def _small():
+    return pd.DataFrame({"A": [1, 2]}), dict(index=[])
+
+
+class _EntryPoint(object):
+
+    def __init__(self, name, value):
+        self.name = name
+        self.value = value
+
+    def load(self):
+        if isinstance(self.value, Exception):
+            raise self.value
+        return self.value
+
+
+class TestRegistry(unittest.TestCase):
+
+    def tearDown(self):
+        registry.unregister("reg_small")
+
+    def test_builtin(self):
+        spec = registry.get_spec("state_employment")
+        self.assertEqual(spec.dependencies, ["state_fips"])
+        self.assertIn("state_employment", qeds.data.available())
+
+    def test_register(self):
+        registry.register(DatasetSpec("reg_small", _small))
+        spec = registry.get_spec("reg_small")
+        self.assertIs(registry.get_retriever(spec), _small)
+        with self.assertRaises(ValueError):
+            registry.register(DatasetSpec("reg_small", _small))
+        registry.register(
+            DatasetSpec("reg_small", _small, "replaced"), replace=True
+        )
+        spec = registry.get_spec("reg_small")
+        self.assertEqual(spec.description, "replaced")
+
+        registry.unregister("reg_small")
+        with self.assertRaises(ValueError):
+            registry.get_spec("reg_small")
+
+    def test_retriever_path(self):
+        spec = DatasetSpec("reg_small", "test_registry:_small")
+        self.assertIs(registry.get_retriever(spec), _small)
+
+    def test_entry_points(self):
+        old = registry._entry_points, registry._entry_points_loaded
+        eps = [
+            _EntryPoint("one", DatasetSpec("reg_small", _small)),
+            _EntryPoint("broken", ImportError("missing plugin")),
+        ]
+        registry._entry_points = lambda: eps
+        registry._entry_points_loaded = False
+        try:
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter("always")
+                names = [spec.name for spec in registry.specs()]
+            self.assertIn("reg_small", names)
+            self.assertEqual(len(w), 1)
+            self.assertIn("broken", str(w[0].message))
+        finally:
+            registry._entry_points, registry._entry_points_loaded = old
+
+
+class TestFileFormat(_TempDataDir):
+
+    def setUp(self):
+        super(TestFileFormat, self).setUp()
+        registry.register(
+            DatasetSpec("reg_small", _small, file_format="parquet")
+        )
+
+    def tearDown(self):
+        registry.unregister("reg_small")
+        super(TestFileFormat, self).tearDown()
+
+    def test_file_format(self):
+        qeds.data.retrieve("reg_small")
+        fn = qeds.data.loader._saved_path("reg_small")
+        self.assertTrue(fn.endswith("reg_small.parquet"))
+        self.assertEqual(qeds.data.load("reg_small")["A"].tolist(), [1, 2])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,75 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from qeds.data import sqlite
+
+
+class _Numbers(sqlite.SQLiteStore):
+    _SCHEMA = "CREATE TABLE IF NOT EXISTS numbers (n INTEGER PRIMARY KEY)"
+
+
+class TestSQLite(unittest.TestCase):
+
+    def setUp(self):
+        self.dir = tempfile.mkdtemp()
+        self.path = os.path.join(self.dir, "test.sqlite")
+
+    def tearDown(self):
+        shutil.rmtree(self.dir)
+
+    def test_connect(self):
+        # one connection per thread and database
+        conn = sqlite.connect(self.path)
+        self.assertIs(sqlite.connect(self.path), conn)
+        other = os.path.join(self.dir, "other.sqlite")
+        self.assertIsNot(sqlite.connect(other), conn)
+
+        found = []
+        thread = threading.Thread(
+            target=lambda: found.append(sqlite.connect(self.path))
+        )
+        thread.start()
+        thread.join()
+        self.assertIsNot(found[0], conn)
+
+        # reopened once the database is removed
+        os.remove(self.path)
+        self.assertIsNot(sqlite.connect(self.path), conn)
+
+    def test_store(self):
+        store = _Numbers(self.path)
+        conn = store._connect()
+        with sqlite.transaction(conn):
+            conn.executemany(
+                "INSERT INTO numbers VALUES (?)", [(n,) for n in range(1200)]
+            )
+        rows = store._select_in(
+            "SELECT n FROM numbers WHERE n > ? AND n IN ({})",
+            range(0, 1200, 2), [10]
+        )
+        self.assertEqual(sorted(n for (n,) in rows), list(range(12, 1200, 2)))
+
+        with self.assertRaises(ValueError):
+            with sqlite.transaction(conn):
+                conn.execute("DELETE FROM numbers")
+                raise ValueError()
+        self.assertEqual(
+            conn.execute("SELECT COUNT(*) FROM numbers").fetchone()[0], 1200
+        )
+
+    def test_per_directory(self):
+        get = sqlite.per_directory(
+            lambda d: _Numbers(os.path.join(d, "test.sqlite"))
+        )
+        sub = os.path.join(self.dir, "sub")
+        store = get(sub)
+        self.assertTrue(os.path.isdir(sub))
+        self.assertIs(get(sub), store)
+        self.assertIsNot(get(self.dir), store)
+
+
+if __name__ == '__main__':
+    unittest.main()
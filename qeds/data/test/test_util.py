@@ -0,0 +1,35 @@
+import unittest
+import numpy as np
+import pandas as pd
+from qeds.data.util import hhmm_to_datetime
+
+
+class TestHHMM(unittest.TestCase):
+
+    def setUp(self):
+        self.dates = pd.Series(
+            pd.to_datetime(["2016-12-31"] * 7), index=list("abcdefg")
+        )
+
+    def test_hhmm_to_datetime(self):
+        hhmm = [905, 2400, np.nan, 1260, 0, -5, 2401]
+        have = hhmm_to_datetime(self.dates, hhmm)
+        want = pd.Series(pd.to_datetime([
+            "2016-12-31 09:05", "2017-01-01 00:00", None, None,
+            "2016-12-31 00:00", None, None
+        ]), index=self.dates.index)
+        pd.testing.assert_series_equal(have, want)
+
+    def test_input_types(self):
+        want = hhmm_to_datetime(self.dates, [905, 1730] * 3 + [5])
+        floats = pd.Series([905.0, 1730.0] * 3 + [5.0], index=range(7))
+        strings = ["0905", "1730"] * 3 + ["0005"]
+        for hhmm in [floats, strings]:
+            pd.testing.assert_series_equal(
+                hhmm_to_datetime(self.dates, hhmm), want
+            )
+        self.assertEqual(want["g"], pd.Timestamp("2016-12-31 00:05"))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,13 @@
-import os
-from ..config import options
-from .core import CensusData, CountyBusinessPatterns, ZipBusinessPatterns
+from . import util
 
 __all__ = ["CensusData", "CountyBusinessPatterns", "ZipBusinessPatterns"]
+
+
+def __getattr__(name):
+    # The client (and with it requests and the census catalog) is only
+    # imported once one of its classes is used
+    if name in __all__:
+        from . import core
+        return getattr(core, name)
+    msg = "module {!r} has no attribute {!r}"
+    raise AttributeError(msg.format(__name__, name))
@@ -1,3 +1,4 @@
+import functools
 import json
 import os
 import textwrap
@@ -8,18 +9,20 @@ from requests.adapters import HTTPAdapter
 from ..config import options
 from ..util import _make_list, QueryError, _ensure_dir
 
-_ensure_dir(options["uscensus.data_dir"])
-
 
 def _update_data_file():
     url = "https://api.census.gov/data.json"
     r = requests.get(url)
+    _ensure_dir(options["uscensus.data_dir"])
     file_path = os.path.join(options["uscensus.data_dir"], "data.json")
     with open(file_path, "w") as f:
         f.write(json.dumps(r.json()))
 
 
+@functools.lru_cache(maxsize=None)
 def _load_metadata():
+    # The catalog is downloaded and parsed the first time a client needs
+    # it rather than when qeds is imported
     data_fn = os.path.join(options["uscensus.data_dir"], "data.json")
     if not os.path.isfile(data_fn):
         _update_data_file()
@@ -32,7 +35,14 @@ def _load_metadata():
     return _DATA_RAW, _DATA
 
 
-_DATA_RAW, _DATA = _load_metadata()
+def __getattr__(name):
+    # `_DATA_RAW` and `_DATA` used to be module level globals
+    if name == "_DATA_RAW":
+        return _load_metadata()[0]
+    if name == "_DATA":
+        return _load_metadata()[1]
+    msg = "module {!r} has no attribute {!r}"
+    raise AttributeError(msg.format(__name__, name))
 
 
 def query_predicate_string(name, arg):
@@ -280,6 +290,7 @@ class CountyBusinessPatterns(CensusData):
         self.year = year
         self.dataset = "{}/cbp".format(year)
 
+        _DATA = _load_metadata()[1]
         meta = _DATA[
             (_DATA["c_dataset"] == "cbp") &
             (_DATA["temporal"] == "{year}/{year}".format(year=self.year))
@@ -309,6 +320,7 @@ class ZipBusinessPatterns(CensusData):
         self.year = year
         self.dataset = "{}/zbp".format(year)
 
+        _DATA = _load_metadata()[1]
         meta = _DATA[
             (_DATA["c_dataset"] == "zbp") &
             (_DATA["temporal"] == "{year}/{year}".format(year=self.year))
@@ -1,7 +1,11 @@
 import collections
+import collections.abc
 import datetime
 import os
 import random
+import threading
+import time
+import numpy as np
 import pandas as pd
 
 
@@ -17,7 +21,7 @@ def _make_list(x):
     if isinstance(x, str):
         return [x]
 
-    if isinstance(x, collections.Sequence):
+    if isinstance(x, collections.abc.Sequence):
         return list(x)
 
     raise ValueError("Don't know how to make {} a list".format(x))
@@ -35,6 +39,65 @@ def iter_chunks(l, n):
         yield l[i:(i + n)]
 
 
+class RateLimiter(object):
+    """
+    Limit the rate of calls to an API: `wait` blocks until fewer than
+    ``calls`` calls have been made in the last ``period`` seconds. Can be
+    shared between threads
+    """
+
+    def __init__(self, calls, period):
+        self.calls = calls
+        self.period = period
+        self._times = collections.deque()
+        self._lock = threading.Lock()
+
+    def wait(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                while self._times and now - self._times[0] >= self.period:
+                    self._times.popleft()
+                if len(self._times) < self.calls:
+                    self._times.append(now)
+                    return
+                delay = self.period - (now - self._times[0])
+            time.sleep(delay)
+
+
+def hhmm_to_datetime(dates, hhmm):
+    """
+    Combine dates with times of day written as HHMM numbers, such as 905
+    for 9:05 am or 1730 for 5:30 pm
+
+    Parameters
+    ----------
+    dates : pandas.Series
+        The dates. Any time of day they carry is kept and the time in
+        ``hhmm`` is added to it
+
+    hhmm : pandas.Series or array_like
+        The times of day, as integers, floats or strings. 2400 is midnight
+        at the end of the day, so it becomes 00:00 of the next day.
+        Missing times and impossible ones (negative, more than 59 minutes
+        or later than 2400) become NaT
+
+    Returns
+    -------
+    out : pandas.Series
+        The dates and times, with the index of ``dates``
+
+    """
+    dates = pd.to_datetime(dates)
+    hhmm = pd.to_numeric(pd.Series(np.asarray(hhmm)), errors="coerce")
+    hours, minutes = np.divmod(hhmm.values, 100)
+    valid = (hhmm.values >= 0) & (minutes < 60) & (hhmm.values <= 2400)
+    offset = np.where(valid, hours * 60 + minutes, 0).astype("int64")
+    offset = offset.astype("timedelta64[m]").astype("timedelta64[ns]")
+    offset[~valid] = np.timedelta64("NaT")
+    return dates + pd.Series(offset, index=dates.index)
+
+
 def random_dates(startdate, enddate, N, format="%Y-%m-%d"):
     # dates
     start = pd.to_datetime(startdate).to_pydatetime()
@@ -64,7 +64,7 @@ setup(
         # Specify the Python versions you support here. In particular, ensure
         # that you indicate whether you support Python 2, Python 3 or both.
         "Programming Language :: Python :: 3 :: Only",
-        "Programming Language :: Python :: 3.6"
+        "Programming Language :: Python :: 3.7"
     ],
 
     # What does your project relate to?
@@ -74,6 +74,9 @@ setup(
     # simple. Or you can use find_packages().
     packages=find_packages(exclude=["contrib", "docs", "tests"]),
 
+    # module level __getattr__ (PEP 562) is used for lazy imports
+    python_requires=">=3.7",
+
     # List run-time dependencies here.  These will be installed by pip when
     # your project is installed. For an analysis of "install_requires" vs pip"s
     # requirements files see: